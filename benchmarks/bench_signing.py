@@ -0,0 +1,96 @@
+"""
+Microbenchmark voor request signing: oorspronkelijke per-request signer vs. WhesSigner.
+
+Controleert eerst dat beide byte-identieke headers opleveren (zelfde datum/nonce) en meet
+daarna de tijd per signature. Draait zonder Home Assistant:
+
+    python benchmarks/bench_signing.py [-n 20000]
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import hmac
+import importlib.util
+import pathlib
+import time
+from collections import OrderedDict
+from typing import Dict
+
+_SIGNING = pathlib.Path(__file__).resolve().parents[1] / "custom_components" / "whes__battery" / "signing.py"
+_spec = importlib.util.spec_from_file_location("whes_signing", _SIGNING)
+signing = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(signing)
+
+BASE = "https://open-api-eu.weiheng-tech.com/open-api"
+API_KEY = "bench-key"
+API_SECRET = "bench-secret-ÄÖ"
+
+CASES = [
+    ("POST", f"{BASE}/pangu/v1/projects/p1/devices/d{i}/ems/metrics", None) for i in range(8)
+] + [
+    ("POST", f"{BASE}/pangu/v1/projects/p1/ammeters/a{i}/metrics", None) for i in range(8)
+] + [
+    ("GET", f"{BASE}/pangu/v1/projects/p1/devices?page=1", {"size": 50, "tags": ["a b", "c"]}),
+    ("post", f"{BASE}/pangu/v1/projects/p 1/devices?x=1&x=2", {}),
+]
+
+
+def legacy_signed_headers(method: str, full_url: str, params: dict | None, date: str, nonce: str) -> Dict[str, str]:
+    """Letterlijke kopie van de oorspronkelijke WhesClient._signed_headers, met vaste datum/nonce."""
+    headers_ordered = OrderedDict(
+        [
+            ("x-wts-date", date),
+            ("x-wts-signature-method", "HMAC-SHA1"),
+            ("x-wts-signature-nonce", nonce),
+            ("x-wts-signature-version", "1.0"),
+        ]
+    )
+
+    string_to_sign = f"{method.upper()}\n" + "".join(f"{k}:{v}\n" for k, v in headers_ordered.items())
+    canonical = signing.canonical_path_and_query(full_url, params)
+    string_to_sign += canonical
+
+    digest = hmac.new(API_SECRET.encode("utf-8"), string_to_sign.encode("utf-8"), hashlib.sha1).digest()
+    signature = base64.standard_b64encode(digest).decode("utf-8")
+
+    headers_ordered["Authorization"] = f"wts {API_KEY}:{signature}"
+    return dict(headers_ordered)
+
+
+def check_identical(signer) -> None:
+    for i, (method, url, params) in enumerate(CASES):
+        date, nonce = 1_700_000_000_000 + i, 10_000_000 + i
+        old = legacy_signed_headers(method, url, params, str(date), str(nonce))
+        new = signer.sign(method, url, params, date_ms=date, nonce=nonce)
+        if list(old.items()) != list(new.items()):
+            raise SystemExit(f"MISMATCH voor {method} {url}:\n  oud={old}\n  nieuw={new}")
+    print(f"OK: {len(CASES)} cases byte-identiek")
+
+
+def bench(label: str, fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        method, url, params = CASES[i % 16]
+        fn(method, url, params)
+    dt = time.perf_counter() - t0
+    print(f"{label:<10} {n / dt:>12,.0f} sign/s   {dt / n * 1e6:7.2f} µs/sign")
+    return dt
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=20_000, help="aantal signatures per variant")
+    args = parser.parse_args()
+
+    signer = signing.WhesSigner(API_KEY, API_SECRET)
+    check_identical(signer)
+
+    t_old = bench("legacy", lambda m, u, p: legacy_signed_headers(m, u, p, "1700000000000", "12345678"), args.n)
+    t_new = bench("signer", lambda m, u, p: signer.sign(m, u, p, date_ms=1_700_000_000_000, nonce=12_345_678), args.n)
+    print(f"speedup    {t_old / t_new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Lokale stand-in voor de WHES Pangu metrics-endpoints, voor benchmarks en load-tests.
+
+Bedient ``POST {prefix}/pangu/v1/projects/{project}/devices/{device}/ems/metrics`` en
+``POST {prefix}/pangu/v1/projects/{project}/ammeters/{ammeter}/metrics``, controleert de
+HMAC-SHA1 signature en genereert realistische columns/rows/metadata payloads. Latency,
+foutpercentage en aantal rijen zijn instelbaar. ``GET .../devices`` en ``GET .../ammeters``
+geven een gepagineerde project-topologie.
+
+Standalone:
+
+    python benchmarks/mock_server.py --port 8765 --latency-ms 150 --error-rate 0.01
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import importlib.util
+import math
+import pathlib
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+_SIGNING = pathlib.Path(__file__).resolve().parents[1] / "custom_components" / "whes__battery" / "signing.py"
+_spec = importlib.util.spec_from_file_location("whes_signing", _SIGNING)
+signing = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(signing)
+
+PREFIX = "/open-api"
+
+_SAMPLE_UNITS = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
+
+
+def _sample_ms(sample_by: str) -> int:
+    for unit in ("ms", "s", "m", "h", "d"):
+        if sample_by.endswith(unit) and sample_by[: -len(unit)].isdigit():
+            return int(sample_by[: -len(unit)]) * _SAMPLE_UNITS[unit]
+    return 10_000
+
+
+@dataclass
+class MockConfig:
+    api_key: str = "bench-key"
+    api_secret: str = "bench-secret"
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    # Vast aantal rijen per response (None = volgens start/end/sample_by)
+    rows: Optional[int] = None
+    max_rows: int = 50_000
+    verify_signature: bool = True
+    # Vertraging waarmee samples beschikbaar komen; samples na (nu - ingest_lag_ms) bestaan nog niet
+    ingest_lag_ms: float = 0.0
+    # Topologie voor de discovery-endpoints
+    devices: List[str] = field(default_factory=lambda: ["d1"])
+    ammeters: List[str] = field(default_factory=lambda: ["a1"])
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    errors: int = 0
+    auth_failures: int = 0
+    bytes_sent: int = 0
+    by_path: Dict[str, int] = field(default_factory=dict)
+
+
+def _value(column: str, ts: int, seed: int) -> Any:
+    """Deterministische, realistisch ogende waarde per kolom en tijdstip."""
+    t = ts / 1000.0
+    phase = seed % 97
+    if column == "ems_soc":
+        return round(50 + 40 * math.sin(t / 7200 + phase), 1)
+    if column == "ems_soh":
+        return 98.5
+    if column == "ems_state":
+        return ("charging", "discharging", "idle")[int(t // 900 + phase) % 3]
+    if column == "ems_ac_frequency":
+        return round(50 + 0.02 * math.sin(t / 13 + phase), 3)
+    if "history" in column or column.endswith("_kwh"):
+        return round(1000 + phase * 10 + t / 3600 * 1.7, 3)
+    if column.startswith("ems_"):
+        return round(5 * math.sin(t / 600 + phase) + random.uniform(-0.2, 0.2), 3)
+    return round(2500 * math.sin(t / 900 + phase) + random.uniform(-80, 80), 1)
+
+
+def build_payload(columns: List[str], start: int, end: int, sample_by: str, *, rows: Optional[int] = None,
+                  max_rows: int = 50_000, seed: int = 0) -> Dict[str, Any]:
+    step = _sample_ms(sample_by)
+    first = start - start % step + (step if start % step else 0)
+    n = max(0, (end - first) // step + 1)
+    if rows is not None:
+        n = rows
+        first = end - end % step - (n - 1) * step
+    n = min(n, max_rows)
+    metadata = ["TIMESTAMP"] + ["VARCHAR" if c == "ems_state" else "DOUBLE" for c in columns]
+    out_rows = []
+    for i in range(n):
+        ts = first + i * step
+        out_rows.append([ts] + [_value(c, ts, seed) for c in columns])
+    return {"code": 0, "data": {"columns": ["ts"] + list(columns), "metadata": metadata, "rows": out_rows}}
+
+
+class MockWhesServer:
+    """aiohttp-app met WHES metrics-routes; gebruik ``async with MockWhesServer(cfg) as srv: srv.base_url``."""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config or MockConfig()
+        self.stats = MockStats()
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_post(PREFIX + "/pangu/v1/projects/{project}/devices/{target}/ems/metrics", self._metrics)
+        self.app.router.add_post(PREFIX + "/pangu/v1/projects/{project}/ammeters/{target}/metrics", self._metrics)
+        self.app.router.add_get(PREFIX + "/pangu/v1/projects/{project}/devices", self._list)
+        self.app.router.add_get(PREFIX + "/pangu/v1/projects/{project}/ammeters", self._list)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}{PREFIX}"
+
+    async def __aenter__(self) -> "MockWhesServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _signature_ok(self, request: web.Request) -> bool:
+        h = request.headers
+        try:
+            string_to_sign = (
+                f"{request.method.upper()}\n"
+                f"x-wts-date:{h['x-wts-date']}\n"
+                f"x-wts-signature-method:{h['x-wts-signature-method']}\n"
+                f"x-wts-signature-nonce:{h['x-wts-signature-nonce']}\n"
+                f"x-wts-signature-version:{h['x-wts-signature-version']}\n"
+                f"{signing.canonical_path_and_query(str(request.url))}"
+            )
+        except KeyError:
+            return False
+        digest = hmac.new(self.config.api_secret.encode("utf-8"), string_to_sign.encode("utf-8"), hashlib.sha1).digest()
+        expected = f"wts {self.config.api_key}:{base64.standard_b64encode(digest).decode('utf-8')}"
+        return hmac.compare_digest(expected, h.get("Authorization", ""))
+
+    async def _list(self, request: web.Request) -> web.Response:
+        self.stats.requests += 1
+        self.stats.by_path[request.path] = self.stats.by_path.get(request.path, 0) + 1
+        if self.config.verify_signature and not self._signature_ok(request):
+            self.stats.auth_failures += 1
+            return web.json_response({"code": 401, "msg": "invalid signature"}, status=401)
+        ids = self.config.devices if request.path.endswith("/devices") else self.config.ammeters
+        page = int(request.query.get("page", 1))
+        size = int(request.query.get("page_size", 100))
+        chunk = ids[(page - 1) * size:page * size]
+        return web.json_response({"code": 0, "data": {
+            "total": len(ids), "list": [{"id": i, "name": f"Unit {i}"} for i in chunk],
+        }})
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        cfg = self.config
+        self.stats.requests += 1
+        self.stats.by_path[request.path] = self.stats.by_path.get(request.path, 0) + 1
+
+        if cfg.latency_ms or cfg.latency_jitter_ms:
+            await asyncio.sleep(max(0.0, random.gauss(cfg.latency_ms, cfg.latency_jitter_ms)) / 1000)
+
+        if cfg.verify_signature and not self._signature_ok(request):
+            self.stats.auth_failures += 1
+            return web.json_response({"code": 401, "msg": "invalid signature"}, status=401)
+        if cfg.error_rate and random.random() < cfg.error_rate:
+            self.stats.errors += 1
+            return web.json_response({"code": cfg.error_status, "msg": "mock error"}, status=cfg.error_status)
+
+        body = await request.json()
+        available = int(time.time() * 1000 - cfg.ingest_lag_ms)
+        payload = build_payload(
+            list(body.get("columns") or []), int(body["start"]), min(int(body["end"]), available),
+            str(body.get("sample_by", "10s")),
+            rows=cfg.rows, max_rows=cfg.max_rows, seed=hash(request.match_info["target"]) & 0xFFFF,
+        )
+        resp = web.json_response(payload)
+        self.stats.bytes_sent += len(resp.body)
+        return resp
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--api-key", default=MockConfig.api_key)
+    parser.add_argument("--api-secret", default=MockConfig.api_secret)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--rows", type=int, default=None, help="vast aantal rijen per response")
+    parser.add_argument("--ingest-lag-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    cfg = MockConfig(
+        api_key=args.api_key, api_secret=args.api_secret, latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms, error_rate=args.error_rate,
+        error_status=args.error_status, rows=args.rows, ingest_lag_ms=args.ingest_lag_ms,
+    )
+
+    async def _serve() -> None:
+        async with MockWhesServer(cfg, args.host, args.port) as srv:
+            print(f"WHES mock server op {srv.base_url} (Ctrl+C om te stoppen)")
+            await asyncio.Event().wait()
+
+    try:
+        asyncio.run(_serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
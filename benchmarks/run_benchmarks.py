@@ -0,0 +1,238 @@
+"""
+Benchmark- en load-test suite voor de WHES integratie.
+
+Meet throughput, p50/p99 latency en piekgeheugen (tracemalloc) voor:
+
+- decode:   metrics_to_kv_list (alle rijen) vs. metrics_to_frame op gegenereerde payloads
+- signing:  WhesSigner.sign
+- single:   WhesClient.fetch_bundle tegen de lokale mock server
+- fleet:    WhesClient.fetch_fleet met veel devices/ammeters tegen de mock server
+
+Vereist een ontwikkelomgeving met Home Assistant en aiohttp geïnstalleerd:
+
+    python benchmarks/run_benchmarks.py                 # alles
+    python benchmarks/run_benchmarks.py decode fleet --devices 50 --latency-ms 120
+    python benchmarks/run_benchmarks.py --json bench_output.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import pathlib
+import sys
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List
+
+import aiohttp
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from custom_components.whes__battery.api import WhesClient, metrics_to_kv_list  # noqa: E402
+from custom_components.whes__battery.const import EMS_COLUMNS, RATE_LIMIT_BURST  # noqa: E402
+from custom_components.whes__battery.frame import metrics_to_frame  # noqa: E402
+from custom_components.whes__battery.session import create_tuned_session  # noqa: E402
+from custom_components.whes__battery.signing import WhesSigner  # noqa: E402
+from mock_server import MockConfig, MockWhesServer, build_payload  # noqa: E402
+
+
+def _pct(samples: List[float], p: float) -> float:
+    if not samples:
+        return float("nan")
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+
+def _report(name: str, unit: str, count: int, total_s: float, lat_s: List[float], peak_bytes: int) -> Dict[str, Any]:
+    res = {
+        "name": name,
+        "throughput": count / total_s if total_s else float("nan"),
+        "unit": unit,
+        "p50_ms": _pct(lat_s, 50) * 1000,
+        "p99_ms": _pct(lat_s, 99) * 1000,
+        "peak_kib": peak_bytes / 1024,
+    }
+    print(f"{name:<34} {res['throughput']:>12,.0f} {unit:<8} p50 {res['p50_ms']:9.3f} ms  "
+          f"p99 {res['p99_ms']:9.3f} ms  peak {res['peak_kib']:>9,.0f} KiB")
+    return res
+
+
+def _peak(fn: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+async def _apeak(fn: Callable[[], Awaitable[Any]]) -> int:
+    tracemalloc.start()
+    try:
+        await fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_decode(args) -> List[Dict[str, Any]]:
+    out = []
+    for n_rows in args.rows:
+        end = 1_700_000_000_000
+        payload = build_payload(EMS_COLUMNS, end - n_rows * 10_000, end, "10s", rows=n_rows)
+        raw = json.dumps(payload).encode()
+
+        def _kv():
+            rows = metrics_to_kv_list(json.loads(raw))
+            return list(rows)  # oude gedrag: alle dicts materialiseren
+
+        def _frame():
+            return metrics_to_frame(json.loads(raw)).last_row()
+
+        for label, fn in ((f"decode kv_list ({n_rows} rows)", _kv), (f"decode frame ({n_rows} rows)", _frame)):
+            lat = []
+            t0 = time.perf_counter()
+            for _ in range(args.iterations):
+                t = time.perf_counter()
+                fn()
+                lat.append(time.perf_counter() - t)
+            total = time.perf_counter() - t0
+            out.append(_report(label, "rows/s", n_rows * args.iterations, total, lat, _peak(fn)))
+    return out
+
+
+def bench_signing(args) -> List[Dict[str, Any]]:
+    signer = WhesSigner("bench-key", "bench-secret")
+    urls = [f"https://x/open-api/pangu/v1/projects/p/devices/d{i}/ems/metrics" for i in range(16)]
+    n = args.iterations * 100
+    lat = []
+    t0 = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        signer.sign("POST", urls[i % 16])
+        lat.append(time.perf_counter() - t)
+    total = time.perf_counter() - t0
+    return [_report("signing", "sign/s", n, total, lat, _peak(lambda: [signer.sign("POST", u) for u in urls]))]
+
+
+def _session(args, base_url: str):
+    """Standaard aiohttp-sessie, of met --tuned-session de getunede sessie van de integratie."""
+    if args.tuned_session:
+        return create_tuned_session(base_url)
+    return aiohttp.ClientSession(), None
+
+
+def _print_connections(stats) -> None:
+    if stats is not None:
+        print(f"{'':<34} connecties: {stats.as_dict()}")
+
+
+def _limit(client: WhesClient, args) -> None:
+    """Zonder --rate-limit praktisch onbegrensd, zodat de benchmark de client meet en niet de limiter."""
+    client.limiter.configure((args.rate_limit or 1e9) / 60, RATE_LIMIT_BURST)
+
+
+def _print_limiter(client: WhesClient, args) -> None:
+    if args.rate_limit:
+        print(f"{'':<34} rate limit: {client.limiter.as_dict()}")
+
+
+def _mock_config(args) -> MockConfig:
+    return MockConfig(latency_ms=args.latency_ms, latency_jitter_ms=args.latency_ms / 5,
+                      error_rate=args.error_rate)
+
+
+async def bench_single(args) -> List[Dict[str, Any]]:
+    async with MockWhesServer(_mock_config(args)) as srv:
+        session, conn_stats = _session(args, srv.base_url)
+        async with session:
+            client = WhesClient(session, srv.base_url, "bench-key", "bench-secret", "p1", "d1", "a1")
+            _limit(client, args)
+            lat = []
+            t0 = time.perf_counter()
+            for _ in range(args.iterations):
+                t = time.perf_counter()
+                try:
+                    await client.fetch_bundle(poll_seconds=60, sample_by="10s")
+                except Exception:
+                    pass
+                lat.append(time.perf_counter() - t)
+            total = time.perf_counter() - t0
+            peak = await _apeak(lambda: client.fetch_bundle(poll_seconds=60, sample_by="10s"))
+            res = [_report("poll single device", "polls/s", args.iterations, total, lat, peak)]
+            _print_connections(conn_stats)
+            _print_limiter(client, args)
+            return res
+
+
+async def bench_fleet(args) -> List[Dict[str, Any]]:
+    devices = [f"d{i}" for i in range(args.devices)]
+    ammeters = [f"a{i}" for i in range(args.devices)]
+    async with MockWhesServer(_mock_config(args)) as srv:
+        session, conn_stats = _session(args, srv.base_url)
+        async with session:
+            client = WhesClient(session, srv.base_url, "bench-key", "bench-secret", "p1")
+            _limit(client, args)
+            rounds = max(1, args.iterations // 10)
+            lat = []
+            t0 = time.perf_counter()
+            for _ in range(rounds):
+                t = time.perf_counter()
+                try:
+                    await client.fetch_fleet(devices, ammeters, max_concurrency=args.concurrency)
+                except Exception:
+                    pass
+                lat.append(time.perf_counter() - t)
+            total = time.perf_counter() - t0
+            peak = await _apeak(lambda: client.fetch_fleet(devices, ammeters, max_concurrency=args.concurrency))
+            label = f"poll fleet ({len(devices)}+{len(ammeters)}, c={args.concurrency})"
+            res = [_report(label, "req/s", rounds * (len(devices) + len(ammeters)), total, lat, peak)]
+            _print_connections(conn_stats)
+            _print_limiter(client, args)
+            return res
+
+
+SUITES = {
+    "decode": bench_decode,
+    "signing": bench_signing,
+    "single": bench_single,
+    "fleet": bench_fleet,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("suites", nargs="*", metavar="SUITE",
+                        help=f"een of meer van {', '.join(SUITES)} (standaard: alle)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 2_000, 20_000],
+                        help="payloadgroottes voor de decode-benchmark")
+    parser.add_argument("--devices", type=int, default=25, help="aantal devices (en ammeters) voor fleet")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="gesimuleerde server-latency")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tuned-session", action="store_true",
+                        help="gebruik de getunede sessie van de integratie (toont connectie-hergebruik)")
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="requests per minuut voor de gedeelde rate limiter (0 = onbegrensd)")
+    parser.add_argument("--json", metavar="PATH", help="schrijf resultaten ook als JSON")
+    args = parser.parse_args()
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"onbekende suite(s): {', '.join(sorted(unknown))}")
+
+    results: List[Dict[str, Any]] = []
+    for name in args.suites or list(SUITES):
+        fn = SUITES[name]
+        res = asyncio.run(fn(args)) if asyncio.iscoroutinefunction(fn) else fn(args)
+        results.extend(res)
+
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,40 @@
 from __future__ import annotations
 
 import logging
+from datetime import timedelta
+
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
-from .const import DOMAIN, PLATFORMS
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN, PLATFORMS, TOPOLOGY_REFRESH_INTERVAL
 from .coordinator import WhesCoordinator
+from .services import async_setup_services, async_unload_services
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     coordinator = WhesCoordinator(hass, entry)
-    await coordinator.async_config_entry_first_refresh()
+    await coordinator.async_load_history()
+    if await coordinator.async_load_cache():
+        # Entities starten met de gecachte bundle; de eerste live refresh blokkeert setup niet
+        entry.async_create_background_task(hass, coordinator.async_refresh(), "whes_first_refresh")
+    else:
+        await coordinator.async_config_entry_first_refresh()
 
     hass.data.setdefault(DOMAIN, {})[entry.entry_id] = coordinator
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    await async_setup_services(hass)
+
+    coordinator.async_setup_fast_lane()
+    coordinator.async_setup_archive()
+
+    # Project-topologie: eerste keer op de achtergrond, daarna op een traag interval
+    entry.async_create_background_task(hass, coordinator.async_refresh_topology(), "whes_topology")
+    entry.async_on_unload(async_track_time_interval(
+        hass, coordinator.async_refresh_topology, timedelta(seconds=TOPOLOGY_REFRESH_INTERVAL)))
 
     # Re-load on options change
     entry.async_on_unload(entry.add_update_listener(_async_reload_on_update))
@@ -30,4 +49,13 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     unloaded = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unloaded:
         hass.data[DOMAIN].pop(entry.entry_id, None)
+        if not hass.data[DOMAIN]:
+            await async_unload_services(hass)
     return unloaded
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    # Lokale cache, ringbuffer-snapshot en backfill-checkpoints horen bij de entry
+    for key in (f"{DOMAIN}.cache.{entry.entry_id}", f"{DOMAIN}.history.{entry.entry_id}",
+                f"{DOMAIN}.backfill.{entry.entry_id}"):
+        await Store(hass, 1, key).async_remove()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from array import array
+from typing import Dict, Iterable, Optional
+
+from .frame import MetricsFrame, np
+
+# Suffixen van de window-aggregaten die naast de laatste waarde in een rij komen
+AGGREGATE_SUFFIXES = ("mean", "min", "max", "energy")
+
+_MS_PER_HOUR = 3_600_000
+
+
+def window_stats(
+        frame: MetricsFrame,
+        columns: Iterable[str],
+        *,
+        sign: float = 1.0,
+        kw_factor: float = 1.0,
+) -> Dict[str, Optional[float]]:
+    """
+    Aggregeert vermogenskolommen over alle samples van het opgehaalde window.
+
+    Per kolom ``<col>_mean``, ``<col>_min``, ``<col>_max`` (in de eenheid van de kolom, na ``sign``)
+    en ``<col>_energy``: de trapezium-integraal in kWh. ``kw_factor`` zet de kolomeenheid om naar kW
+    (1.0 voor kW, 0.001 voor W). Lege waarden (NaN) tellen niet mee; een interval met een lege
+    grens levert geen energie op. Kolommen zonder waarden geven None.
+    """
+    out: Dict[str, Optional[float]] = {}
+    ts = frame.timestamps
+    if ts is None or not frame:
+        return out
+    use_numpy = np is not None and isinstance(ts, array)
+    for name in columns:
+        if name not in frame.columns:
+            continue
+        col = frame.column(name)
+        if use_numpy and isinstance(col, array):
+            stats = _stats_numpy(frame.as_numpy(frame.timestamp_column), frame.as_numpy(name))
+        else:
+            stats = _stats_python(ts, col)
+        if stats is None:
+            out.update({f"{name}_{s}": None for s in AGGREGATE_SUFFIXES})
+            continue
+        total, lo, hi, n, area = stats
+        if sign < 0:
+            lo, hi = hi, lo
+        out[f"{name}_mean"] = sign * total / n
+        out[f"{name}_min"] = sign * lo
+        out[f"{name}_max"] = sign * hi
+        out[f"{name}_energy"] = sign * area * kw_factor / _MS_PER_HOUR
+    return out
+
+
+def _stats_python(ts, col):
+    """Eén pass: som, min, max, aantal en trapezium-oppervlak (eenheid x ms)."""
+    total = area = 0.0
+    lo = hi = None
+    n = 0
+    prev_t = prev_v = None
+    for t, v in zip(ts, col):
+        # Lege of niet-numerieke cellen tellen niet mee, zoals NaN in het NumPy-pad
+        if not isinstance(t, (int, float)) or not isinstance(v, (int, float)) or v != v:
+            prev_t = prev_v = None
+            continue
+        n += 1
+        total += v
+        if lo is None or v < lo:
+            lo = v
+        if hi is None or v > hi:
+            hi = v
+        if prev_t is not None:
+            area += (v + prev_v) * (t - prev_t) / 2
+        prev_t, prev_v = t, v
+    if not n:
+        return None
+    return total, lo, hi, n, area
+
+
+def _stats_numpy(ts, col):
+    valid = ~np.isnan(col)
+    n = int(valid.sum())
+    if not n:
+        return None
+    vals = col[valid]
+    # Alleen intervallen waarvan beide grenzen geldig zijn
+    pair = valid[1:] & valid[:-1]
+    area = float(np.sum(((col[1:] + col[:-1]) * np.diff(ts))[pair]) / 2) if len(col) > 1 else 0.0
+    return float(vals.sum()), float(vals.min()), float(vals.max()), n, area
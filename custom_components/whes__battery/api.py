@@ -1,12 +1,10 @@
 from __future__ import annotations
-import base64
-import hashlib
-import hmac
+import asyncio
+import json
 import random
 import time
-from collections import OrderedDict, Counter
-from typing import Any, Callable, Dict, List, Optional
-from urllib.parse import urlparse, parse_qs, quote
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 import aiohttp
 import logging
 
@@ -14,102 +12,69 @@ from homeassistant.core import HomeAssistant
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
 from .const import *
+from .aggregate import window_stats
+from .clock import ClockEstimator, align_window
+from .decode import decode_payload
+from .archive import SampleArchive
+from .history import SampleHistory
+from .profiling import PollProfiler
+from .frame import MetricsFrame, metrics_to_frame
+from .instrumentation import ClientStats
+from .ratelimit import TokenBucket, get_limiter
+from .resilience import CircuitBreaker, SingleFlight, describe_error, is_transient, retry_async
+from .signing import WhesSigner, canonical_path_and_query  # noqa: F401 (re-export)
 
 _LOGGER = logging.getLogger(__name__)
 
+# Procesbreed: identieke requests (zelfde key, pad en body) van verschillende callers delen één call
+_REQUEST_FLIGHTS = SingleFlight()
+
+# Eén keer opgebouwd; aparte grenzen voor verbinden en lezen binnen een totaal
+_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+
 
 def now_ms() -> int:
     return int(time.time() * 1000)
 
 
-_DEF_COERCERS: Dict[str, Callable[[Any], Any]] = {
-    "DOUBLE": lambda v: None if v is None else float(v),
-    "VARCHAR": lambda v: None if v is None else str(v),
-    "TIMESTAMP": lambda v: None if v is None else int(v),
-}
+_SAMPLE_BY_UNITS = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
 
 
-def _unique_columns(cols: List[str]) -> List[str]:
-    """
-    Zorgt dat kolomnamen uniek worden (col, col_2, col_3, ...),
-    voor het geval de API dubbele kolomnamen retourneert.
-    """
-    seen = Counter()
-    out: List[str] = []
-    for c in cols:
-        seen[c] += 1
-        out.append(c if seen[c] == 1 else f"{c}_{seen[c]}")
-    return out
+def sample_by_ms(sample_by: str) -> int:
+    """Zet een sample_by string (bijv. '10s', '1m') om naar milliseconden; fallback 10 s."""
+    s = (sample_by or "").strip().lower()
+    for unit in ("ms", "s", "m", "h", "d"):
+        if s.endswith(unit) and s[: -len(unit)].isdigit():
+            return max(1, int(s[: -len(unit)]) * _SAMPLE_BY_UNITS[unit])
+    return 10_000
 
 
 def metrics_to_kv_list(
         metrics_resp: dict,
         *,
         extra_coercers: Optional[Dict[str, Callable[[Any], Any]]] = None,
-) -> List[Dict[str, Any]]:
+) -> Sequence[Dict[str, Any]]:
     """
     Converteert het WHES metrics-formaat (columns/rows/metadata) naar
     een lijst van dicts [{col: value, ...}, ...].
-    """
-    data = (metrics_resp or {}).get("data") or {}
-    columns: List[str] = list(data.get("columns") or [])
-    rows: List[List[Any]] = list(data.get("rows") or [])
-    metadata: List[str] = list(data.get("metadata") or [])
-
-    if not columns or not rows:
-        if not columns and not rows:
-            _LOGGER.warning("WHES: metrics response bevat geen 'columns' en geen 'rows'.")
-        elif not columns:
-            _LOGGER.warning("WHES: metrics response bevat geen 'columns' (rows=%d).", len(rows))
-        else:
-            _LOGGER.warning("WHES: metrics response bevat geen 'rows' (columns=%d).", len(columns))
-        return []
-
-    columns = _unique_columns(columns)
-
-    base = dict(_DEF_COERCERS)
-    if extra_coercers:
-        base.update(extra_coercers)
-
-    # Bouw coercers op basis van metadata; fallback = identity
-    coercers: List[Callable[[Any], Any]] = [
-        base.get(str(m).upper(), lambda v: v) for m in (metadata or [None] * len(columns))
-    ]
-    if len(coercers) != len(columns):
-        _LOGGER.debug(
-            "WHES: metadata/columns lengte mismatch (metadata=%d, columns=%d); gebruik identity coercers.",
-            len(coercers),
-            len(columns),
-        )
-        coercers = [lambda v: v] * len(columns)
 
-    out: List[Dict[str, Any]] = []
-    for idx, r in enumerate(rows):
-        n = min(len(columns), len(r))
-        if n != len(columns):
-            _LOGGER.debug(
-                "WHES: rij %d heeft %d waarden voor %d kolommen; trailing kolommen worden op None gezet.",
-                idx, n, len(columns)
-            )
-        row_dict: Dict[str, Any] = {}
+    De lijst is een luie view over een MetricsFrame: dicts worden pas per rij
+    gebouwd wanneer ze worden opgevraagd.
+    """
+    return metrics_to_frame(metrics_resp, extra_coercers=extra_coercers).rows
 
-        for i in range(n):
-            val = r[i]
-            try:
-                val = coercers[i](val)
-            except Exception as ce:
-                # Laat de ruwe waarde staan als coercion faalt
-                _LOGGER.debug("WHES: coercion fout op kolom '%s': %r (behoud ruwe waarde).", columns[i], ce)
-            row_dict[columns[i]] = val
 
-        # Vul ontbrekende trailing kolommen met None
-        for j in range(n, len(columns)):
-            row_dict[columns[j]] = None
+# Ammeter-vermogens waarvan het teken wordt omgedraaid (zie normalize_power)
+INVERTED_POWER_KEYS = ("ac_active_power", "ac_active_powers_0", "ac_active_powers_1", "ac_active_powers_2")
 
-        out.append(row_dict)
 
-    _LOGGER.debug("WHES: metrics_to_kv_list -> %d rijen, %d kolommen.", len(out), len(columns))
-    return out
+def _retry_after(err: aiohttp.ClientResponseError) -> float:
+    """Pauze na een 429: de Retry-After header (seconden) of RATE_LIMIT_PENALTY."""
+    try:
+        value = float((err.headers or {}).get("Retry-After"))
+    except (TypeError, ValueError):
+        return RATE_LIMIT_PENALTY
+    return min(RATE_LIMIT_MAX_PENALTY, max(0.0, value))
 
 
 def normalize_power(row: Dict[str, Any]) -> Dict[str, Any]:
@@ -117,37 +82,31 @@ def normalize_power(row: Dict[str, Any]) -> Dict[str, Any]:
     Keert het teken van site/grid vermogens om (optioneel),
     als jouw toepassing import/export zo verwacht.
     """
-    for k in ("ac_active_power", "ac_active_powers_0", "ac_active_powers_1", "ac_active_powers_2"):
+    for k in INVERTED_POWER_KEYS:
         if k in row and row[k] is not None:
             row[k] = -row[k]
     return row
 
 
-def canonical_path_and_query(full_url: str, extra_params: dict | None = None) -> str:
+def _page_items(resp: Any) -> Tuple[List[Dict[str, str]], Optional[int]]:
     """
-    Maakt een canonieke path+query string met alfabetisch geordende keys.
-    Houdt rekening met parse_qs (lijsten) en extra_params.
+    Haalt de items (en het totaal, als dat er is) uit een lijst-response. Accepteert een kale lijst
+    en de gangbare vormen ``{"data": {"list"|"records"|"items"|"rows": [...], "total": n}}``.
     """
-    extra_params = extra_params or {}
-    parsed = urlparse(full_url)
-    path = parsed.path
-
-    qs_from_url = parse_qs(parsed.query)
-    merged = {**qs_from_url, **extra_params} if (qs_from_url and extra_params) else (qs_from_url or extra_params)
-
-    if not merged:
-        return path
-
-    ordered = OrderedDict(sorted(merged.items()))
-    parts = []
-    for k, v in ordered.items():
-        if isinstance(v, list):
-            joined = ",".join(quote(str(x)) for x in v)
-            parts.append(f"{quote(str(k))}={joined}")
-        else:
-            parts.append(f"{quote(str(k))}={quote(str(v))}")
-
-    return f"{path}?" + "&".join(parts)
+    data = resp.get("data", resp) if isinstance(resp, dict) else resp
+    total = None
+    if isinstance(data, dict):
+        total = data.get("total")
+        data = next((data[k] for k in ("list", "records", "items", "rows") if isinstance(data.get(k), list)), [])
+    items: List[Dict[str, str]] = []
+    for item in data if isinstance(data, list) else []:
+        if not isinstance(item, dict):
+            continue
+        target_id = next((item[k] for k in ("id", "device_id", "ammeter_id", "sn") if item.get(k)), None)
+        if target_id is None:
+            continue
+        items.append({"id": str(target_id), "name": str(item.get("name") or item.get("alias") or target_id)})
+    return items, total if isinstance(total, int) else None
 
 
 class WhesClient:
@@ -158,179 +117,635 @@ class WhesClient:
             api_key: str,
             api_secret: str,
             project_id: str,
-            device_id: str,
-            ammeter_id: str,
+            device_id: str | None = None,
+            ammeter_id: str | None = None,
     ) -> None:
         self._session = session
         self._base = base_url.rstrip("/")
         self._api_key = api_key
         self._api_secret = api_secret
+        self._signer = WhesSigner(api_key, api_secret)
         self._project_id = project_id
         self._device_id = device_id
         self._ammeter_id = ammeter_id
+        # Laatst bekende rij per (sectie, id), voor als een call faalt
+        self._last: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # Timestamp (ms) van de laatst geziene sample per (sectie, id)
+        self._watermarks: Dict[Tuple[str, str], int] = {}
+        self._stats = ClientStats()
+        # Circuit breaker per device/ammeter (plus één voor de project-endpoints): één onbereikbaar
+        # device in een hub mag de polls van de andere niet blokkeren
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # Request-budget gedeeld met alle andere clients van dezelfde key en base URL
+        self._limiter = get_limiter(api_key, self._base)
+        # Gelijktijdige fetches voor hetzelfde device/ammeter delen één poll
+        self._target_flights = SingleFlight()
+        # Klokverschil en ingest-lag t.o.v. de cloud, uit Date-headers en sample-timestamps
+        self._clock = ClockEstimator(CLOCK_EWMA_ALPHA)
+        # Project-topologie (devices/ammeters), gecachet
+        self._topology: Optional[Dict[str, Any]] = None
+        self._topology_at = 0.0
+        # Optionele ringbuffer (afgeleide sensoren) die elk frame van de live polls krijgt
+        self.history: Optional[SampleHistory] = None
+        # Optioneel lokaal archief dat alle rijen van de live polls krijgt
+        self.archive: Optional[SampleArchive] = None
+        # Alleen gezet tijdens whes.profile
+        self.profiler: Optional[PollProfiler] = None
+
+    def prime_signing(self, device_ids: Iterable[str], ammeter_ids: Iterable[str]) -> None:
+        """Precomputeert de canonieke paden van alle bekende metrics-endpoints."""
+        self._signer.prime(
+            *(f"{self._base}{self._metrics_path('ems', d)}" for d in device_ids),
+            *(f"{self._base}{self._metrics_path('ammeter', a)}" for a in ammeter_ids),
+        )
 
     def _signed_headers(self, method: str, full_url: str, params: dict | None = None) -> Dict[str, str]:
-        headers_ordered = OrderedDict(
-            [
-                ("x-wts-date", str(int(time.time() * 1000))),
-                ("x-wts-signature-method", "HMAC-SHA1"),
-                ("x-wts-signature-nonce", str(random.randint(10_000_000, 99_999_999))),
-                ("x-wts-signature-version", "1.0"),
-            ]
-        )
+        return self._signer.sign(method, full_url, params)
+
+    @property
+    def stats(self) -> ClientStats:
+        return self._stats
 
-        string_to_sign = f"{method.upper()}\n" + "".join(f"{k}:{v}\n" for k, v in headers_ordered.items())
-        canonical = canonical_path_and_query(full_url, params)
-        string_to_sign += canonical
+    @property
+    def breakers(self) -> Dict[str, CircuitBreaker]:
+        return self._breakers
 
-        digest = hmac.new(self._api_secret.encode("utf-8"), string_to_sign.encode("utf-8"), hashlib.sha1).digest()
-        signature = base64.standard_b64encode(digest).decode("utf-8")
+    def _breaker(self, target: str) -> CircuitBreaker:
+        breaker = self._breakers.get(target)
+        if breaker is None:
+            breaker = self._breakers[target] = CircuitBreaker(
+                BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, name=target)
+        return breaker
 
-        headers_ordered["Authorization"] = f"wts {self._api_key}:{signature}"
-        return dict(headers_ordered)
+    @property
+    def limiter(self) -> TokenBucket:
+        return self._limiter
 
-    async def _post(self, path: str, json_body: dict | None = None, params: dict | None = None) -> dict:
+    @property
+    def clock(self) -> ClockEstimator:
+        return self._clock
+
+    async def _post(
+            self,
+            path: str,
+            json_body: dict | None = None,
+            params: dict | None = None,
+            *,
+            endpoint: str = "other",
+            idempotent: bool = True,
+            tail_rows: Optional[int] = None,
+            priority: int = PRIORITY_LIVE,
+            target: str = "project",
+    ) -> dict:
+        return await self._request("POST", path, json_body, params, endpoint=endpoint, idempotent=idempotent,
+                                   tail_rows=tail_rows, priority=priority, target=target)
+
+    async def _get(
+            self,
+            path: str,
+            params: dict | None = None,
+            *,
+            endpoint: str = "other",
+            priority: int = PRIORITY_LIVE,
+            target: str = "project",
+    ) -> dict:
+        return await self._request("GET", path, None, params, endpoint=endpoint, priority=priority, target=target)
+
+    async def _request(
+            self,
+            method: str,
+            path: str,
+            json_body: dict | None = None,
+            params: dict | None = None,
+            *,
+            endpoint: str = "other",
+            idempotent: bool = True,
+            tail_rows: Optional[int] = None,
+            priority: int = PRIORITY_LIVE,
+            target: str = "project",
+    ) -> dict:
+        """
+        Request met resilience: identieke gelijktijdige requests delen één call (single-flight),
+        de circuit breaker van ``target`` blokkeert calls na herhaalde mislukte calls (na alle
+        retries), elke poging wacht op een token van de gedeelde rate limiter (op ``priority``) en
+        idempotente reads worden bij transiënte fouten opnieuw geprobeerd met backoff en jitter.
+        """
+        breaker = self._breaker(target)
+        key = (
+            method, self._base, self._api_key, path,
+            json.dumps(json_body, sort_keys=True), json.dumps(params, sort_keys=True), tail_rows,
+        )
+
+        async def _attempt() -> dict:
+            wait = await self._limiter.acquire(priority)
+            if self.profiler is not None:
+                self.profiler.add("rate_limit", wait)
+            try:
+                return await self._request_once(method, path, json_body, params, endpoint=endpoint,
+                                                tail_rows=tail_rows)
+            except aiohttp.ClientResponseError as err:
+                if err.status == 429:
+                    # Quota overschreden: het hele budget van deze key pauzeert, niet alleen deze call
+                    self._limiter.penalize(_retry_after(err))
+                raise
+
+        async def _call() -> dict:
+            # Eerst de breaker: een geweigerde call mag geen token van het gedeelde budget kosten.
+            # De breaker telt één uitkomst per call, niet per poging.
+            breaker.before_request()
+            try:
+                # Pogingen loggen op debug; alleen de definitieve fout als warning
+                data = await retry_async(
+                    _attempt, attempts=RETRY_ATTEMPTS if idempotent else 1, base_delay=RETRY_BASE_DELAY,
+                    max_delay=RETRY_MAX_DELAY, label=f"{method} {path}",
+                )
+            except Exception as err:
+                if is_transient(err):
+                    breaker.record_failure()
+                else:
+                    breaker.record_ignored()
+                raise
+            except BaseException:
+                # Geannuleerd: een eventueel probe-slot weer vrijgeven
+                breaker.record_ignored()
+                raise
+            breaker.record_success()
+            return data
+
+        return await _REQUEST_FLIGHTS.run(key, _call)
+
+    async def _request_once(
+            self,
+            method: str,
+            path: str,
+            json_body: dict | None = None,
+            params: dict | None = None,
+            *,
+            endpoint: str = "other",
+            tail_rows: Optional[int] = None,
+    ) -> dict:
         url = f"{self._base}{path}"
-        headers = self._signed_headers("POST", url, params)
+        prof = self.profiler
+        t_sign = time.perf_counter()
+        headers = self._signed_headers(method, url, params)
+        stats = self._stats.endpoint(endpoint)
         t0 = time.perf_counter()
+        # Connect-tijd komt uit de TraceConfig van de eigen sessie (bij de HA-sessie zit hij in response_wait)
+        trace = {"trace_request_ctx": SimpleNamespace(connect_s=0.0)} if prof is not None else {}
+        if prof is not None:
+            prof.add("sign", t0 - t_sign)
+
+        def _failed(err: BaseException) -> int:
+            dt = (time.perf_counter() - t0) * 1000
+            stats.record_error(dt, err)
+            return int(dt)
+
         try:
             _LOGGER.debug(
-                "WHES: POST %s (params=%s, body_keys=%s)",
-                path, list((params or {}).keys()), list((json_body or {}).keys())
+                "WHES: %s %s (params=%s, body_keys=%s)",
+                method, path, list((params or {}).keys()), list((json_body or {}).keys())
             )
-            async with self._session.post(
+            async with self._session.request(
+                    method,
                     url,
                     headers=headers,
                     params=params,
                     json=json_body,
-                    timeout=aiohttp.ClientTimeout(total=20),
+                    timeout=_REQUEST_TIMEOUT,
+                    **trace,
             ) as resp:
+                if prof is not None:
+                    connect_s = trace["trace_request_ctx"].connect_s
+                    if connect_s:
+                        prof.add("connect", connect_s)
+                    prof.add("response_wait", time.perf_counter() - t0 - connect_s)
                 status = resp.status
+                self._clock.observe_date(resp.headers.get("Date"), now_ms())
                 # NB: raise_for_status zal bij 4xx/5xx exception gooien (we loggen dat in except)
                 resp.raise_for_status()
-                data = await resp.json(content_type=None)
-                dt_ms = int((time.perf_counter() - t0) * 1000)
-                # compacte shape logging zonder data te dumpen
-                size_hint = len(str(data)) if data is not None else 0
+                t_read = time.perf_counter()
+                raw = await resp.read()
+                t_decode = time.perf_counter()
+                # Eén keer vanuit de bytes; met tail_rows wordt alleen de staart van rows een Python-object
+                data = decode_payload(raw, tail_rows)
+                if prof is not None:
+                    prof.add("read_body", t_decode - t_read)
+                    prof.add("json_decode", time.perf_counter() - t_decode)
+                dt = (time.perf_counter() - t0) * 1000
+                # Grootte direct uit de body-bytes; geen str() over de gedecodeerde data
+                stats.record_response(dt, len(raw))
                 _LOGGER.debug(
-                    "WHES: POST %s -> %d in %d ms (resp_size≈%d chars)",
-                    path, status, dt_ms, size_hint
+                    "WHES: %s %s -> %d in %d ms (resp_size=%d bytes)",
+                    method, path, status, int(dt), len(raw)
                 )
                 return data
+        # Verwachte fouten per poging op debug; retry_async logt de definitieve fout
         except aiohttp.ClientResponseError as cre:
-            dt_ms = int((time.perf_counter() - t0) * 1000)
-            _LOGGER.exception("WHES: HTTP fout %s bij POST %s (na %d ms)", cre.status, path, dt_ms)
+            dt_ms = _failed(cre)
+            _LOGGER.debug("WHES: HTTP fout %s bij %s %s (na %d ms)", cre.status, method, path, dt_ms)
             raise
-        except aiohttp.ClientError as ce:
-            dt_ms = int((time.perf_counter() - t0) * 1000)
-            _LOGGER.exception("WHES: Netwerkfout bij POST %s: %r (na %d ms)", path, ce, dt_ms)
+        except (aiohttp.ClientError, TimeoutError) as ce:
+            dt_ms = _failed(ce)
+            _LOGGER.debug("WHES: Netwerkfout bij %s %s: %s (na %d ms)", method, path, describe_error(ce), dt_ms)
             raise
         except ValueError as ve:
-            dt_ms = int((time.perf_counter() - t0) * 1000)
-            _LOGGER.exception("WHES: JSON decode fout bij POST %s: %r (na %d ms)", path, ve, dt_ms)
+            dt_ms = _failed(ve)
+            _LOGGER.debug("WHES: JSON decode fout bij %s %s: %r (na %d ms)", method, path, ve, dt_ms)
             raise
         except Exception as e:
-            dt_ms = int((time.perf_counter() - t0) * 1000)
-            _LOGGER.exception("WHES: Onverwachte fout bij POST %s: %r (na %d ms)", path, e, dt_ms)
+            dt_ms = _failed(e)
+            _LOGGER.exception("WHES: Onverwachte fout bij %s %s: %r (na %d ms)", method, path, e, dt_ms)
             raise
 
     async def validate(self) -> None:
         """Lichtgewicht probe-call om credentials te valideren."""
+        await self.probe("ems", self._device_id)
+
+    async def probe(self, section: str, target_id: str) -> None:
+        """Probe-call van 30 s met één kolom; faalt bij ongeldige keys of een onbekend id."""
         end_ms = now_ms()
-        start_ms = end_ms - 30_000
-        ems_path = f"/pangu/v1/projects/{self._project_id}/devices/{self._device_id}/ems/metrics"
-        await self._post(ems_path, json_body={
-            "start": start_ms, "end": end_ms, "sample_by": "10s", "columns": ["ems_soc"],
-        })
-
-    async def fetch_bundle(self, poll_seconds: int = 60, overlap_seconds: int = 15, sample_by: str = "10s") -> Dict[
-        str, Any]:
-        end_ms = now_ms()
-        start_ms = end_ms - (poll_seconds + overlap_seconds) * 1000
+        await self._post(self._metrics_path(section, target_id), json_body={
+            "start": end_ms - 30_000, "end": end_ms, "sample_by": "10s",
+            "columns": ["ems_soc" if section == "ems" else "ac_active_power"],
+        }, endpoint="validate", tail_rows=1, priority=PRIORITY_VALIDATE, target=f"{section}/{target_id}")
 
-        _LOGGER.debug(
-            "WHES: fetch_bundle window start=%d end=%d (poll=%ds, overlap=%ds, sample_by=%s)",
-            start_ms, end_ms, poll_seconds, overlap_seconds, sample_by
+    async def probe_targets(
+            self,
+            device_ids: Iterable[str],
+            ammeter_ids: Iterable[str],
+            *,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ) -> Dict[Tuple[str, str], Exception]:
+        """Probet alle devices/ammeters gelijktijdig (begrensd); geeft de fouten per (sectie, id)."""
+        sem = asyncio.Semaphore(max(1, max_concurrency))
+        keys = [("ems", d) for d in device_ids] + [("ammeter", a) for a in ammeter_ids]
+
+        async def _one(key: Tuple[str, str]) -> None:
+            async with sem:
+                await self.probe(*key)
+
+        results = await asyncio.gather(*(_one(k) for k in keys), return_exceptions=True)
+        failed: Dict[Tuple[str, str], Exception] = {}
+        for key, res in zip(keys, results):
+            if isinstance(res, BaseException):
+                if not isinstance(res, Exception):
+                    raise res
+                failed[key] = res
+        return failed
+
+    async def _list_targets(self, path: str) -> List[Dict[str, str]]:
+        """Haalt een gepagineerde lijst op en normaliseert items naar ``{"id", "name"}``."""
+        out: List[Dict[str, str]] = []
+        for page in range(1, TOPOLOGY_MAX_PAGES + 1):
+            resp = await self._get(path, params={"page": page, "page_size": TOPOLOGY_PAGE_SIZE}, endpoint="topology",
+                                   priority=PRIORITY_VALIDATE)
+            items, total = _page_items(resp)
+            out.extend(items)
+            if len(items) < TOPOLOGY_PAGE_SIZE or (total is not None and len(out) >= total):
+                break
+        return out
+
+    async def discover(self, *, max_age: float = 0) -> Dict[str, Any]:
+        """
+        Topologie van het project: ``{"devices": [{"id", "name"}], "ammeters": [...], "fetched_ms": ...}``.
+        Binnen ``max_age`` seconden wordt de gecachte topologie teruggegeven.
+        """
+        if self._topology is not None and time.monotonic() - self._topology_at < max_age:
+            return self._topology
+        devices, ammeters = await asyncio.gather(
+            self._list_targets(f"/pangu/v1/projects/{self._project_id}/devices"),
+            self._list_targets(f"/pangu/v1/projects/{self._project_id}/ammeters"),
         )
-
-        # EMS
-        ems_path = f"/pangu/v1/projects/{self._project_id}/devices/{self._device_id}/ems/metrics"
-        ems_body = {
+        self._topology = {"devices": devices, "ammeters": ammeters, "fetched_ms": now_ms()}
+        self._topology_at = time.monotonic()
+        return self._topology
+
+    @property
+    def topology(self) -> Optional[Dict[str, Any]]:
+        return self._topology
+
+    def newest_sample_ms(self) -> Optional[int]:
+        """Timestamp van de nieuwste sample over alle endpoints (None als er nog niets is gezien)."""
+        return max(self._watermarks.values(), default=None)
+
+    def watermark(self, section: str, target_id: str) -> Optional[int]:
+        """Timestamp van de laatst geziene sample van één device/ammeter (None als er nog niets is gezien)."""
+        return self._watermarks.get((section, target_id))
+
+    def _metrics_path(self, section: str, target_id: str) -> str:
+        if section == "ems":
+            return f"/pangu/v1/projects/{self._project_id}/devices/{target_id}/ems/metrics"
+        return f"/pangu/v1/projects/{self._project_id}/ammeters/{target_id}/metrics"
+
+    def _window_start(self, key: Tuple[str, str], end_ms: int, poll_seconds: int, overlap_seconds: int,
+                      catchup_seconds: int, sample_by: str) -> int:
+        """
+        Bepaalt de start van het request-window voor een endpoint.
+
+        Zonder watermark (eerste poll) wordt het volle poll+overlap window gevraagd, verlengd met de
+        geschatte ingest-lag.
+        Daarna alleen data vanaf de laatst geziene sample (inclusief, zodat een nog
+        lopende bucket wordt bijgewerkt), begrensd op ``catchup_seconds`` na een storing.
+        """
+        watermark = self._watermarks.get(key)
+        if watermark is None:
+            return end_ms - (poll_seconds + overlap_seconds) * 1000 - int(self._clock.lag_ms or 0)
+        floor = end_ms - catchup_seconds * 1000
+        if watermark < floor:
+            _LOGGER.debug("WHES: %s watermark %d ouder dan catch-up window; start op %d.", key, watermark, floor)
+            return floor
+        # Nooit een leeg of negatief window vragen (bijv. bij klokverschil)
+        return min(watermark, end_ms - sample_by_ms(sample_by))
+
+    async def fetch_frame(
+            self,
+            section: str,
+            target_id: str,
+            start_ms: int,
+            end_ms: int,
+            *,
+            sample_by: str = "10s",
+            columns: Optional[List[str]] = None,
+            tail_rows: Optional[int] = None,
+            priority: int = PRIORITY_LIVE,
+    ) -> MetricsFrame:
+        """
+        Haalt een willekeurig tijdsbereik op als MetricsFrame; raakt watermark en laatste rij niet aan.
+        Met ``tail_rows`` worden alleen de laatste rijen gedecodeerd.
+        """
+        if columns is None:
+            columns = EMS_COLUMNS if section == "ems" else AMMETER_COLUMNS
+        body = {
             "start": start_ms,
             "end": end_ms,
             "sample_by": sample_by,
-            "columns": [
-                "ems_soc",
-                "ems_soh",
-                "ems_state",
-                "ems_dc_power_neg",
-                "ems_dc_power_pos",
-                "ems_ac_active_power",
-                "ems_ac_frequency",
-                "ems_history_input_energy",
-                "ems_history_output_energy",
-                "ems_ac_active_power_A",
-                "ems_ac_active_power_B",
-                "ems_ac_active_power_C",
-            ],
+            "columns": columns,
         }
-        ems_raw = await self._post(ems_path, json_body=ems_body)
-        ems_rows = metrics_to_kv_list(ems_raw)
-        if not ems_rows:
-            _LOGGER.error("WHES: EMS metrics leeg voor device_id=%s (window=%d..%d).", self._device_id, start_ms,
-                          end_ms)
+        raw = await self._post(self._metrics_path(section, target_id), json_body=body, endpoint=section,
+                               tail_rows=tail_rows, priority=priority, target=f"{section}/{target_id}")
+        t_rows = time.perf_counter()
+        frame = metrics_to_frame(raw)
+        if self.profiler is not None:
+            self.profiler.add("row_decode", time.perf_counter() - t_rows)
+        self._stats.endpoint(section).record_rows(len(frame))
+        return frame
+
+    async def _fetch_metrics(
+            self,
+            key: Tuple[str, str],
+            columns: List[str],
+            start_ms: int,
+            end_ms: int,
+            sample_by: str,
+    ) -> MetricsFrame:
+        section, target_id = key
+        frame = await self.fetch_frame(section, target_id, start_ms, end_ms, sample_by=sample_by, columns=columns)
+
+        ts = frame.timestamps
+        if ts:
+            latest = max((t for t in ts if t is not None), default=None)
+            if latest is not None:
+                self._watermarks[key] = max(latest, self._watermarks.get(key, latest))
+                self._clock.observe_sample(latest)
+                self._stats.endpoint(section).record_sample_age(self._clock.server_now() - latest)
+
+        if not frame:
+            if key in self._watermarks:
+                # Incrementeel window zonder nieuwe sample is normaal
+                _LOGGER.debug("WHES: geen nieuwe %s samples voor %s sinds %d.", section, target_id,
+                              self._watermarks[key])
+            else:
+                _LOGGER.error("WHES: %s metrics leeg voor id=%s (window=%d..%d).", section, target_id, start_ms,
+                              end_ms)
         else:
-            _LOGGER.debug("WHES: EMS metrics ontvangen: %d rijen.", len(ems_rows))
+            _LOGGER.debug("WHES: %s metrics ontvangen voor %s: %d rijen.", section, target_id, len(frame))
+        return frame
 
-        # Ammeter
-        ammeter_path = f"/pangu/v1/projects/{self._project_id}/ammeters/{self._ammeter_id}/metrics"
-        ammeter_body = {
-            "start": start_ms,
-            "end": end_ms,
-            "sample_by": sample_by,
-            "columns": [
-                "ac_active_power",
-                "ac_active_powers_0",
-                "ac_active_powers_1",
-                "ac_active_powers_2",
-                "ac_history_positive_power_in_kwh",
-                "ac_history_negative_power_in_kwh",
-            ],
-        }
-        amm_raw = await self._post(ammeter_path, json_body=ammeter_body)
-        amm_rows = metrics_to_kv_list(amm_raw)
-        if not amm_rows:
-            _LOGGER.error(
-                "WHES: Ammeter metrics leeg voor ammeter_id=%s (window=%d..%d).",
-                self._ammeter_id, start_ms, end_ms
-            )
+    async def fetch_latest(
+            self,
+            section: str,
+            target_id: str,
+            *,
+            poll_seconds: int = 60,
+            overlap_seconds: int = 15,
+            sample_by: str = "10s",
+            catchup_seconds: int = DEFAULT_CATCHUP_SECONDS,
+            columns: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Haalt de nieuwste rij op voor één EMS device of ammeter (incrementeel via de watermark).
+        Zonder ``columns`` worden alle kolommen van de sectie gevraagd.
+        Gelijktijdige aanroepen voor hetzelfde device/ammeter wachten op dezelfde poll.
+        """
+        key = (section, target_id)
+        return await self._target_flights.run(
+            key, lambda: self._fetch_latest(key, poll_seconds, overlap_seconds, sample_by, catchup_seconds, columns))
+
+    async def _fetch_latest(
+            self,
+            key: Tuple[str, str],
+            poll_seconds: int,
+            overlap_seconds: int,
+            sample_by: str,
+            catchup_seconds: int,
+            columns: Optional[List[str]],
+    ) -> Dict[str, Any]:
+        section = key[0]
+        # Servertijd i.p.v. lokale klok, en windows op sample_by-grenzen zodat de cloud kan cachen
+        if columns is None:
+            columns = EMS_COLUMNS if section == "ems" else AMMETER_COLUMNS
+        step_ms = sample_by_ms(sample_by)
+        for _attempt in range(2):
+            offset = self._clock.offset_ms
+            server_ms = self._clock.server_now()
+            start_ms = self._window_start(key, server_ms, poll_seconds, overlap_seconds, catchup_seconds, sample_by)
+            start_ms, end_ms = align_window(start_ms, server_ms, step_ms)
+            frame = await self._fetch_metrics(key, columns, start_ms, end_ms, sample_by)
+            # Verschoof de klokschatting tijdens deze request meer dan één sample (eerste contact met
+            # een scheve klok), dan klopte het window niet: één keer opnieuw met de gecorrigeerde tijd
+            if abs(self._clock.offset_ms - offset) <= step_ms:
+                break
+        if not frame:
+            # Geen nieuwe samples: laatst bekende rij blijft geldig
+            return dict(self._last.get(key, {}))
+        if self.history is not None:
+            self.history.ingest(section, key[1], frame)
+        if self.archive is not None:
+            self.archive.append(section, key[1], frame, INVERTED_POWER_KEYS if section == "ammeter" else ())
+        last = frame.last_row()
+        if section == "ammeter":
+            last = normalize_power(last)
+            # Ammeter in W en met omgekeerd teken, net als normalize_power
+            last.update(window_stats(frame, AGGREGATE_COLUMNS[section], sign=-1.0, kw_factor=0.001))
         else:
-            _LOGGER.debug("WHES: Ammeter metrics ontvangen: %d rijen.", len(amm_rows))
+            last.update(window_stats(frame, AGGREGATE_COLUMNS[section]))
+        self._last[key] = last
+        return dict(last)
 
-        ems_last = ems_rows[-1] if ems_rows else {}
-        amm_last = normalize_power(amm_rows[-1]) if amm_rows else {}
-
-        return {"ems": ems_last, "ammeter": amm_last}
+    async def fetch_columns(
+            self,
+            section: str,
+            target_id: str,
+            columns: List[str],
+            *,
+            window_seconds: int = FAST_WINDOW_SECONDS,
+            sample_by: str = "10s",
+    ) -> Tuple[Optional[int], Dict[str, Any]]:
+        """
+        Snelle, stateless fetch van een paar kolommen over een kort window (fast lane).
+        Raakt watermark en laatste rij van de gewone poll niet aan; geeft (timestamp, waarden).
+        """
+        server_ms = self._clock.server_now()
+        start_ms, end_ms = align_window(server_ms - window_seconds * 1000, server_ms, sample_by_ms(sample_by))
+        frame = await self.fetch_frame(section, target_id, start_ms, end_ms, sample_by=sample_by, columns=columns,
+                                       tail_rows=FAST_TAIL_ROWS)
+        if not frame:
+            return None, {}
+        if self.history is not None:
+            self.history.ingest(section, target_id, frame)
+        ts = frame.timestamps
+        latest = max((t for t in ts if t is not None), default=None) if ts else None
+        row = {k: v for k, v in frame.last_valid().items() if k in columns}
+        if section == "ammeter":
+            row = normalize_power(row)
+        return latest, row
+
+    async def fetch_fleet(
+            self,
+            device_ids: Iterable[str],
+            ammeter_ids: Iterable[str],
+            *,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            spread_seconds: float = 0.0,
+            columns: Optional[Dict[Tuple[str, str], List[str]]] = None,
+            **fetch_kwargs: Any,
+    ) -> Dict[str, Any]:
+        """
+        Haalt de nieuwste rij op voor een lijst devices en ammeters in één gedeelde poll-ronde.
+
+        Elke call start met een willekeurige vertraging binnen ``spread_seconds`` en er lopen
+        nooit meer dan ``max_concurrency`` requests tegelijk. Calls falen los van elkaar: bij
+        een fout blijft de laatst bekende rij staan en komt het id in ``stale[sectie]``.
+        Alleen als álle calls falen wordt de eerste exceptie doorgegeven.
+
+        ``columns`` beperkt per ``(sectie, id)`` de gevraagde kolommen; een lege lijst slaat dat
+        device/ammeter helemaal over (het komt dan niet in het resultaat).
+
+        Resultaat: ``{"ems": {id: rij}, "ammeter": {id: rij}, "stale": {"ems": [...], "ammeter": [...]},
+        "sample_ts": {"ems": {id: ms}, ...}, "sample_age": s}``; ``sample_age`` is de leeftijd (servertijd)
+        van de oudste nieuwste-sample over alle devices/ammeters.
+        """
+        sem = asyncio.Semaphore(max(1, max_concurrency))
+        columns = columns or {}
+        keys = [("ems", d) for d in device_ids] + [("ammeter", a) for a in ammeter_ids]
+        keys = [k for k in keys if columns.get(k, True)]
+
+        async def _one(key: Tuple[str, str]) -> Dict[str, Any]:
+            if spread_seconds > 0:
+                await asyncio.sleep(random.uniform(0, spread_seconds))
+            async with sem:
+                return await self.fetch_latest(key[0], key[1], columns=columns.get(key), **fetch_kwargs)
+
+        results = await asyncio.gather(*(_one(k) for k in keys), return_exceptions=True)
+
+        fleet: Dict[str, Any] = {"ems": {}, "ammeter": {}, "stale": {"ems": [], "ammeter": []}}
+        errors: List[Exception] = []
+        for key, res in zip(keys, results):
+            section, target_id = key
+            if isinstance(res, BaseException):
+                if not isinstance(res, Exception):
+                    # CancelledError e.d. nooit inslikken
+                    raise res
+                errors.append(res)
+                fleet["stale"][section].append(target_id)
+                if key in self._last:
+                    fleet[section][target_id] = dict(self._last[key])
+                # De warning staat al in het log (retry_async of het openen van de breaker)
+                _LOGGER.debug("WHES: %s metrics voor %s mislukt, laatst bekende waarden blijven staan: %s",
+                              section, target_id, describe_error(res))
+                continue
+            fleet[section][target_id] = res
+
+        if keys and len(errors) == len(keys):
+            raise errors[0]
+
+        sample_ts: Dict[str, Dict[str, int]] = {"ems": {}, "ammeter": {}}
+        for section, target_id in keys:
+            ts = self._watermarks.get((section, target_id))
+            if ts is not None:
+                sample_ts[section][target_id] = ts
+        oldest = min((ts for part in sample_ts.values() for ts in part.values()), default=None)
+        fleet["sample_ts"] = sample_ts
+        fleet["sample_age"] = None if oldest is None else max(0, (self._clock.server_now() - oldest) // 1000)
+        return fleet
+
+    async def fetch_bundle(
+            self,
+            poll_seconds: int = 60,
+            overlap_seconds: int = 15,
+            sample_by: str = "10s",
+            catchup_seconds: int = DEFAULT_CATCHUP_SECONDS,
+    ) -> Dict[str, Any]:
+        """
+        Haalt EMS en ammeter metrics van het eigen device/ammeter-paar gelijktijdig op.
+
+        Beide helften falen los van elkaar: bij een fout wordt de laatst bekende
+        rij van die helft teruggegeven en staat de sectie in ``stale``.
+        Alleen als beide helften falen wordt de exceptie doorgegeven.
+        """
+        fleet = await self.fetch_fleet(
+            [self._device_id] if self._device_id else [],
+            [self._ammeter_id] if self._ammeter_id else [],
+            poll_seconds=poll_seconds,
+            overlap_seconds=overlap_seconds,
+            sample_by=sample_by,
+            catchup_seconds=catchup_seconds,
+        )
+        bundle: Dict[str, Any] = {}
+        for section, target_id in (("ems", self._device_id), ("ammeter", self._ammeter_id)):
+            if target_id in fleet[section]:
+                bundle[section] = fleet[section][target_id]
+        bundle["stale"] = [section for section in ("ems", "ammeter") if fleet["stale"][section]]
+        bundle["sample_age"] = fleet["sample_age"]
+        return bundle
 
 
 async def validate_credentials(hass: HomeAssistant, data: dict) -> tuple[bool, str | None]:
-    """Probe-call om keys/IDs te valideren in de config flow."""
-    session = async_get_clientsession(hass)
-    client = WhesClient(
-        session=session,
-        base_url=data.get(CONF_BASE_URL, DEFAULT_BASE_URL),
-        api_key=data[CONF_API_KEY],
-        api_secret=data[CONF_API_SECRET],
-        project_id=data[CONF_PROJECT_ID],
-        device_id=data[CONF_DEVICE_ID],
-        ammeter_id=data[CONF_AMMETER_ID],
-    )
+    """Probe-calls om keys/IDs te valideren in de config flow; alle devices/ammeters gelijktijdig."""
+    client = _flow_client(hass, data)
+    device_ids = data.get(CONF_DEVICE_IDS) or ([data[CONF_DEVICE_ID]] if data.get(CONF_DEVICE_ID) else [])
+    ammeter_ids = data.get(CONF_AMMETER_IDS) or ([data[CONF_AMMETER_ID]] if data.get(CONF_AMMETER_ID) else [])
     try:
-        await client.validate()
+        failed = await client.probe_targets(device_ids, ammeter_ids)
+    except Exception:
+        return False, "cannot_connect"
+    if not failed:
         return True, None
+    for (section, target_id), err in failed.items():
+        # Geen repr: die bevat de headers met de kandidaat-key en signature
+        _LOGGER.warning("WHES: probe voor %s %s mislukt: %s", section, target_id, describe_error(err))
+    if any(isinstance(e, aiohttp.ClientResponseError) and e.status in (401, 403) for e in failed.values()):
+        return False, "invalid_auth"
+    return False, "cannot_connect"
+
+
+async def discover_targets(hass: HomeAssistant, data: dict) -> tuple[Dict[str, Any] | None, str | None]:
+    """Topologie van het project voor de config flow; (None, fout) als discovery niet lukt."""
+    try:
+        return await _flow_client(hass, data).discover(), None
     except aiohttp.ClientResponseError as e:
         if e.status in (401, 403):
-            return False, "invalid_auth"
-        return False, "cannot_connect"
+            return None, "invalid_auth"
+        return None, "discovery_failed"
     except Exception:
-        return False, "cannot_connect"
+        return None, "cannot_connect"
+
+
+def _flow_client(hass: HomeAssistant, data: dict) -> WhesClient:
+    return WhesClient(
+        session=async_get_clientsession(hass),
+        base_url=data.get(CONF_BASE_URL, DEFAULT_BASE_URL),
+        api_key=data[CONF_API_KEY],
+        api_secret=data[CONF_API_SECRET],
+        project_id=data[CONF_PROJECT_ID],
+    )
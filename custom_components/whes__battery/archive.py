@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import logging
+import math
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from .const import *
+from .frame import MetricsFrame, np
+
+_LOGGER = logging.getLogger(__name__)
+
+DAY_MS = 86_400_000
+_TS_FILE = "ts.i64"
+_NAN_BYTES = array("d", [math.nan]).tobytes()
+
+
+def _day(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path) // 8
+    except FileNotFoundError:
+        return 0
+
+
+def _read_slice(path: str, typecode: str, lo: int, hi: int) -> array:
+    """Leest items ``lo:hi`` van een kolombestand via mmap; alleen die bytes worden gekopieerd."""
+    out = array(typecode)
+    if hi <= lo or not _size(path):
+        return out
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        out.frombytes(mm[lo * 8:min(hi * 8, len(mm))])
+    return out
+
+
+def _search(path: str, start_ms: int, end_ms: int) -> Tuple[int, int]:
+    """Binair zoeken in de (gesorteerde) timestamp-index zonder het bestand in te lezen."""
+    if not _size(path):
+        return 0, 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm).cast("q")
+        try:
+            return bisect_left(view, start_ms), bisect_left(view, end_ms)
+        finally:
+            view.release()
+
+
+class SampleArchive:
+    """
+    Append-only kolomarchief van ruwe samples op disk, één map per device/ammeter en per dag (UTC):
+    ``ts.i64`` (int64 ms, oplopend) als index en per DOUBLE-kolom een ``<kolom>.f64`` met exact één
+    float64 per timestamp (NaN = geen waarde). Kolommen die later bijkomen worden met NaN aangevuld.
+
+    ``append`` draait op de event loop en buffert alleen; ``flush`` en ``read`` doen de file-IO en
+    horen in de executor.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        # _lock beschermt alleen de buffer (kort, ook vanaf de event loop); _io_lock de bestanden
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], List[Tuple[array, Dict[str, array]]]] = {}
+        self._watermarks: Dict[Tuple[str, str], int] = {}
+        self.rows_written = 0
+
+    def _target_dir(self, section: str, target_id: str) -> str:
+        return os.path.join(self.root, f"{section}_{target_id}")
+
+    def append(self, section: str, target_id: str, frame: MetricsFrame, invert: Iterable[str] = ()) -> None:
+        """Buffert de nog niet gearchiveerde rijen van een frame; ``invert`` krijgt het sensor-teken."""
+        ts = frame.timestamps
+        if ts is None or not frame:
+            return
+        key = (section, target_id)
+        mark = self._watermarks.get(key)
+        keep = [i for i, t in enumerate(ts) if t is not None and (mark is None or t > mark)]
+        if not keep:
+            return
+        invert = set(invert)
+        columns: Dict[str, array] = {}
+        for name in frame.columns:
+            col = frame.column(name)
+            if name == frame.timestamp_column or not isinstance(col, array) or col.typecode != "d":
+                continue
+            values = array("d", (col[i] for i in keep))
+            if name in invert:
+                values = array("d", (-v for v in values))
+            columns[name] = values
+        stamps = array("q", (ts[i] for i in keep))
+        self._watermarks[key] = stamps[-1]
+        with self._lock:
+            self._pending.setdefault(key, []).append((stamps, columns))
+
+    def flush(self) -> int:
+        """Schrijft alle gebufferde rijen weg (executor); geeft het aantal nieuwe rijen."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        written = 0
+        with self._io_lock:
+            for (section, target_id), batches in pending.items():
+                base = self._target_dir(section, target_id)
+                for stamps, columns in batches:
+                    start = 0
+                    while start < len(stamps):
+                        # Rijen van dezelfde dag in één keer
+                        day = stamps[start] // DAY_MS
+                        end = start
+                        while end < len(stamps) and stamps[end] // DAY_MS == day:
+                            end += 1
+                        path = os.path.join(base, _day(stamps[start]))
+                        written += self._write_day(path, stamps, columns, start, end)
+                        start = end
+            self.rows_written += written
+        return written
+
+    @staticmethod
+    def _write_day(path: str, stamps: array, columns: Dict[str, array], start: int, end: int) -> int:
+        os.makedirs(path, exist_ok=True)
+        ts_path = os.path.join(path, _TS_FILE)
+        count = _size(ts_path)
+        if count:
+            # Na een herstart kan het window overlappen met wat al op disk staat
+            last = _read_slice(ts_path, "q", count - 1, count)[0]
+            while start < end and stamps[start] <= last:
+                start += 1
+        if start >= end:
+            return 0
+        with open(ts_path, "ab") as f:
+            f.write(stamps[start:end].tobytes())
+        for name, values in columns.items():
+            col_path = os.path.join(path, f"{name}.f64")
+            with open(col_path, "ab") as f:
+                missing = count - _size(col_path)
+                if missing > 0:
+                    f.write(_NAN_BYTES * missing)
+                f.write(values[start:end].tobytes())
+        return end - start
+
+    def read(self, section: str, target_id: str, columns: List[str], start_ms: int, end_ms: int
+             ) -> Tuple[array, Dict[str, array]]:
+        """Alle samples met ``start_ms <= ts < end_ms`` (executor); ontbrekende kolomwaarden zijn NaN."""
+        base = self._target_dir(section, target_id)
+        ts_out = array("q")
+        out = {name: array("d") for name in columns}
+        day_ms = start_ms - start_ms % DAY_MS
+        with self._io_lock:
+            while day_ms < end_ms:
+                path = os.path.join(base, _day(day_ms))
+                day_ms += DAY_MS
+                ts_path = os.path.join(path, _TS_FILE)
+                lo, hi = _search(ts_path, start_ms, end_ms)
+                if hi <= lo:
+                    continue
+                ts_out.extend(_read_slice(ts_path, "q", lo, hi))
+                for name in columns:
+                    values = _read_slice(os.path.join(path, f"{name}.f64"), "d", lo, hi)
+                    if len(values) < hi - lo:
+                        values.frombytes(_NAN_BYTES * (hi - lo - len(values)))
+                    out[name].extend(values)
+        return ts_out, out
+
+
+def downsample(ts: array, columns: Dict[str, array], every_ms: int) -> Dict[str, list]:
+    """
+    Gemiddelde per bucket van ``every_ms`` op veelvouden van ``every_ms`` sinds epoch (NaN telt niet
+    mee); ``ts`` is het begin van de bucket en lege buckets worden overgeslagen.
+    """
+    if not len(ts):
+        return {"ts": [], **{name: [] for name in columns}}
+    if np is not None:
+        buckets = np.frombuffer(ts, dtype=np.int64) // every_ms
+        keys, inverse = np.unique(buckets, return_inverse=True)
+        out = {"ts": (keys * every_ms).tolist()}
+        for name, values in columns.items():
+            v = np.frombuffer(values, dtype=np.float64)
+            valid = ~np.isnan(v)
+            sums = np.bincount(inverse, weights=np.where(valid, v, 0.0), minlength=len(keys))
+            counts = np.bincount(inverse, weights=valid, minlength=len(keys))
+            means = np.divide(sums, counts, out=np.full(len(keys), np.nan), where=counts > 0)
+            out[name] = [None if m != m else round(float(m), 4) for m in means]
+        return out
+    order: List[int] = []
+    acc: Dict[int, Dict[str, List[float]]] = {}
+    for i, t in enumerate(ts):
+        b = t // every_ms
+        slot = acc.get(b)
+        if slot is None:
+            order.append(b)
+            slot = acc[b] = {name: [0.0, 0] for name in columns}
+        for name, values in columns.items():
+            v = values[i]
+            if v == v:
+                slot[name][0] += v
+                slot[name][1] += 1
+    out = {"ts": [b * every_ms for b in order]}
+    for name in columns:
+        out[name] = [round(acc[b][name][0] / acc[b][name][1], 4) if acc[b][name][1] else None for b in order]
+    return out
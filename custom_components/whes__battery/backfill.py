@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import async_add_external_statistics
+from homeassistant.components.sensor import SensorStateClass
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+from homeassistant.util import slugify
+
+from .api import INVERTED_POWER_KEYS, now_ms
+from .const import *
+from .coordinator import WhesCoordinator
+from .frame import MetricsFrame
+from .resilience import describe_error
+from .sensor import SENSOR_MAP
+
+_LOGGER = logging.getLogger(__name__)
+
+HOUR_MS = 3_600_000
+
+
+def statistic_columns(section: str) -> List[str]:
+    """Kolommen van een sectie die als lange-termijn statistiek zinvol zijn (numeriek, met state class)."""
+    out = []
+    for key, (_suffix, _unit, _devcls, statecls) in SENSOR_MAP.items():
+        if key.startswith("ems_") != (section == "ems"):
+            continue
+        if statecls in (SensorStateClass.MEASUREMENT, SensorStateClass.TOTAL_INCREASING):
+            out.append(key)
+    return out
+
+
+def statistic_id(section: str, target_id: str, key: str) -> str:
+    return f"{DOMAIN}:{slugify(f'{section}_{target_id}_{key}')}"
+
+
+def aggregate_hourly(frame: MetricsFrame, key: str, *, cumulative: bool, sign: float = 1.0) -> List[Dict[str, Any]]:
+    """
+    Aggregeert één kolom per uur in één pass.
+
+    Metingen leveren mean/min/max, cumulatieve tellers (kWh) state/sum met de laatste waarde van het uur.
+    Resultaat: lijst ``{"hour": hour_ms, ...}``, oplopend.
+    """
+    ts = frame.timestamps
+    if ts is None or not frame or key not in frame.columns:
+        return []
+    col = frame.column(key)
+
+    out: List[Dict[str, Any]] = []
+    hour = None
+    n = 0
+    total = 0.0
+    lo = hi = last = None
+    for t, v in zip(ts, col):
+        if v is None or v != v:
+            continue
+        h = t - t % HOUR_MS
+        if h != hour:
+            if hour is not None and n:
+                out.append(_bucket(hour, n, total, lo, hi, last, cumulative))
+            hour, n, total, lo, hi = h, 0, 0.0, None, None
+        v = v * sign
+        n += 1
+        total += v
+        lo = v if lo is None or v < lo else lo
+        hi = v if hi is None or v > hi else hi
+        last = v
+    if hour is not None and n:
+        out.append(_bucket(hour, n, total, lo, hi, last, cumulative))
+    return out
+
+
+def _bucket(hour: int, n: int, total: float, lo, hi, last, cumulative: bool) -> Dict[str, Any]:
+    if cumulative:
+        return {"hour": hour, "state": last, "sum": last}
+    return {"hour": hour, "mean": total / n, "min": lo, "max": hi}
+
+
+class WhesBackfill:
+    """
+    Vult lange-termijn statistieken (externe statistics) aan vanuit de WHES API.
+
+    Het bereik wordt per device/ammeter in uur-uitgelijnde chunks gestreamd: ophalen van chunk
+    N+1 loopt parallel aan aggregatie en import van chunk N, met hooguit ``BACKFILL_PIPELINE_DEPTH``
+    chunks in het geheugen. Na iedere chunk wordt een checkpoint bewaard zodat een onderbroken
+    backfill kan hervatten.
+    """
+
+    def __init__(self, hass: HomeAssistant, coordinator: WhesCoordinator) -> None:
+        self.hass = hass
+        self.coordinator = coordinator
+        self._store: Store = Store(hass, 1, f"{DOMAIN}.backfill.{coordinator.entry.entry_id}")
+        # Per device/ammeter het aaneengesloten geïmporteerde bereik {"start": ms, "done": ms}
+        self._checkpoints: Optional[Dict[str, Dict[str, int]]] = None
+        self._lock = asyncio.Lock()
+
+    async def _async_checkpoints(self) -> Dict[str, Dict[str, int]]:
+        if self._checkpoints is None:
+            self._checkpoints = dict(await self._store.async_load() or {})
+        return self._checkpoints
+
+    async def async_run(
+            self,
+            start_ms: int,
+            end_ms: Optional[int] = None,
+            *,
+            resume: bool = True,
+            chunk_hours: int = DEFAULT_BACKFILL_CHUNK_HOURS,
+    ) -> None:
+        # Alleen volledige uren; het lopende uur wordt door de recorder zelf gevuld
+        end_ms = end_ms if end_ms is not None else now_ms()
+        end_ms -= end_ms % HOUR_MS
+        start_ms -= start_ms % HOUR_MS
+        if start_ms >= end_ms:
+            _LOGGER.warning("WHES: backfill overgeslagen, leeg bereik %d..%d.", start_ms, end_ms)
+            return
+
+        async with self._lock:
+            checkpoints = await self._async_checkpoints()
+            targets: List[Tuple[str, str]] = [("ems", d) for d in self.coordinator.device_ids] + [
+                ("ammeter", a) for a in self.coordinator.ammeter_ids
+            ]
+            for section, target_id in targets:
+                ckey = f"{section}/{target_id}"
+                covered = t0 = start_ms
+                checkpoint = checkpoints.get(ckey) if resume else None
+                # Alleen hervatten als de vorige run [start, done) aaneengesloten tot over ons begin dekte
+                if isinstance(checkpoint, dict) and checkpoint["start"] <= start_ms <= checkpoint["done"]:
+                    covered, t0 = checkpoint["start"], checkpoint["done"]
+                if t0 >= end_ms:
+                    _LOGGER.debug("WHES: backfill %s al compleet t/m %d.", ckey, end_ms)
+                    continue
+                _LOGGER.info("WHES: backfill %s van %d tot %d.", ckey, t0, end_ms)
+                try:
+                    await self._run_target(section, target_id, t0, end_ms, max(1, chunk_hours) * HOUR_MS, covered)
+                except Exception as e:
+                    # Eén falend device/ammeter stopt de rest niet; het checkpoint laat hem later hervatten
+                    _LOGGER.warning("WHES: backfill %s afgebroken (%s); volgende wordt gestart.", ckey,
+                                    describe_error(e))
+            await self._store.async_save(checkpoints)
+
+    async def _run_target(self, section: str, target_id: str, start_ms: int, end_ms: int, chunk_ms: int,
+                          covered_ms: int) -> None:
+        """Haalt ``start_ms..end_ms`` op; het checkpoint dekt daarna ``covered_ms`` t/m de laatste chunk."""
+        client = self.coordinator.client
+        columns = statistic_columns(section)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=BACKFILL_PIPELINE_DEPTH)
+
+        async def _produce() -> None:
+            t = start_ms
+            try:
+                while t < end_ms:
+                    chunk_end = min(t + chunk_ms, end_ms)
+                    frame = await client.fetch_frame(
+                        section, target_id, t, chunk_end - 1,
+                        sample_by=self.coordinator.sample_by, columns=columns, priority=PRIORITY_BACKFILL,
+                    )
+                    await queue.put((t, chunk_end, frame))
+                    t = chunk_end
+            except Exception as e:
+                await queue.put(e)
+                return
+            await queue.put(None)
+
+        producer = asyncio.create_task(_produce())
+        try:
+            while (item := await queue.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                chunk_start, chunk_end, frame = item
+                self._import_chunk(section, target_id, frame.between(chunk_start, chunk_end - 1))
+                checkpoints = await self._async_checkpoints()
+                checkpoints[f"{section}/{target_id}"] = {"start": covered_ms, "done": chunk_end}
+                self._store.async_delay_save(lambda: self._checkpoints, 10)
+        finally:
+            if not producer.done():
+                producer.cancel()
+
+    def _import_chunk(self, section: str, target_id: str, frame: MetricsFrame) -> None:
+        if not frame:
+            return
+        name_prefix = self.coordinator.entry.data.get(CONF_NAME_PREFIX, DEFAULT_NAME_PREFIX)
+        for key in statistic_columns(section):
+            suffix, unit, _devcls, statecls = SENSOR_MAP[key]
+            cumulative = statecls == SensorStateClass.TOTAL_INCREASING
+            sign = -1.0 if key in INVERTED_POWER_KEYS else 1.0
+            buckets = aggregate_hourly(frame, key, cumulative=cumulative, sign=sign)
+            if not buckets:
+                continue
+            metadata = StatisticMetaData(
+                has_mean=not cumulative,
+                has_sum=cumulative,
+                name=f"{name_prefix} {target_id} {suffix}",
+                source=DOMAIN,
+                statistic_id=statistic_id(section, target_id, key),
+                unit_of_measurement=unit,
+            )
+            stats = []
+            for b in buckets:
+                start = dt_util.utc_from_timestamp(b["hour"] / 1000)
+                if cumulative:
+                    stats.append(StatisticData(start=start, state=b["state"], sum=b["sum"]))
+                else:
+                    stats.append(StatisticData(start=start, mean=b["mean"], min=b["min"], max=b["max"]))
+            async_add_external_statistics(self.hass, metadata, stats)
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+
+def _local_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def align_window(start_ms: int, end_ms: int, step_ms: int) -> tuple[int, int]:
+    """Rondt een window af op ``sample_by``-grenzen: start naar beneden, end naar boven."""
+    start = start_ms - start_ms % step_ms
+    end = end_ms if end_ms % step_ms == 0 else end_ms - end_ms % step_ms + step_ms
+    return start, max(end, start + step_ms)
+
+
+class ClockEstimator:
+    """
+    Schat het klokverschil tussen lokaal en de WHES cloud, en de ingest-lag van de samples.
+
+    ``offset_ms`` (server - lokaal) komt uit de HTTP ``Date``-header (resolutie 1 s, dus als EWMA).
+    Zonder bruikbare header geeft een sample uit de toekomst een ondergrens voor de offset.
+    ``lag_ms`` is de EWMA van (servertijd - timestamp van de nieuwste sample): bucket-positie
+    plus de vertraging waarmee de cloud data beschikbaar maakt.
+    """
+
+    __slots__ = ("alpha", "offset_ms", "lag_ms", "_date_seen")
+
+    def __init__(self, alpha: float) -> None:
+        self.alpha = alpha
+        self.offset_ms = 0.0
+        self.lag_ms: Optional[float] = None
+        self._date_seen = False
+
+    def _ewma(self, old: Optional[float], new: float) -> float:
+        return new if old is None else old + self.alpha * (new - old)
+
+    def server_now(self, local_ms: Optional[int] = None) -> int:
+        return int((_local_ms() if local_ms is None else local_ms) + self.offset_ms)
+
+    def observe_date(self, header: Optional[str], local_ms: int) -> None:
+        if not header:
+            return
+        try:
+            server_ms = parsedate_to_datetime(header).timestamp() * 1000
+        except (TypeError, ValueError, IndexError):
+            return
+        # Date is afgekapt op hele seconden: gemiddeld 500 ms te vroeg
+        sample = server_ms + 500 - local_ms
+        if not self._date_seen:
+            # Eerste echte offset: eerder geschatte lag bevatte het klokverschil nog
+            self.lag_ms = None
+        self.offset_ms = self._ewma(self.offset_ms if self._date_seen else None, sample)
+        self._date_seen = True
+
+    def observe_sample(self, sample_ms: int, local_ms: Optional[int] = None) -> None:
+        lag = self.server_now(local_ms) - sample_ms
+        if lag < 0 and not self._date_seen:
+            # Sample uit de toekomst: de lokale klok loopt minstens zoveel achter
+            self.offset_ms -= lag
+            lag = 0
+        self.lag_ms = self._ewma(self.lag_ms, max(0.0, float(lag)))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "offset_ms": round(self.offset_ms),
+            "lag_ms": None if self.lag_ms is None else round(self.lag_ms),
+            "offset_source": "date_header" if self._date_seen else "samples",
+        }
@@ -4,41 +4,58 @@ import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import HomeAssistant
 from homeassistant.data_entry_flow import FlowResult
+from homeassistant.helpers.selector import (
+    SelectOptionDict, SelectSelector, SelectSelectorConfig, SelectSelectorMode,
+)
 
 from .const import *
-from .api import validate_credentials
+from .api import discover_targets, validate_credentials
+
+
+def _split_ids(value) -> list[str]:
+    """Splitst een komma-gescheiden invoer ('id1, id2') in een lijst unieke IDs."""
+    out: list[str] = []
+    for part in str(value or "").split(","):
+        part = part.strip()
+        if part and part not in out:
+            out.append(part)
+    return out
 
 
 class WhesConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
 
+    def __init__(self) -> None:
+        self._user_input: dict = {}
+        self._topology: dict = {}
+
     async def async_step_user(self, user_input=None) -> FlowResult:
         errors = {}
         if user_input is not None:
-            ok, err = await validate_credentials(self.hass, user_input)
-            if ok:
-                return self.async_create_entry(
-                    title=user_input.get(CONF_NAME_PREFIX, DEFAULT_NAME_PREFIX),
-                    data={
-                        CONF_API_KEY: user_input[CONF_API_KEY],
-                        CONF_API_SECRET: user_input[CONF_API_SECRET],
-                        CONF_PROJECT_ID: user_input[CONF_PROJECT_ID],
-                        CONF_DEVICE_ID: user_input[CONF_DEVICE_ID],
-                        CONF_AMMETER_ID: user_input[CONF_AMMETER_ID],
-                        CONF_BASE_URL: user_input.get(CONF_BASE_URL, DEFAULT_BASE_URL),
-                        CONF_SAMPLE_BY: user_input.get(CONF_SAMPLE_BY, DEFAULT_SAMPLE_BY),
-                        CONF_NAME_PREFIX: user_input.get(CONF_NAME_PREFIX, DEFAULT_NAME_PREFIX),
-                        CONF_SCAN_INTERVAL: user_input.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL),
-                    },
-                )
-            errors["base"] = err or "cannot_connect"
+            # Meerdere IDs (komma-gescheiden) => hub-modus met één gedeelde coordinator
+            device_ids = _split_ids(user_input.get(CONF_DEVICE_ID))
+            ammeter_ids = _split_ids(user_input.get(CONF_AMMETER_ID))
+            if not device_ids and not ammeter_ids:
+                # Geen IDs ingevuld => devices/ammeters van het project ophalen en laten kiezen
+                topology, err = await discover_targets(self.hass, user_input)
+                if topology is not None and (topology["devices"] or topology["ammeters"]):
+                    self._user_input = user_input
+                    self._topology = topology
+                    return await self.async_step_select()
+                errors["base"] = err or "no_targets"
+            else:
+                ok, err = await validate_credentials(
+                    self.hass, {**user_input, CONF_DEVICE_IDS: device_ids, CONF_AMMETER_IDS: ammeter_ids})
+                if ok:
+                    return self._create_entry(user_input, device_ids, ammeter_ids)
+                errors["base"] = err or "cannot_connect"
 
         schema = vol.Schema({
             vol.Required(CONF_API_KEY): str,
             vol.Required(CONF_API_SECRET): str,
             vol.Required(CONF_PROJECT_ID): str,
-            vol.Required(CONF_DEVICE_ID): str,
-            vol.Required(CONF_AMMETER_ID): str,
+            vol.Optional(CONF_DEVICE_ID, default=""): str,
+            vol.Optional(CONF_AMMETER_ID, default=""): str,
             vol.Optional(CONF_BASE_URL, default=DEFAULT_BASE_URL): str,
             vol.Optional(CONF_SAMPLE_BY, default=DEFAULT_SAMPLE_BY): str,
             vol.Optional(CONF_NAME_PREFIX, default=DEFAULT_NAME_PREFIX): str,
@@ -46,6 +63,59 @@ class WhesConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         })
         return self.async_show_form(step_id="user", data_schema=schema, errors=errors)
 
+    async def async_step_select(self, user_input=None) -> FlowResult:
+        """Kies in één keer welke gevonden devices en ammeters in de entry komen."""
+        errors = {}
+        if user_input is not None:
+            device_ids = list(user_input.get(CONF_DEVICE_IDS) or [])
+            ammeter_ids = list(user_input.get(CONF_AMMETER_IDS) or [])
+            if not device_ids and not ammeter_ids:
+                errors["base"] = "no_targets"
+            else:
+                # Alle gekozen devices/ammeters gelijktijdig proben
+                ok, err = await validate_credentials(
+                    self.hass, {**self._user_input, CONF_DEVICE_IDS: device_ids, CONF_AMMETER_IDS: ammeter_ids})
+                if ok:
+                    return self._create_entry(self._user_input, device_ids, ammeter_ids)
+                errors["base"] = err or "cannot_connect"
+
+        def _selector(items: list[dict]) -> SelectSelector:
+            return SelectSelector(SelectSelectorConfig(
+                options=[SelectOptionDict(value=i["id"], label=f"{i['name']} ({i['id']})" if i["name"] != i["id"] else i["id"])
+                         for i in items],
+                multiple=True,
+                mode=SelectSelectorMode.LIST,
+            ))
+
+        devices, ammeters = self._topology["devices"], self._topology["ammeters"]
+        schema = vol.Schema({
+            vol.Optional(CONF_DEVICE_IDS, default=[d["id"] for d in devices]): _selector(devices),
+            vol.Optional(CONF_AMMETER_IDS, default=[a["id"] for a in ammeters]): _selector(ammeters),
+        })
+        return self.async_show_form(step_id="select", data_schema=schema, errors=errors)
+
+    def _create_entry(self, user_input: dict, device_ids: list[str], ammeter_ids: list[str]) -> FlowResult:
+        data = {
+            CONF_API_KEY: user_input[CONF_API_KEY],
+            CONF_API_SECRET: user_input[CONF_API_SECRET],
+            CONF_PROJECT_ID: user_input[CONF_PROJECT_ID],
+            CONF_BASE_URL: user_input.get(CONF_BASE_URL, DEFAULT_BASE_URL),
+            CONF_SAMPLE_BY: user_input.get(CONF_SAMPLE_BY, DEFAULT_SAMPLE_BY),
+            CONF_NAME_PREFIX: user_input.get(CONF_NAME_PREFIX, DEFAULT_NAME_PREFIX),
+            CONF_SCAN_INTERVAL: user_input.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL),
+        }
+        if len(device_ids) > 1 or len(ammeter_ids) > 1:
+            data[CONF_DEVICE_IDS] = device_ids
+            data[CONF_AMMETER_IDS] = ammeter_ids
+            data[CONF_MAX_CONCURRENCY] = DEFAULT_MAX_CONCURRENCY
+        else:
+            data[CONF_DEVICE_ID] = device_ids[0] if device_ids else ""
+            data[CONF_AMMETER_ID] = ammeter_ids[0] if ammeter_ids else ""
+        return self.async_create_entry(
+            title=user_input.get(CONF_NAME_PREFIX, DEFAULT_NAME_PREFIX),
+            data=data,
+        )
+
     async def async_step_reauth(self, user_input=None) -> FlowResult:
         # Simple reauth: ask for key/secret again
         return await self.async_step_user(user_input)
@@ -61,6 +131,10 @@ class WhesOptionsFlow(config_entries.OptionsFlow):
 
     async def async_step_init(self, user_input=None) -> FlowResult:
         if user_input is not None:
+            # Lijst-opties worden komma-gescheiden ingevoerd
+            for key in (CONF_FAST_COLUMNS, CONF_REFRESH_ENTITIES):
+                if key in user_input:
+                    user_input[key] = _split_ids(user_input[key])
             data = {**self.entry.data, **user_input}
             self.hass.config_entries.async_update_entry(self.entry, data=data)
             return self.async_create_entry(title="", data={})
@@ -71,6 +145,42 @@ class WhesOptionsFlow(config_entries.OptionsFlow):
                          default=self.entry.data.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL)): int,
             vol.Optional(CONF_NAME_PREFIX, default=self.entry.data.get(CONF_NAME_PREFIX, DEFAULT_NAME_PREFIX)): str,
             vol.Optional(CONF_BASE_URL, default=self.entry.data.get(CONF_BASE_URL, DEFAULT_BASE_URL)): str,
+            vol.Optional(CONF_TUNED_SESSION,
+                         default=self.entry.data.get(CONF_TUNED_SESSION, False)): bool,
+            vol.Optional(CONF_ADAPTIVE_POLLING,
+                         default=self.entry.data.get(CONF_ADAPTIVE_POLLING, False)): bool,
+            vol.Optional(CONF_MIN_INTERVAL,
+                         default=self.entry.data.get(CONF_MIN_INTERVAL, MIN_SCAN_INTERVAL)): vol.All(
+                int, vol.Range(min=MIN_SCAN_INTERVAL)),
+            vol.Optional(CONF_MAX_INTERVAL,
+                         default=self.entry.data.get(CONF_MAX_INTERVAL, DEFAULT_MAX_INTERVAL)): vol.All(
+                int, vol.Range(min=MIN_SCAN_INTERVAL)),
+            vol.Optional(CONF_MAX_CONCURRENCY,
+                         default=self.entry.data.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)): vol.All(
+                int, vol.Range(min=1, max=32)),
+            vol.Optional(CONF_RATE_LIMIT,
+                         default=self.entry.data.get(CONF_RATE_LIMIT, DEFAULT_RATE_LIMIT)): vol.All(
+                int, vol.Range(min=1)),
+            vol.Optional(CONF_POWER_DEADBAND,
+                         default=self.entry.data.get(CONF_POWER_DEADBAND, DEFAULT_POWER_DEADBAND)): vol.All(
+                vol.Coerce(float), vol.Range(min=0)),
+            vol.Optional(CONF_ENERGY_DEADBAND,
+                         default=self.entry.data.get(CONF_ENERGY_DEADBAND, DEFAULT_ENERGY_DEADBAND)): vol.All(
+                vol.Coerce(float), vol.Range(min=0)),
+            vol.Optional(CONF_MAX_SILENCE,
+                         default=self.entry.data.get(CONF_MAX_SILENCE, DEFAULT_MAX_SILENCE)): vol.All(
+                int, vol.Range(min=0)),
+            vol.Optional(CONF_HISTORY_SNAPSHOT,
+                         default=self.entry.data.get(CONF_HISTORY_SNAPSHOT, False)): bool,
+            vol.Optional(CONF_ARCHIVE, default=self.entry.data.get(CONF_ARCHIVE, False)): bool,
+            vol.Optional(CONF_FAST_INTERVAL,
+                         default=self.entry.data.get(CONF_FAST_INTERVAL, 0)): vol.All(
+                int, vol.Any(0, vol.Range(min=FAST_MIN_INTERVAL))),
+            vol.Optional(CONF_FAST_COLUMNS,
+                         default=", ".join(self.entry.data.get(CONF_FAST_COLUMNS) or DEFAULT_FAST_COLUMNS)): str,
+            vol.Optional(CONF_REFRESH_ENTITIES,
+                         default=", ".join(self.entry.data.get(CONF_REFRESH_ENTITIES) or [])): str,
+            vol.Optional(CONF_REFRESH_EVENT, default=self.entry.data.get(CONF_REFRESH_EVENT, "")): str,
             # (bewust geen IDs/keys hier; dat doe je liever via Reconfigure)
         })
         return self.async_show_form(step_id="init", data_schema=schema)
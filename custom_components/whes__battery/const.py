@@ -5,6 +5,23 @@ CONF_API_SECRET = "api_secret"
 CONF_PROJECT_ID = "project_id"
 CONF_DEVICE_ID = "device_id"
 CONF_AMMETER_ID = "ammeter_id"
+CONF_DEVICE_IDS = "device_ids"
+CONF_AMMETER_IDS = "ammeter_ids"
+CONF_MAX_CONCURRENCY = "max_concurrency"
+CONF_ADAPTIVE_POLLING = "adaptive_polling"
+CONF_MIN_INTERVAL = "min_interval"
+CONF_MAX_INTERVAL = "max_interval"
+CONF_POWER_DEADBAND = "power_deadband"
+CONF_ENERGY_DEADBAND = "energy_deadband"
+CONF_MAX_SILENCE = "max_silence"
+CONF_FAST_INTERVAL = "fast_interval"
+CONF_FAST_COLUMNS = "fast_columns"
+CONF_REFRESH_ENTITIES = "refresh_entities"
+CONF_REFRESH_EVENT = "refresh_event"
+CONF_TUNED_SESSION = "tuned_session"
+CONF_HISTORY_SNAPSHOT = "history_snapshot"
+CONF_RATE_LIMIT = "rate_limit"
+CONF_ARCHIVE = "archive"
 CONF_BASE_URL = "base_url"
 CONF_SAMPLE_BY = "sample_by"
 CONF_NAME_PREFIX = "name_prefix"
@@ -15,5 +32,143 @@ DEFAULT_SAMPLE_BY = "10s"
 DEFAULT_NAME_PREFIX = "WHES"
 DEFAULT_SCAN_INTERVAL = 60
 MIN_SCAN_INTERVAL = 15
+# Adaptief pollen: grenzen, groeifactor bij rust, vermogensdrempel voor "actief" en max. backoff (s)
+DEFAULT_MAX_INTERVAL = 300
+ADAPTIVE_GROWTH = 1.5
+ADAPTIVE_POWER_DELTA_KW = 0.2
+ADAPTIVE_MAX_BACKOFF = 900
+# Resilience: retries voor idempotente reads, circuit breaker en hoe lang een oude bundle geserveerd mag worden
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 4.0
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 60
+MAX_STALE_SECONDS = 900
+# Hub-modus: max. gelijktijdige requests en spreiding (s) van de starttijden binnen een poll-ronde
+DEFAULT_MAX_CONCURRENCY = 4
+MAX_POLL_SPREAD = 5.0
+# Sensor-writes: deadband voor vermogen (W) en energie (kWh); heartbeat (s) waarna altijd geschreven wordt
+DEFAULT_POWER_DEADBAND = 10.0
+DEFAULT_ENERGY_DEADBAND = 0.0
+DEFAULT_MAX_SILENCE = 600
+# Maximale terugkijk-periode na een storing (watermark ouder dan dit wordt afgekapt)
+DEFAULT_CATCHUP_SECONDS = 900
+MAX_CATCHUP_SECONDS = 3600
+
+# Lokale cache van de laatste bundle: debounce van writes (s) en max. leeftijd bij het laden (s)
+CACHE_SAVE_DELAY = 30
+CACHE_MAX_AGE = 86400
+
+# Project-discovery: paginagrootte, max. aantal pagina's en verversinterval van de topologie (s)
+TOPOLOGY_PAGE_SIZE = 100
+TOPOLOGY_MAX_PAGES = 20
+TOPOLOGY_REFRESH_INTERVAL = 6 * 3600
+
+# Fast lane: min. interval (s), cooldown tussen snelle refreshes (s), window per fetch (s) en standaardkolommen
+FAST_MIN_INTERVAL = 5
+FAST_REFRESH_COOLDOWN = 2.0
+FAST_WINDOW_SECONDS = 60
+# Fast lane decodeert alleen de laatste rijen van de response (genoeg voor last_valid bij een paar gaten)
+FAST_TAIL_ROWS = 6
+DEFAULT_FAST_COLUMNS = ["ems_soc", "ems_ac_active_power", "ac_active_power"]
+
+# Klokschatting: EWMA-gewicht voor klokverschil en ingest-lag
+CLOCK_EWMA_ALPHA = 0.2
+
+# HTTP: timeouts (s) per request en instellingen van de eigen sessie per base URL
+REQUEST_TIMEOUT = 20
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+SESSION_LIMIT_PER_HOST = 8
+SESSION_KEEPALIVE = 120
+SESSION_DNS_TTL = 300
+
+# Rate limit per (API key, base URL), gedeeld door alle entries: requests per minuut, burst, pauze na een
+# 429 zonder Retry-After (s) en de max. pauze (s). Lagere prioriteitswaarde gaat voor.
+DEFAULT_RATE_LIMIT = 300
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_PENALTY = 10
+RATE_LIMIT_MAX_PENALTY = 300
+PRIORITY_LIVE = 0
+PRIORITY_VALIDATE = 1
+PRIORITY_BACKFILL = 2
+
+# Ringbuffer voor afgeleide sensoren: bewaarde periode (s), max. samples per metric, rolling window (s),
+# min. SoC-snelheid (%/h) voor vol/leeg-schattingen en debounce van de snapshot naar disk (s)
+HISTORY_SECONDS = 3600
+HISTORY_MAX_SAMPLES = 3600
+ROLLING_WINDOW_SECONDS = 900
+SOC_RATE_MIN = 0.5
+HISTORY_SAVE_DELAY = 300
+
+# Lokaal kolomarchief: map onder de HA-config, flush-interval (s) en max. punten per query-antwoord
+ARCHIVE_DIR = "whes_archive"
+ARCHIVE_FLUSH_INTERVAL = 60
+ARCHIVE_MAX_POINTS = 2000
+
+# Profiler: map voor rapporten, standaard/max. aantal poll-cycles, regels per top-lijst en tracemalloc-frames
+PROFILE_DIR = "whes_profiles"
+PROFILE_DEFAULT_CYCLES = 3
+PROFILE_MAX_CYCLES = 50
+PROFILE_TOP = 30
+PROFILE_TRACEMALLOC_FRAMES = 5
+PROFILE_MAX_SECONDS = 3600  # vangnet: een profiel stopt altijd na een uur, ook als er geen polls meer komen
+
+# Backfill: grootte van een chunk (uren) en max. aantal chunks tegelijk in het geheugen
+DEFAULT_BACKFILL_CHUNK_HOURS = 6
+BACKFILL_PIPELINE_DEPTH = 2
+
+SERVICE_BACKFILL = "backfill"
+SERVICE_REFRESH = "refresh"
+SERVICE_QUERY_ARCHIVE = "query_archive"
+SERVICE_PROFILE = "profile"
+
+EMS_COLUMNS = [
+    "ems_soc",
+    "ems_soh",
+    "ems_state",
+    "ems_dc_power_neg",
+    "ems_dc_power_pos",
+    "ems_ac_active_power",
+    "ems_ac_frequency",
+    "ems_history_input_energy",
+    "ems_history_output_energy",
+    "ems_ac_active_power_A",
+    "ems_ac_active_power_B",
+    "ems_ac_active_power_C",
+]
+AMMETER_COLUMNS = [
+    "ac_active_power",
+    "ac_active_powers_0",
+    "ac_active_powers_1",
+    "ac_active_powers_2",
+    "ac_history_positive_power_in_kwh",
+    "ac_history_negative_power_in_kwh",
+]
+
+# Vermogenskolommen waarvan per poll-window mean/min/max/energie wordt berekend
+AGGREGATE_COLUMNS = {
+    "ems": ["ems_ac_active_power", "ems_ac_active_power_A", "ems_ac_active_power_B", "ems_ac_active_power_C"],
+    "ammeter": ["ac_active_power", "ac_active_powers_0", "ac_active_powers_1", "ac_active_powers_2"],
+}
+
+# Metrics die in de ringbuffer gaan, en per afgeleide sensor de kolom waarvan hij afhangt
+HISTORY_COLUMNS = {
+    "ems": ["ems_soc", "ems_ac_active_power"],
+    "ammeter": ["ac_active_power"],
+}
+DERIVED_COLUMNS = {
+    "ems": {
+        "ems_soc_rate": "ems_soc",
+        "ems_time_to_full": "ems_soc",
+        "ems_time_to_empty": "ems_soc",
+        "ems_ac_active_power_avg_15m": "ems_ac_active_power",
+    },
+    "ammeter": {
+        "ac_active_power_avg_15m": "ac_active_power",
+        "ac_quarter_demand": "ac_active_power",
+        "ac_peak_demand": "ac_active_power",
+    },
+}
 
 PLATFORMS = ["sensor"]
@@ -1,43 +1,532 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import time
 from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.event import (
+    async_call_later, async_track_state_change_event, async_track_time_interval,
+)
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
 from .const import *
-from .api import WhesClient
+from .aggregate import AGGREGATE_SUFFIXES
+from .api import WhesClient, now_ms, sample_by_ms
+from .archive import SampleArchive
+from .history import SampleHistory
+from .profiling import PollProfiler, report_path, write_report
+from .resilience import describe_error
+from .scheduler import AdaptiveInterval
+from .session import WhesSession, async_acquire_session, async_release_session
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def entry_targets(d: dict) -> Tuple[List[str], List[str]]:
+    """Geeft (device_ids, ammeter_ids) van een entry; enkelvoudige entries leveren lijsten van één."""
+    device_ids = list(d.get(CONF_DEVICE_IDS) or ([d[CONF_DEVICE_ID]] if d.get(CONF_DEVICE_ID) else []))
+    ammeter_ids = list(d.get(CONF_AMMETER_IDS) or ([d[CONF_AMMETER_ID]] if d.get(CONF_AMMETER_ID) else []))
+    return device_ids, ammeter_ids
+
+
+def is_hub_entry(d: dict) -> bool:
+    """Hub-entries bewaren lijsten van devices/ammeters in plaats van één paar."""
+    return CONF_DEVICE_IDS in d or CONF_AMMETER_IDS in d
+
+
+def metric_unique_id(section: str, target_id: str, key: str, hub: bool) -> str:
+    """unique_id van een metric-sensor; enkelvoudige entries houden het oude formaat."""
+    return f"whes_{section}_{target_id}_{key}" if hub else f"whes_{section}_{key}"
+
+
+def column_entity_keys(section: str) -> Dict[str, List[str]]:
+    """Per API-kolom de sensor-keys die ervan afhangen (de kolom zelf plus eventuele window-aggregaten)."""
+    columns = EMS_COLUMNS if section == "ems" else AMMETER_COLUMNS
+    aggregated = AGGREGATE_COLUMNS[section]
+    derived = DERIVED_COLUMNS[section]
+    return {
+        col: [col] + ([f"{col}_{s}" for s in AGGREGATE_SUFFIXES] if col in aggregated else [])
+        + [key for key, source in derived.items() if source == col]
+        for col in columns
+    }
+
+
+def changed_targets(old: Optional[dict], new: dict) -> set:
+    """(sectie, id) waarvan de rij, beschikbaarheid, stale-vlag of cache-status veranderd is."""
+    changed = set()
+    cache_changed = (old or {}).get("cache_age") != new.get("cache_age")
+    for section in ("ems", "ammeter"):
+        old_rows = (old or {}).get(section) or {}
+        new_rows = new.get(section) or {}
+        old_stale = set(((old or {}).get("stale") or {}).get(section) or ())
+        new_stale = set((new.get("stale") or {}).get(section) or ())
+        for target_id in set(old_rows) | set(new_rows):
+            if cache_changed or old_rows.get(target_id) != new_rows.get(target_id) or \
+                    (target_id in old_stale) != (target_id in new_stale):
+                changed.add((section, target_id))
+    return changed
+
+
 class WhesCoordinator(DataUpdateCoordinator[dict]):
+    """
+    Eén coordinator per entry. Alle devices en ammeters van de entry worden in één gedeelde
+    poll-ronde opgehaald; data heeft de vorm ``{"ems": {id: rij}, "ammeter": {id: rij}, "stale": {...}}``.
+    """
+
     def __init__(self, hass: HomeAssistant, entry) -> None:
         self.entry = entry
         d = entry.data
         interval = max(MIN_SCAN_INTERVAL, int(d.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL)))
 
+        self.device_ids, self.ammeter_ids = entry_targets(d)
+        base_url = d.get(CONF_BASE_URL, DEFAULT_BASE_URL)
+        # Optioneel een eigen, getunede sessie per base URL (gedeeld door alle entries die hem gebruiken)
+        self._shared_session: WhesSession | None = None
+        if d.get(CONF_TUNED_SESSION, False):
+            self._shared_session = async_acquire_session(hass, base_url)
+            entry.async_on_unload(lambda: async_release_session(hass, base_url))
         self._client = WhesClient(
-            session=async_get_clientsession(hass),
-            base_url=d.get(CONF_BASE_URL, DEFAULT_BASE_URL),
+            session=self._shared_session.session if self._shared_session else async_get_clientsession(hass),
+            base_url=base_url,
             api_key=d[CONF_API_KEY],
             api_secret=d[CONF_API_SECRET],
             project_id=d[CONF_PROJECT_ID],
-            device_id=d[CONF_DEVICE_ID],
-            ammeter_id=d[CONF_AMMETER_ID],
         )
+        self._client.prime_signing(self.device_ids, self.ammeter_ids)
+        if d.get(CONF_RATE_LIMIT):
+            # Budget is per key gedeeld; de laatst geladen entry bepaalt de limiet
+            self._client.limiter.configure(int(d[CONF_RATE_LIMIT]) / 60, RATE_LIMIT_BURST)
         self._sample_by = d.get(CONF_SAMPLE_BY, DEFAULT_SAMPLE_BY)
         self._poll_seconds = interval
+        self._max_concurrency = max(1, int(d.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)))
+        # Spreid starttijden alleen als er meer calls zijn dan in één keer mogen lopen
+        n_calls = len(self.device_ids) + len(self.ammeter_ids)
+        self._spread = min(MAX_POLL_SPREAD, interval / 4) if n_calls > self._max_concurrency else 0.0
+
+        self._last_success: float | None = None
+        self._unconfigured: Dict[str, List[str]] = {"devices": [], "ammeters": []}
+        # Devices/ammeters waarvan de laatste update iets veranderde; sensoren van de rest slaan de update over
+        self.changed_targets: set = set()
+        self._catchup_seconds = DEFAULT_CATCHUP_SECONDS
+        self._store: Store = Store(hass, 1, f"{DOMAIN}.cache.{entry.entry_id}")
+
+        # Ringbuffer met recente samples voor de afgeleide sensoren, optioneel met snapshot naar disk
+        step_ms = sample_by_ms(self._sample_by)
+        self.history = SampleHistory(min(HISTORY_MAX_SAMPLES, HISTORY_SECONDS * 1000 // step_ms + 1))
+        self._client.history = self.history
+        self._history_store: Store | None = None
+        if d.get(CONF_HISTORY_SNAPSHOT, False):
+            self._history_store = Store(hass, 1, f"{DOMAIN}.history.{entry.entry_id}")
+
+        # Optioneel lokaal kolomarchief van alle ruwe samples, per project gedeeld door entries
+        self.archive: SampleArchive | None = None
+        if d.get(CONF_ARCHIVE, False):
+            self.archive = SampleArchive(hass.config.path(ARCHIVE_DIR, str(d[CONF_PROJECT_ID])))
+            self._client.archive = self.archive
+
+        self._adaptive: AdaptiveInterval | None = None
+        if d.get(CONF_ADAPTIVE_POLLING, False):
+            self._adaptive = AdaptiveInterval(
+                min_s=max(MIN_SCAN_INTERVAL, int(d.get(CONF_MIN_INTERVAL, MIN_SCAN_INTERVAL))),
+                max_s=int(d.get(CONF_MAX_INTERVAL, DEFAULT_MAX_INTERVAL)),
+                start_s=interval,
+            )
 
         super().__init__(hass, logger=_LOGGER, name="whes_coordinator", update_interval=timedelta(seconds=interval))
 
+        # Alleen kolommen met minstens één ingeschakelde entity worden opgevraagd
+        self._columns: Dict[Tuple[str, str], List[str]] = {}
+        self._entity_ids: set = set()
+        self._update_columns()
+        entry.async_on_unload(hass.bus.async_listen(er.EVENT_ENTITY_REGISTRY_UPDATED, self._async_registry_updated))
+
+        # Fast lane: kleine kolomset, los van de volledige bundle; debounce + cooldown als rate limit
+        known = set(EMS_COLUMNS) | set(AMMETER_COLUMNS)
+        self._fast_columns = [c for c in d.get(CONF_FAST_COLUMNS) or DEFAULT_FAST_COLUMNS if c in known]
+        self._fast_pending: set = set()
+        self._fast_debouncer = Debouncer(
+            hass, _LOGGER, cooldown=FAST_REFRESH_COOLDOWN, immediate=True, function=self._async_fast_refresh)
+
+        # whes.profile: laatste rapport (voor diagnostics) en start van de lopende poll-cycle
+        self.last_profile: Dict[str, Any] | None = None
+        self._profile_to_file = False
+        self._profile_cycle_t0: float | None = None
+        self._profile_timeout = None
+        # Unload/reload midden in een profiel: cProfile en tracemalloc mogen niet blijven lopen
+        entry.async_on_unload(self._async_abort_profile)
+
+    @property
+    def client(self) -> WhesClient:
+        return self._client
+
+    @property
+    def connection_stats(self) -> Dict[str, Any] | None:
+        """TraceConfig-tellers van de eigen sessie (None bij de gedeelde HA-sessie)."""
+        return self._shared_session.stats.as_dict() if self._shared_session else None
+
+    @property
+    def profiler(self) -> PollProfiler | None:
+        return self._client.profiler
+
+    @property
+    def sample_by(self) -> str:
+        return self._sample_by
+
+    @property
+    def columns(self) -> Dict[Tuple[str, str], List[str]]:
+        return self._columns
+
+    @callback
+    def _async_registry_updated(self, event: Event) -> None:
+        """Alleen aanmaken/verwijderen en (de)activeren van entities van deze entry raakt de kolommen."""
+        data = event.data
+        action, entity_id = data.get("action"), data.get("entity_id")
+        if action == "remove":
+            if entity_id in self._entity_ids:
+                self._update_columns()
+            return
+        if action == "update" and not {"disabled_by", "entity_id"} & set(data.get("changes") or ()):
+            return
+        entity = er.async_get(self.hass).async_get(entity_id)
+        if entity is not None and entity.config_entry_id == self.entry.entry_id:
+            self._update_columns()
+
+    @callback
+    def _update_columns(self) -> None:
+        """
+        Leidt de kolommen per device/ammeter af uit de entity registry. Entities die nog niet in de
+        registry staan (eerste setup) tellen als ingeschakeld.
+        """
+        registry = er.async_get(self.hass)
+        hub = is_hub_entry(self.entry.data)
+
+        entity_ids = set()
+
+        def _enabled(section: str, target_id: str, key: str) -> bool:
+            entity_id = registry.async_get_entity_id("sensor", DOMAIN, metric_unique_id(section, target_id, key, hub))
+            if entity_id is None:
+                return True
+            entity_ids.add(entity_id)
+            entity = registry.async_get(entity_id)
+            return entity is None or not entity.disabled
+
+        columns: Dict[Tuple[str, str], List[str]] = {}
+        for section, targets in (("ems", self.device_ids), ("ammeter", self.ammeter_ids)):
+            entity_keys = column_entity_keys(section)
+            for target_id in targets:
+                # Lijst i.p.v. generator: alle entity_ids moeten in _entity_ids komen, ook na de eerste treffer
+                columns[(section, target_id)] = [
+                    col for col, keys in entity_keys.items() if any([_enabled(section, target_id, k) for k in keys])
+                ]
+        self._entity_ids = entity_ids
+        if columns != self._columns:
+            _LOGGER.debug("WHES: gevraagde kolommen: %s", {f"{s}/{t}": len(c) for (s, t), c in columns.items()})
+            self._columns = columns
+
+    @callback
+    def async_setup_fast_lane(self) -> None:
+        """Start de fast-lane timer en de optionele state-/event-triggers van deze entry."""
+        d = self.entry.data
+        fast_interval = int(d.get(CONF_FAST_INTERVAL) or 0)
+        if fast_interval:
+            self.entry.async_on_unload(async_track_time_interval(
+                self.hass, self._async_fast_tick, timedelta(seconds=max(FAST_MIN_INTERVAL, fast_interval))))
+        entities = list(d.get(CONF_REFRESH_ENTITIES) or [])
+        if entities:
+            self.entry.async_on_unload(async_track_state_change_event(self.hass, entities, self._async_fast_tick))
+        if d.get(CONF_REFRESH_EVENT):
+            self.entry.async_on_unload(self.hass.bus.async_listen(d[CONF_REFRESH_EVENT], self._async_fast_tick))
+        self.entry.async_on_unload(self._fast_debouncer.async_cancel)
+
+    @callback
+    def async_setup_archive(self) -> None:
+        """Schrijft het archief periodiek weg in de executor, en een laatste keer bij unload."""
+        if self.archive is None:
+            return
+        self.entry.async_on_unload(async_track_time_interval(
+            self.hass, self.async_flush_archive, timedelta(seconds=ARCHIVE_FLUSH_INTERVAL)))
+        self.entry.async_on_unload(
+            lambda: self.hass.async_create_background_task(self.async_flush_archive(), f"{DOMAIN}_archive_flush"))
+
+    async def async_flush_archive(self, _now=None) -> None:
+        if self.archive is None:
+            return
+        try:
+            rows = await self.hass.async_add_executor_job(self.archive.flush)
+        except OSError as e:
+            _LOGGER.warning("WHES: archief niet weg te schrijven: %r", e)
+            return
+        if rows:
+            _LOGGER.debug("WHES: %d rijen gearchiveerd.", rows)
+
+    async def async_start_profile(self, cycles: int, *, use_cprofile: bool = False,
+                                  use_tracemalloc: bool = False, to_file: bool = True) -> None:
+        """Profileert de volgende ``cycles`` polls; de eerste wordt direct aangevraagd."""
+        profiler = PollProfiler(cycles, use_cprofile=use_cprofile, use_tracemalloc=use_tracemalloc)
+        profiler.start()
+        self._profile_to_file = to_file
+        self._profile_cycle_t0 = None
+        self._client.profiler = profiler
+        self._profile_timeout = async_call_later(self.hass, PROFILE_MAX_SECONDS, self._async_stop_profile)
+        _LOGGER.info("WHES: profiling gestart voor %d poll-cycles.", cycles)
+        await self.async_request_refresh()
+
+    def _take_profiler(self) -> PollProfiler | None:
+        profiler, self._client.profiler = self._client.profiler, None
+        self._profile_cycle_t0 = None
+        if self._profile_timeout is not None:
+            self._profile_timeout()
+            self._profile_timeout = None
+        return profiler
+
+    @callback
+    def _async_stop_profile(self, _now=None) -> None:
+        """Laatste cycle of timeout: profiler uit, rapport op de achtergrond."""
+        profiler = self._take_profiler()
+        if profiler is None:
+            return
+        profiler.stop()
+        if _now is not None:
+            _LOGGER.warning("WHES: profiel gestopt na %ds met %d van %d cycles.",
+                            PROFILE_MAX_SECONDS, profiler.completed, profiler.cycles)
+        self.hass.async_create_background_task(
+            self._async_finish_profile(profiler), f"{DOMAIN}_profile_{self.entry.entry_id}")
+
+    @callback
+    def _async_abort_profile(self) -> None:
+        profiler = self._take_profiler()
+        if profiler is not None:
+            profiler.close()
+            _LOGGER.info("WHES: lopend profiel afgebroken (entry ontladen).")
+
+    async def _async_finish_profile(self, profiler: PollProfiler) -> None:
+        report = await self.hass.async_add_executor_job(profiler.report)
+        if self._profile_to_file:
+            path = report_path(self.hass.config.path(PROFILE_DIR), self.entry.entry_id)
+            try:
+                await self.hass.async_add_executor_job(write_report, path, report)
+                report["file"] = path
+            except OSError as e:
+                _LOGGER.warning("WHES: profiel niet weg te schrijven naar %s: %r", path, e)
+        self.last_profile = report
+        _LOGGER.info("WHES: profiling klaar na %d cycles%s.", report["cycles"],
+                     f" ({report['file']})" if "file" in report else "")
+
+    @callback
+    def _profile_cycle_end(self, profiler: PollProfiler, now: float) -> None:
+        """Einde van een poll-cycle (ook een mislukte); stopt het profiel na de laatste."""
+        if self._profile_cycle_t0 is not None:
+            profiler.add("cycle", now - self._profile_cycle_t0)
+        self._profile_cycle_t0 = None
+        if profiler.cycle_done():
+            self._async_stop_profile()
+
+    @callback
+    def async_update_listeners(self) -> None:
+        profiler = self._client.profiler
+        if profiler is None:
+            super().async_update_listeners()
+            return
+        t0 = time.perf_counter()
+        super().async_update_listeners()
+        t1 = time.perf_counter()
+        profiler.add("dispatch", t1 - t0)
+        if self._profile_cycle_t0 is not None:
+            # Einde van een volledige poll-cycle: fetch + dispatch naar alle sensoren
+            self._profile_cycle_end(profiler, t1)
+
+    async def _async_fast_tick(self, _arg: Any = None) -> None:
+        await self.async_request_fast_refresh()
+
+    async def async_request_fast_refresh(self, columns: Optional[Iterable[str]] = None) -> None:
+        """
+        Vraagt een snelle refresh van ``columns`` (standaard de fast-lane kolommen). Aanvragen binnen
+        de cooldown worden samengevoegd tot één refresh met de vereniging van alle gevraagde kolommen.
+        """
+        self._fast_pending.update(columns or self._fast_columns)
+        await self._fast_debouncer.async_call()
+
+    async def _async_fast_refresh(self) -> None:
+        columns, self._fast_pending = self._fast_pending or set(self._fast_columns), set()
+        if not self.data or not columns:
+            return
+        jobs = []
+        for section, targets, section_columns in (("ems", self.device_ids, EMS_COLUMNS),
+                                                  ("ammeter", self.ammeter_ids, AMMETER_COLUMNS)):
+            for target_id in targets:
+                enabled = self._columns.get((section, target_id), section_columns)
+                wanted = [c for c in section_columns if c in columns and c in enabled]
+                if wanted:
+                    jobs.append((section, target_id, wanted))
+        if not jobs:
+            return
+
+        sem = asyncio.Semaphore(self._max_concurrency)
+
+        async def _one(section: str, target_id: str, wanted: List[str]):
+            async with sem:
+                return await self._client.fetch_columns(section, target_id, wanted, sample_by=self._sample_by)
+
+        results = await asyncio.gather(*(_one(*job) for job in jobs), return_exceptions=True)
+        data = dict(self.data)
+        changed = set()
+        for (section, target_id, _wanted), res in zip(jobs, results):
+            if isinstance(res, BaseException):
+                if not isinstance(res, Exception):
+                    raise res
+                _LOGGER.debug("WHES: fast lane %s %s mislukt: %s", section, target_id, describe_error(res))
+                continue
+            ts, values = res
+            watermark = self._client.watermark(section, target_id)
+            if not values or (ts is not None and watermark is not None and ts < watermark):
+                # Niets nieuws t.o.v. de gewone poll
+                continue
+            rows = data[section] = dict(data.get(section) or {})
+            rows[target_id] = {**(rows.get(target_id) or {}), **values}
+            changed.add((section, target_id))
+        if changed:
+            self.changed_targets = changed
+            # Geen async_set_updated_data: dat zou de timer van de volledige poll verschuiven
+            self.data = data
+            self.async_update_listeners()
+
+    @property
+    def unconfigured(self) -> Dict[str, List[str]]:
+        """Devices/ammeters uit de project-topologie die niet in deze entry zitten."""
+        return self._unconfigured
+
+    async def async_refresh_topology(self, _now=None) -> None:
+        """Ververst de project-topologie (traag interval); meldt nieuwe, niet-geconfigureerde devices."""
+        try:
+            topology = await self._client.discover(max_age=TOPOLOGY_REFRESH_INTERVAL / 2)
+        except Exception as e:
+            _LOGGER.debug("WHES: project-topologie niet op te halen: %s", describe_error(e))
+            return
+        unconfigured = {
+            "devices": [d["id"] for d in topology["devices"] if d["id"] not in self.device_ids],
+            "ammeters": [a["id"] for a in topology["ammeters"] if a["id"] not in self.ammeter_ids],
+        }
+        if unconfigured != self._unconfigured and (unconfigured["devices"] or unconfigured["ammeters"]):
+            _LOGGER.info("WHES: project %s bevat niet-geconfigureerde devices %s en ammeters %s.",
+                         self.entry.data.get(CONF_PROJECT_ID), unconfigured["devices"], unconfigured["ammeters"])
+        self._unconfigured = unconfigured
+
+    async def async_load_cache(self) -> bool:
+        """
+        Laadt de laatst bewaarde bundle zodat entities direct een (stale) waarde hebben.
+        Geeft False als er geen bruikbare cache is; dan moet de eerste refresh blokkerend gebeuren.
+        """
+        try:
+            cached = await self._store.async_load()
+        except Exception as e:  # kapotte cache mag setup nooit blokkeren
+            _LOGGER.warning("WHES: lokale cache niet leesbaar (%r); wordt genegeerd.", e)
+            return False
+        if not cached or not isinstance(cached.get("data"), dict):
+            return False
+        age_ms = now_ms() - int(cached.get("sample_ms") or cached.get("saved_ms") or 0)
+        if age_ms > CACHE_MAX_AGE * 1000:
+            return False
+
+        data = cached["data"]
+        ems = {i: row for i, row in (data.get("ems") or {}).items() if i in self.device_ids}
+        ammeter = {i: row for i, row in (data.get("ammeter") or {}).items() if i in self.ammeter_ids}
+        if not ems and not ammeter:
+            return False
+        # Telt als laatste succes van age_ms geleden, zodat MAX_STALE_SECONDS ook voor de cache geldt
+        self._last_success = time.monotonic() - age_ms / 1000
+        data = {
+            "ems": ems,
+            "ammeter": ammeter,
+            "stale": {"ems": list(ems), "ammeter": list(ammeter)},
+            "cache_age": round(age_ms / 1000),
+        }
+        self.changed_targets = changed_targets(self.data, data)
+        self.async_set_updated_data(data)
+        _LOGGER.debug("WHES: cache geladen (%d s oud).", age_ms // 1000)
+        return True
+
+    async def async_load_history(self) -> None:
+        """Laadt de ringbuffer-snapshot; samples ouder dan HISTORY_SECONDS vervallen, de maandpiek blijft."""
+        if self._history_store is None:
+            return
+        try:
+            snapshot = await self._history_store.async_load()
+        except Exception as e:  # kapotte snapshot mag setup nooit blokkeren
+            _LOGGER.warning("WHES: snapshot van de ringbuffer niet leesbaar (%r); wordt genegeerd.", e)
+            return
+        if not snapshot or not isinstance(snapshot.get("history"), dict):
+            return
+        history = dict(snapshot["history"])
+        if now_ms() - int(snapshot.get("saved_ms") or 0) > HISTORY_SECONDS * 1000:
+            history.pop("buffers", None)
+        self.history.load(history)
+
+    def _history_snapshot(self) -> Dict[str, Any]:
+        return {"saved_ms": now_ms(), "history": self.history.as_dict()}
+
+    def _cache_snapshot(self) -> Dict[str, Any]:
+        data = self.data or {}
+        return {
+            "saved_ms": now_ms(),
+            "sample_ms": self._client.newest_sample_ms(),
+            "data": {"ems": data.get("ems") or {}, "ammeter": data.get("ammeter") or {}},
+        }
+
     async def _async_update_data(self) -> dict:
+        if self._client.profiler is not None:
+            self._profile_cycle_t0 = time.perf_counter()
         try:
-            return await self._client.fetch_bundle(
+            data = await self._client.fetch_fleet(
+                self.device_ids,
+                self.ammeter_ids,
+                max_concurrency=self._max_concurrency,
+                spread_seconds=self._spread,
+                columns=self._columns,
                 poll_seconds=self._poll_seconds,
                 sample_by=self._sample_by,
+                catchup_seconds=self._catchup_seconds,
             )
         except Exception as e:
+            if self._adaptive is not None:
+                self.update_interval = timedelta(seconds=self._adaptive.on_error(e))
+            if self.data and self._last_success is not None and \
+                    time.monotonic() - self._last_success < MAX_STALE_SECONDS:
+                # Liever de laatste goede bundle (gemarkeerd als stale) dan alle entities unavailable
+                _LOGGER.warning("WHES: update mislukt (%s); laatste goede data wordt als stale geserveerd.",
+                                describe_error(e))
+                data = {
+                    **self.data,
+                    "stale": {"ems": list(self.device_ids), "ammeter": list(self.ammeter_ids)},
+                }
+                self.changed_targets = changed_targets(self.data, data)
+                return data
+            profiler = self._client.profiler
+            if profiler is not None:
+                # HA roept listeners alleen aan bij de overgang naar mislukt; de cycle telt ook zonder dispatch
+                profiler.count("cycle_failed")
+                self._profile_cycle_end(profiler, time.perf_counter())
             raise UpdateFailed(str(e)) from e
+
+        self._last_success = time.monotonic()
+        self.changed_targets = changed_targets(self.data, data)
+        # Loopt de cloud achter, dan moet het catch-up window minstens de achterstand plus één poll dekken
+        age = data.get("sample_age")
+        self._catchup_seconds = DEFAULT_CATCHUP_SECONDS if age is None else \
+            int(min(MAX_CATCHUP_SECONDS, max(DEFAULT_CATCHUP_SECONDS, age + self._poll_seconds)))
+        # Gedebounced: bij snelle polls hooguit één schrijfactie per CACHE_SAVE_DELAY
+        self._store.async_delay_save(self._cache_snapshot, CACHE_SAVE_DELAY)
+        if self._history_store is not None:
+            self._history_store.async_delay_save(self._history_snapshot, HISTORY_SAVE_DELAY)
+
+        if self._adaptive is not None:
+            # Het volgende tijdstip wordt pas na deze update gepland, dus dit interval geldt direct
+            self.update_interval = timedelta(
+                seconds=self._adaptive.on_success(data, self._client.newest_sample_ms()))
+        return data
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Optional
+
+try:  # orjson is optioneel (HA levert het mee); anders de stdlib-parser
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+_LOGGER = logging.getLogger(__name__)
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+_ROWS_KEY = b'"rows"'
+
+
+def loads(raw: bytes) -> Any:
+    """Parseert JSON-bytes met de snelste beschikbare backend; fouten zijn altijd ValueError."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _quotes(raw: bytes, start: int = 0, end: Optional[int] = None) -> int:
+    """Aantal niet-ge-escapete aanhalingstekens; even = positie ``end`` ligt buiten een string."""
+    chunk = raw[start:end]
+    quotes = chunk.count(b'"')
+    # Alleen na een oneven aantal backslashes is een quote ge-escapet; "a\\" sluit de string wél af
+    pos = chunk.find(b'\\"')
+    while pos != -1:
+        run = 1
+        while pos - run >= 0 and chunk[pos - run] == 0x5C:
+            run += 1
+        if run % 2:
+            quotes -= 1
+        pos = chunk.find(b'\\"', pos + 2)
+    return quotes
+
+
+def _rows_span(raw: bytes) -> Optional[tuple[int, int]]:
+    """(positie van '[', positie van de bijbehorende ']') van de rows-array, of None als onzeker."""
+    pos = raw.find(_ROWS_KEY)
+    while pos != -1 and _quotes(raw, 0, pos) % 2:
+        pos = raw.find(_ROWS_KEY, pos + 1)
+    if pos == -1:
+        return None
+    colon = raw.find(b":", pos + len(_ROWS_KEY))
+    if colon == -1:
+        return None
+    start = colon + 1
+    while start < len(raw) and raw[start] in b" \t\r\n":
+        start += 1
+    if start >= len(raw) or raw[start] != ord("["):
+        return None
+    # Rijen zijn platte arrays met scalars: de rows-array eindigt bij de eerste ']]' buiten een string
+    end = raw.find(b"]]", start)
+    while end != -1 and _quotes(raw, start, end) % 2:
+        end = raw.find(b"]]", end + 1)
+    return None if end == -1 else (start, end + 1)
+
+
+def decode_tail(raw: bytes, tail_rows: int) -> Optional[dict]:
+    """
+    Decodeert een metrics-response met alleen de laatste ``tail_rows`` rijen: de envelop
+    (columns/metadata) en de staart van de rows-array worden los geparsed, de rest wordt nooit
+    een Python-object. Geeft None als de bytes niet het verwachte formaat hebben.
+    """
+    span = _rows_span(raw)
+    if span is None:
+        return None
+    start, end = span
+    # Terug vanaf het einde: elke '[' buiten een string is het begin van een rij
+    cut, found = end, 0
+    while found < tail_rows:
+        cut = raw.rfind(b"[", start + 1, cut)
+        if cut == -1:
+            return None
+        if _quotes(raw, cut, end) % 2 == 0:
+            found += 1
+    try:
+        envelope = loads(raw[:start] + b"[]" + raw[end + 1:])
+        rows = loads(b"[" + raw[cut:end] + b"]")
+    except ValueError:
+        return None
+    data = envelope.get("data") if isinstance(envelope, dict) else None
+    if not isinstance(data, dict) or not isinstance(rows, list):
+        return None
+    data["rows"] = rows
+    return envelope
+
+
+def decode_payload(raw: bytes, tail_rows: Optional[int] = None) -> Any:
+    """
+    Decodeert een response-body in één keer vanuit de bytes. Met ``tail_rows`` alleen de laatste
+    rijen van een metrics-response; lukt dat niet, dan volledig parsen en daarna afkappen.
+    """
+    if not raw:
+        return None
+    if tail_rows:
+        data = decode_tail(raw, tail_rows)
+        if data is not None:
+            return data
+        _LOGGER.debug("WHES: tail-decode niet mogelijk; volledige parse.")
+        data = loads(raw)
+        rows = ((data or {}).get("data") or {}).get("rows") if isinstance(data, dict) else None
+        if isinstance(rows, list):
+            data["data"]["rows"] = rows[-tail_rows:]
+        return data
+    return loads(raw)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import *
+from .coordinator import WhesCoordinator
+
+TO_REDACT = {CONF_API_KEY, CONF_API_SECRET}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    coordinator: WhesCoordinator = hass.data[DOMAIN][entry.entry_id]
+    return {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "coordinator": {
+            "last_update_success": coordinator.last_update_success,
+            "update_interval_s": coordinator.update_interval.total_seconds() if coordinator.update_interval else None,
+            "devices": coordinator.device_ids,
+            "ammeters": coordinator.ammeter_ids,
+            "stale": (coordinator.data or {}).get("stale"),
+            "sample_age_s": (coordinator.data or {}).get("sample_age"),
+        },
+        "endpoints": coordinator.client.stats.as_dict(),
+        "circuit_breakers": {target: b.as_dict() for target, b in coordinator.client.breakers.items()},
+        "rate_limiter": coordinator.client.limiter.as_dict(),
+        "clock": coordinator.client.clock.as_dict(),
+        "connections": coordinator.connection_stats,
+        "history": coordinator.history.summary(),
+        "archive": None if coordinator.archive is None else {
+            "root": coordinator.archive.root, "rows_written": coordinator.archive.rows_written,
+        },
+        "topology": coordinator.client.topology,
+        "unconfigured": coordinator.unconfigured,
+        "profile": coordinator.last_profile,
+    }
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from collections.abc import Sequence
+from typing import Any, Callable, Dict, List, Optional, Union
+
+try:  # NumPy is optioneel; zonder NumPy blijven de array-kolommen gewoon werken
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+_LOGGER = logging.getLogger(__name__)
+
+Column = Union[array, List[Any]]
+
+_NAN = float("nan")
+
+
+def _unique_columns(cols: List[str]) -> List[str]:
+    """
+    Zorgt dat kolomnamen uniek worden (col, col_2, col_3, ...),
+    voor het geval de API dubbele kolomnamen retourneert.
+    """
+    seen = Counter()
+    out: List[str] = []
+    for c in cols:
+        seen[c] += 1
+        out.append(c if seen[c] == 1 else f"{c}_{seen[c]}")
+    return out
+
+
+def _coerce_cells(values, coercer: Callable[[Any], Any], name: str) -> List[Any]:
+    """Trage fallback per cel: laat de ruwe waarde staan als coercion faalt."""
+    out = []
+    for v in values:
+        try:
+            out.append(coercer(v))
+        except Exception as ce:
+            _LOGGER.debug("WHES: coercion fout op kolom '%s': %r (behoud ruwe waarde).", name, ce)
+            out.append(v)
+    return out
+
+
+def _float_or_nan(v: Any) -> float:
+    try:
+        return _NAN if v is None else float(v)
+    except (TypeError, ValueError):
+        return _NAN
+
+
+def _double_column(values, name: str) -> Column:
+    try:
+        if None in values:
+            return array("d", [_NAN if v is None else float(v) for v in values])
+        return array("d", values)
+    except (TypeError, ValueError):
+        # Strings of rommel in de kolom: per cel; wat geen getal is wordt NaN (= geen waarde)
+        column = array("d", [_float_or_nan(v) for v in values])
+        _LOGGER.debug("WHES: niet-numerieke waarden in DOUBLE-kolom '%s' als leeg behandeld.", name)
+        return column
+
+
+def _timestamp_column(values, name: str) -> Column:
+    if None in values:
+        # array('q') kent geen null; met lege timestamps blijft het een lijst
+        return _coerce_cells(values, lambda v: None if v is None else int(v), name)
+    try:
+        return array("q", values)
+    except (TypeError, ValueError, OverflowError):
+        try:
+            return array("q", [int(v) for v in values])
+        except (TypeError, ValueError, OverflowError):
+            return _coerce_cells(values, int, name)
+
+
+def _varchar_column(values, name: str) -> Column:
+    return [None if v is None else str(v) for v in values]
+
+
+_COLUMN_DECODERS: Dict[str, Callable[[Any, str], Column]] = {
+    "DOUBLE": _double_column,
+    "VARCHAR": _varchar_column,
+    "TIMESTAMP": _timestamp_column,
+}
+
+
+def _take(col: Column, idx: List[int]) -> Column:
+    if isinstance(col, array):
+        return array(col.typecode, [col[i] for i in idx])
+    return [col[i] for i in idx]
+
+
+def _cell(col: Column, idx: int) -> Any:
+    v = col[idx]
+    # NaN in een double-kolom betekent "geen waarde"
+    if v != v and isinstance(col, array):
+        return None
+    return v
+
+
+class MetricsRowsView(Sequence):
+    """Luie list-of-dicts weergave over een MetricsFrame; rijen worden pas bij opvragen gebouwd."""
+
+    __slots__ = ("_frame",)
+
+    def __init__(self, frame: "MetricsFrame") -> None:
+        self._frame = frame
+
+    def __len__(self) -> int:
+        return len(self._frame)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._frame.row(i) for i in range(*idx.indices(len(self)))]
+        return self._frame.row(idx)
+
+    def __repr__(self) -> str:
+        return f"MetricsRowsView(rows={len(self)}, columns={len(self._frame.columns)})"
+
+
+class MetricsFrame:
+    """
+    Kolom-georiënteerde weergave van een WHES metrics response.
+
+    DOUBLE-kolommen worden ``array('d')`` (NaN = geen waarde), TIMESTAMP-kolommen
+    ``array('q')``; overige kolommen blijven een lijst. Coercion gebeurt één keer per kolom.
+    """
+
+    __slots__ = ("columns", "metadata", "timestamp_column", "_data", "_length")
+
+    def __init__(
+            self,
+            columns: List[str],
+            data: Dict[str, Column],
+            metadata: Optional[List[str]] = None,
+            timestamp_column: Optional[str] = None,
+    ) -> None:
+        self.columns = columns
+        self.metadata = metadata or []
+        self.timestamp_column = timestamp_column
+        self._data = data
+        self._length = len(data[columns[0]]) if columns else 0
+
+    @classmethod
+    def empty(cls) -> "MetricsFrame":
+        return cls([], {})
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def __repr__(self) -> str:
+        return f"MetricsFrame(rows={self._length}, columns={self.columns!r})"
+
+    def column(self, name: str) -> Column:
+        return self._data[name]
+
+    @property
+    def timestamps(self) -> Optional[Column]:
+        return self._data.get(self.timestamp_column) if self.timestamp_column else None
+
+    @property
+    def rows(self) -> MetricsRowsView:
+        return MetricsRowsView(self)
+
+    def row(self, idx: int) -> Dict[str, Any]:
+        if idx < 0:
+            idx += self._length
+        if not 0 <= idx < self._length:
+            raise IndexError("MetricsFrame row index out of range")
+        return {name: _cell(self._data[name], idx) for name in self.columns}
+
+    def last_row(self) -> Dict[str, Any]:
+        return self.row(-1) if self._length else {}
+
+    def last_valid(self) -> Dict[str, Any]:
+        """Per kolom de laatste niet-lege waarde (None als de kolom volledig leeg is)."""
+        out: Dict[str, Any] = {}
+        for name in self.columns:
+            col = self._data[name]
+            val = None
+            for i in range(self._length - 1, -1, -1):
+                val = _cell(col, i)
+                if val is not None:
+                    break
+            out[name] = val
+        return out
+
+    def slice(self, start: Optional[int] = None, stop: Optional[int] = None) -> "MetricsFrame":
+        s = slice(start, stop)
+        return MetricsFrame(
+            self.columns,
+            {name: col[s] for name, col in self._data.items()},
+            self.metadata,
+            self.timestamp_column,
+        )
+
+    def between(self, start_ms: int, end_ms: int) -> "MetricsFrame":
+        """Rijen met ``start_ms <= ts <= end_ms`` (vereist een oplopende timestamp-kolom)."""
+        ts = self.timestamps
+        if ts is None:
+            return self
+        return self.slice(bisect_left(ts, start_ms), bisect_right(ts, end_ms))
+
+    def as_numpy(self, name: str):
+        """Zero-copy NumPy view op een array-kolom (vereist NumPy)."""
+        if np is None:
+            raise RuntimeError("NumPy is niet beschikbaar")
+        col = self._data[name]
+        if isinstance(col, array):
+            return np.frombuffer(col, dtype=np.float64 if col.typecode == "d" else np.int64)
+        return np.asarray(col, dtype=object)
+
+
+def metrics_to_frame(
+        metrics_resp: dict,
+        *,
+        extra_coercers: Optional[Dict[str, Callable[[Any], Any]]] = None,
+) -> MetricsFrame:
+    """
+    Converteert het WHES metrics-formaat (columns/rows/metadata) naar een MetricsFrame.
+    """
+    data = (metrics_resp or {}).get("data") or {}
+    columns: List[str] = data.get("columns") or []
+    rows: List[List[Any]] = data.get("rows") or []
+    metadata: List[str] = data.get("metadata") or []
+
+    if not columns or not rows:
+        if not columns and not rows:
+            _LOGGER.warning("WHES: metrics response bevat geen 'columns' en geen 'rows'.")
+        elif not columns:
+            _LOGGER.warning("WHES: metrics response bevat geen 'columns' (rows=%d).", len(rows))
+        else:
+            _LOGGER.warning("WHES: metrics response bevat geen 'rows' (columns=%d).", len(columns))
+        return MetricsFrame.empty()
+
+    columns = _unique_columns(list(columns))
+    n = len(columns)
+
+    kinds: List[Optional[str]] = [str(m).upper() for m in metadata]
+    if len(kinds) != n:
+        _LOGGER.debug(
+            "WHES: metadata/columns lengte mismatch (metadata=%d, columns=%d); gebruik identity coercers.",
+            len(kinds),
+            n,
+        )
+        kinds = [None] * n
+
+    # Transponeer rijen naar kolommen; korte rijen worden met None aangevuld, lange afgekapt
+    if set(map(len, rows)) != {n}:
+        _LOGGER.debug("WHES: rijen met afwijkende lengte; trailing kolommen worden op None gezet.")
+        rows = [(list(r) + [None] * n)[:n] for r in rows]
+    transposed = list(zip(*rows))
+
+    ts_col: Optional[str] = None
+    out: Dict[str, Column] = {}
+    for name, kind, values in zip(columns, kinds, transposed):
+        if extra_coercers and kind in extra_coercers:
+            out[name] = _coerce_cells(values, extra_coercers[kind], name)
+            continue
+        decoder = _COLUMN_DECODERS.get(kind)
+        out[name] = decoder(values, name) if decoder else list(values)
+        if kind == "TIMESTAMP" and ts_col is None:
+            ts_col = name
+
+    if ts_col is not None and not isinstance(out[ts_col], array):
+        # Rijen zonder bruikbare timestamp kunnen niet gesorteerd of gebisect worden: overslaan
+        keep = [i for i, t in enumerate(out[ts_col]) if isinstance(t, int)]
+        _LOGGER.debug("WHES: %d rijen zonder geldige timestamp overgeslagen.", len(rows) - len(keep))
+        out = {name: _take(col, keep) for name, col in out.items()}
+        out[ts_col] = array("q", out[ts_col])
+
+    _LOGGER.debug("WHES: metrics_to_frame -> %d rijen, %d kolommen.", len(rows), n)
+    return MetricsFrame(columns, out, kinds if kinds[0] is not None else [], ts_col)
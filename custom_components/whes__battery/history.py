@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import logging
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Optional, Tuple
+
+from homeassistant.util import dt as dt_util
+
+from .const import *
+from .frame import MetricsFrame, np
+
+_LOGGER = logging.getLogger(__name__)
+
+QUARTER_MS = 15 * 60_000
+HOUR_MS = 3_600_000
+
+
+class RingBuffer:
+    """
+    Ringbuffer van vaste grootte met (timestamp ms, waarde) in twee arrays.
+
+    Append is O(1); een sample met dezelfde timestamp als de laatste overschrijft die (lopende
+    bucket). Oudere samples (een volledige poll na de fast lane) worden op hun plek ingevoegd;
+    dat kost een verschuiving, maar komt alleen voor na zo'n fast-lane sample. Window-queries
+    werken op een geordende view en gebruiken NumPy als dat er is.
+    """
+
+    __slots__ = ("capacity", "_ts", "_val", "_head", "_size")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._ts = array("q", bytes(8 * capacity))
+        self._val = array("d", bytes(8 * capacity))
+        self._head = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def last_ts(self) -> Optional[int]:
+        return self._ts[self._head - 1] if self._size else None
+
+    @property
+    def last_value(self) -> Optional[float]:
+        return self._val[self._head - 1] if self._size else None
+
+    def _slot(self, i: int) -> int:
+        """Fysieke index van het i-de sample (0 = oudste)."""
+        return (self._head - self._size + i) % self.capacity
+
+    def append(self, ts: int, value: float) -> None:
+        if self._size:
+            last = self._ts[self._head - 1]
+            if ts < last:
+                self._insert(ts, value)
+                return
+            if ts == last:
+                self._val[self._head - 1] = value
+                return
+        self._ts[self._head] = ts
+        self._val[self._head] = value
+        self._head = (self._head + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def _insert(self, ts: int, value: float) -> None:
+        n = self._size
+        pos = bisect_left(range(n), ts, key=lambda i: self._ts[self._slot(i)])
+        if pos < n and self._ts[self._slot(pos)] == ts:
+            self._val[self._slot(pos)] = value
+            return
+        if n == self.capacity:
+            if pos == 0:
+                return  # ouder dan alles in een volle buffer
+            # Oudste valt eruit: [1, pos) schuift één plek naar links
+            for i in range(1, pos):
+                src, dst = self._slot(i), self._slot(i - 1)
+                self._ts[dst], self._val[dst] = self._ts[src], self._val[src]
+            dst = self._slot(pos - 1)
+        else:
+            # [pos, n) schuift één plek naar rechts; head en size schuiven mee, de oudste blijft op zijn plek
+            for i in range(n, pos, -1):
+                src, dst = self._slot(i - 1), self._slot(i)
+                self._ts[dst], self._val[dst] = self._ts[src], self._val[src]
+            self._head = (self._head + 1) % self.capacity
+            self._size += 1
+            dst = self._slot(pos)
+        self._ts[dst], self._val[dst] = ts, value
+
+    def ordered(self) -> Tuple[array, array]:
+        """Kopie van de inhoud, oudste eerst."""
+        if self._size < self.capacity:
+            return self._ts[:self._size], self._val[:self._size]
+        h = self._head
+        return self._ts[h:] + self._ts[:h], self._val[h:] + self._val[:h]
+
+    def window(self, start_ms: int, end_ms: Optional[int] = None):
+        """Samples met ``start_ms <= ts < end_ms`` als (ts, waarden); NumPy-arrays als NumPy er is."""
+        ts, val = self.ordered()
+        lo = bisect_left(ts, start_ms)
+        hi = len(ts) if end_ms is None else bisect_left(ts, end_ms)
+        if np is not None:
+            return np.frombuffer(ts, dtype=np.int64)[lo:hi], np.frombuffer(val, dtype=np.float64)[lo:hi]
+        return ts[lo:hi], val[lo:hi]
+
+    def mean(self, start_ms: int, end_ms: Optional[int] = None, *, clip_min: Optional[float] = None) -> Optional[float]:
+        _ts, val = self.window(start_ms, end_ms)
+        if not len(val):
+            return None
+        if np is not None:
+            return float((np.maximum(val, clip_min) if clip_min is not None else val).mean())
+        if clip_min is not None:
+            return sum(max(v, clip_min) for v in val) / len(val)
+        return sum(val) / len(val)
+
+    def slope_per_hour(self, start_ms: int) -> Optional[float]:
+        """Kleinste-kwadraten helling (eenheid per uur) over het window; None bij < 2 samples."""
+        ts, val = self.window(start_ms)
+        n = len(val)
+        if n < 2:
+            return None
+        if np is not None:
+            t = (ts - ts[0]).astype(np.float64) / HOUR_MS
+            t_mean = t.mean()
+            denom = float(((t - t_mean) ** 2).sum())
+            return float(((t - t_mean) * (val - val.mean())).sum()) / denom if denom else None
+        t = [(x - ts[0]) / HOUR_MS for x in ts]
+        t_mean = sum(t) / n
+        v_mean = sum(val) / n
+        denom = sum((x - t_mean) ** 2 for x in t)
+        return sum((x - t_mean) * (v - v_mean) for x, v in zip(t, val)) / denom if denom else None
+
+    def as_dict(self) -> Dict[str, list]:
+        ts, val = self.ordered()
+        return {"ts": ts.tolist(), "values": val.tolist()}
+
+    def load(self, data: Dict[str, list]) -> None:
+        for ts, value in zip(data.get("ts") or [], data.get("values") or []):
+            self.append(int(ts), float(value))
+
+
+class PeakDemand:
+    """
+    Hoogste kwartiergemiddelde van het afgenomen vermogen (kW) in de lopende maand, zoals
+    capaciteitstarieven het rekenen. Een kwartier wordt afgesloten zodra er een sample uit
+    een volgend kwartier binnenkomt, en opnieuw berekend als er later nog samples voor komen.
+    """
+
+    __slots__ = ("month", "peak_kw", "peak_ts", "quarter_start")
+
+    def __init__(self) -> None:
+        self.month: Optional[str] = None
+        self.peak_kw: Optional[float] = None
+        self.peak_ts: Optional[int] = None
+        self.quarter_start: Optional[int] = None
+
+    def update(self, buffer: RingBuffer, kw_factor: float, late_ts: Optional[int] = None) -> None:
+        """``late_ts``: oudste sample dat achteraf is ingevoegd; zijn (al afgesloten) kwartier telt opnieuw."""
+        last = buffer.last_ts
+        if last is None:
+            return
+        quarter = last - last % QUARTER_MS
+        # Alle afgesloten kwartieren sinds de vorige update die nog in de buffer zitten
+        oldest = buffer.ordered()[0][0]
+        start = oldest - oldest % QUARTER_MS
+        if self.quarter_start is not None:
+            resume = self.quarter_start if late_ts is None else min(self.quarter_start, late_ts - late_ts % QUARTER_MS)
+            start = max(start, resume)
+        for q in range(start, quarter, QUARTER_MS):
+            avg = buffer.mean(q, q + QUARTER_MS, clip_min=0.0)
+            if avg is not None:
+                self._record(q, avg * kw_factor)
+        self.quarter_start = quarter
+
+    def _record(self, quarter_start: int, avg_kw: float) -> None:
+        month = dt_util.as_local(dt_util.utc_from_timestamp(quarter_start / 1000)).strftime("%Y-%m")
+        if month != self.month:
+            self.month, self.peak_kw, self.peak_ts = month, None, None
+        if self.peak_kw is None or avg_kw > self.peak_kw or quarter_start == self.peak_ts:
+            # Opnieuw berekende piek-kwartier: de vollediger waarde vervangt de oude
+            self.peak_kw, self.peak_ts = avg_kw, quarter_start
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"month": self.month, "peak_kw": self.peak_kw, "peak_ts": self.peak_ts, "quarter_start": self.quarter_start}
+
+    def load(self, data: Dict[str, Any]) -> None:
+        self.month = data.get("month")
+        self.peak_kw = data.get("peak_kw")
+        self.peak_ts = data.get("peak_ts")
+        self.quarter_start = data.get("quarter_start")
+
+
+class SampleHistory:
+    """
+    Ringbuffers per (sectie, id, kolom) voor ``HISTORY_COLUMNS``, gevuld uit elk opgehaald frame,
+    plus de maandpiek per ammeter. Basis voor de afgeleide sensoren.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._buffers: Dict[Tuple[str, str, str], RingBuffer] = {}
+        self._peaks: Dict[str, PeakDemand] = {}
+
+    def buffer(self, section: str, target_id: str, column: str) -> Optional[RingBuffer]:
+        return self._buffers.get((section, target_id, column))
+
+    def peak(self, target_id: str) -> Optional[PeakDemand]:
+        return self._peaks.get(target_id)
+
+    def ingest(self, section: str, target_id: str, frame: MetricsFrame) -> None:
+        ts = frame.timestamps
+        if ts is None or not frame:
+            return
+        # Zelfde tekenconventie als de sensoren (normalize_power)
+        sign = -1.0 if section == "ammeter" else 1.0
+        for column in HISTORY_COLUMNS[section]:
+            if column not in frame.columns:
+                continue
+            key = (section, target_id, column)
+            buf = self._buffers.get(key)
+            if buf is None:
+                buf = self._buffers[key] = RingBuffer(self.capacity)
+            late = None
+            for t, v in zip(ts, frame.column(column)):
+                if t is not None and isinstance(v, (int, float)) and v == v:
+                    if buf.last_ts is not None and t < buf.last_ts and (late is None or t < late):
+                        late = t
+                    buf.append(t, sign * v)
+            if section == "ammeter" and column == "ac_active_power":
+                self._peaks.setdefault(target_id, PeakDemand()).update(buf, 0.001, late)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "samples": {"/".join(key): len(buf) for key, buf in self._buffers.items()},
+            "peaks": {target_id: peak.as_dict() for target_id, peak in self._peaks.items()},
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "buffers": {"|".join(key): buf.as_dict() for key, buf in self._buffers.items()},
+            "peaks": {target_id: peak.as_dict() for target_id, peak in self._peaks.items()},
+        }
+
+    def load(self, data: Dict[str, Any]) -> None:
+        for key, values in (data.get("buffers") or {}).items():
+            parts = tuple(key.split("|"))
+            if len(parts) == 3:
+                buf = self._buffers[parts] = RingBuffer(self.capacity)
+                buf.load(values)
+        for target_id, values in (data.get("peaks") or {}).items():
+            self._peaks.setdefault(target_id, PeakDemand()).load(values)
+
+
+def _latest(buf: Optional[RingBuffer]) -> Optional[int]:
+    return None if buf is None else buf.last_ts
+
+
+def rolling_mean(history: SampleHistory, section: str, target_id: str, column: str,
+                 seconds: int = ROLLING_WINDOW_SECONDS) -> Optional[float]:
+    buf = history.buffer(section, target_id, column)
+    last = _latest(buf)
+    return None if last is None else buf.mean(last - seconds * 1000 + 1)
+
+
+def soc_rate(history: SampleHistory, target_id: str) -> Optional[float]:
+    """Verandering van de SoC in %/uur over het rolling window."""
+    buf = history.buffer("ems", target_id, "ems_soc")
+    last = _latest(buf)
+    return None if last is None else buf.slope_per_hour(last - ROLLING_WINDOW_SECONDS * 1000 + 1)
+
+
+def time_to(history: SampleHistory, target_id: str, full: bool) -> Optional[float]:
+    """Minuten tot vol (laden) of leeg (ontladen) bij de huidige SoC-snelheid; None in de andere richting."""
+    rate = soc_rate(history, target_id)
+    buf = history.buffer("ems", target_id, "ems_soc")
+    if rate is None or buf is None or abs(rate) < SOC_RATE_MIN:
+        return None
+    soc = buf.last_value
+    if full and rate > 0:
+        return max(0.0, (100.0 - soc) / rate * 60)
+    if not full and rate < 0:
+        return max(0.0, soc / -rate * 60)
+    return None
+
+
+def quarter_demand(history: SampleHistory, target_id: str) -> Optional[float]:
+    """Gemiddeld afgenomen vermogen (kW) in het lopende kwartier."""
+    buf = history.buffer("ammeter", target_id, "ac_active_power")
+    last = _latest(buf)
+    if last is None:
+        return None
+    avg = buf.mean(last - last % QUARTER_MS, clip_min=0.0)
+    return None if avg is None else avg / 1000
+
+
+def peak_demand(history: SampleHistory, target_id: str) -> Optional[float]:
+    peak = history.peak(target_id)
+    return None if peak is None else peak.peak_kw
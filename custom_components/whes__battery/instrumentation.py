@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+# Bovengrenzen (ms) van de latency-histogram buckets; alles daarboven valt in de laatste (+Inf) bucket
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000)
+
+
+def error_class(err: BaseException) -> str:
+    """Compacte foutklasse voor tellers: http_<status>, network, timeout, json of other."""
+    if isinstance(err, aiohttp.ClientResponseError):
+        return f"http_{err.status}"
+    if isinstance(err, TimeoutError):
+        return "timeout"
+    if isinstance(err, aiohttp.ClientError):
+        return "network"
+    if isinstance(err, ValueError):
+        return "json"
+    return "other"
+
+
+class EndpointStats:
+    """Tellers en latency-histogram voor één endpoint (bijv. 'ems' of 'ammeter')."""
+
+    __slots__ = (
+        "requests", "errors", "latency_buckets", "latency_sum_ms", "last_latency_ms",
+        "bytes_total", "last_bytes", "rows_total", "last_rows", "last_sample_age_ms",
+    )
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors: Counter = Counter()
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = 0.0
+        self.last_latency_ms: Optional[float] = None
+        self.bytes_total = 0
+        self.last_bytes: Optional[int] = None
+        self.rows_total = 0
+        self.last_rows: Optional[int] = None
+        self.last_sample_age_ms: Optional[int] = None
+
+    def record_response(self, latency_ms: float, n_bytes: int) -> None:
+        self.requests += 1
+        self.latency_buckets[bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.latency_sum_ms += latency_ms
+        self.last_latency_ms = latency_ms
+        self.bytes_total += n_bytes
+        self.last_bytes = n_bytes
+
+    def record_error(self, latency_ms: float, err: BaseException) -> None:
+        self.requests += 1
+        self.latency_buckets[bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.latency_sum_ms += latency_ms
+        self.last_latency_ms = latency_ms
+        self.errors[error_class(err)] += 1
+
+    def record_rows(self, rows: int) -> None:
+        self.rows_total += rows
+        self.last_rows = rows
+
+    def record_sample_age(self, sample_age_ms: int) -> None:
+        self.last_sample_age_ms = sample_age_ms
+
+    @property
+    def error_count(self) -> int:
+        return sum(self.errors.values())
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        """
+        Benadering uit de histogram: bovengrens van de bucket waarin percentiel ``p`` valt.
+        De open laatste bucket wordt op de hoogste grens (de request-timeout) afgekapt.
+        """
+        total = sum(self.latency_buckets)
+        if not total:
+            return None
+        rank = p / 100.0 * total
+        seen = 0
+        for idx, count in enumerate(self.latency_buckets):
+            seen += count
+            if seen >= rank:
+                return float(LATENCY_BUCKETS_MS[min(idx, len(LATENCY_BUCKETS_MS) - 1)])
+        return None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": dict(self.errors),
+            "latency_ms": {
+                "last": self.last_latency_ms,
+                "mean": self.latency_sum_ms / self.requests if self.requests else None,
+                "p50": self.latency_percentile(50),
+                "p95": self.latency_percentile(95),
+                "buckets": {
+                    **{f"le_{b}": c for b, c in zip(LATENCY_BUCKETS_MS, self.latency_buckets)},
+                    "inf": self.latency_buckets[-1],
+                },
+            },
+            "bytes": {"total": self.bytes_total, "last": self.last_bytes},
+            "rows": {"total": self.rows_total, "last": self.last_rows},
+            "last_sample_age_ms": self.last_sample_age_ms,
+        }
+
+
+class ClientStats:
+    """Per-endpoint statistieken van één WhesClient."""
+
+    def __init__(self) -> None:
+        self.endpoints: Dict[str, EndpointStats] = {}
+
+    def endpoint(self, name: str) -> EndpointStats:
+        stats = self.endpoints.get(name)
+        if stats is None:
+            stats = self.endpoints[name] = EndpointStats()
+        return stats
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: stats.as_dict() for name, stats in self.endpoints.items()}
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from homeassistant.util import dt as dt_util
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+# Volgorde van de stages in het rapport
+PROFILE_STAGES = (
+    "cycle", "rate_limit", "sign", "connect", "response_wait", "read_body", "json_decode", "row_decode",
+    "dispatch", "state_write",
+)
+
+# cProfile en tracemalloc zijn proces-breed: hooguit één profiler tegelijk mag ze gebruiken
+_hooks_owner: Optional["PollProfiler"] = None
+
+
+def hooks_active() -> bool:
+    """True zolang een WHES-profiel cProfile of tracemalloc in gebruik heeft (in dit proces)."""
+    return _hooks_owner is not None
+
+
+class SpanStats:
+    """Duur (ms) van alle spans van één stage."""
+
+    __slots__ = ("durations",)
+
+    def __init__(self) -> None:
+        self.durations: List[float] = []
+
+    def as_dict(self) -> Dict[str, Any]:
+        d = sorted(self.durations)
+        n = len(d)
+        return {
+            "count": n,
+            "total_ms": round(sum(d), 3),
+            "mean_ms": round(sum(d) / n, 3) if n else None,
+            "p95_ms": round(d[min(n - 1, int(0.95 * n))], 3) if n else None,
+            "max_ms": round(d[-1], 3) if n else None,
+        }
+
+
+class PollProfiler:
+    """
+    Verzamelt spans per stage van de poll-pipeline gedurende ``cycles`` polls, optioneel met cProfile
+    (alleen de event-loop thread) en tracemalloc. Zolang er geen profiler actief is, kost de
+    instrumentatie in client, coordinator en sensoren één ``is None``-check.
+    """
+
+    def __init__(self, cycles: int, *, use_cprofile: bool = False, use_tracemalloc: bool = False) -> None:
+        self.cycles = cycles
+        self.completed = 0
+        self.started = dt_util.utcnow()
+        self.spans: Dict[str, SpanStats] = {stage: SpanStats() for stage in PROFILE_STAGES}
+        self.counters: Counter = Counter()
+        self._cprofile: Optional[cProfile.Profile] = cProfile.Profile() if use_cprofile else None
+        self._tracemalloc = use_tracemalloc
+        self._started_tracemalloc = False
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def uses_hooks(self) -> bool:
+        return self._cprofile is not None or self._tracemalloc
+
+    def start(self) -> None:
+        """Op de event loop: cProfile profileert de thread die hem aanzet."""
+        global _hooks_owner
+        if self.uses_hooks:
+            if _hooks_owner is not None:
+                raise RuntimeError("cProfile/tracemalloc al in gebruik door een ander WHES-profiel")
+            _hooks_owner = self
+        if self._tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self._snapshot = tracemalloc.take_snapshot()
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.spans[stage].durations.append(seconds * 1000)
+
+    def count(self, name: str) -> None:
+        self.counters[name] += 1
+
+    def cycle_done(self) -> bool:
+        """Telt een afgeronde poll; True als het gevraagde aantal bereikt is."""
+        self.completed += 1
+        return self.completed >= self.cycles
+
+    def stop(self) -> None:
+        """Op de event loop, direct na de laatste cycle; mag vaker aangeroepen worden."""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+
+    def close(self) -> None:
+        """Afbreken zonder rapport (unload): cProfile uit en tracemalloc stoppen als wij hem startten."""
+        self.stop()
+        self._release()
+
+    def _release(self) -> None:
+        global _hooks_owner
+        if self._started_tracemalloc:
+            self._started_tracemalloc = False
+            tracemalloc.stop()
+        self._snapshot = None
+        if _hooks_owner is self:
+            _hooks_owner = None
+
+    def report(self) -> Dict[str, Any]:
+        """Bouwt het rapport (executor: pstats en de tracemalloc-vergelijking kunnen even duren)."""
+        out: Dict[str, Any] = {
+            "started": self.started.isoformat(),
+            "finished": dt_util.utcnow().isoformat(),
+            "cycles": self.completed,
+            "spans": {stage: st.as_dict() for stage, st in self.spans.items() if st.durations},
+            "counters": dict(self.counters),
+        }
+        try:
+            if self._snapshot is not None and tracemalloc.is_tracing():
+                current = tracemalloc.take_snapshot()
+                diff = current.compare_to(self._snapshot, "lineno")
+                out["tracemalloc"] = {
+                    "traced_bytes": tracemalloc.get_traced_memory()[0],
+                    "top_growth": [str(stat) for stat in diff[:PROFILE_TOP]],
+                }
+        finally:
+            self._release()
+        # Na tracemalloc, zodat pstats zelf niet in de geheugengroei telt
+        if self._cprofile is not None:
+            buf = io.StringIO()
+            pstats.Stats(self._cprofile, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            out["cprofile"] = buf.getvalue().splitlines()
+        return out
+
+
+def write_report(path: str, report: Dict[str, Any]) -> None:
+    """Schrijft het rapport als JSON (executor)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+def report_path(directory: str, entry_id: str) -> str:
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    return os.path.join(directory, f"{entry_id}_{stamp}.json")
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_NAMES = {PRIORITY_LIVE: "live", PRIORITY_VALIDATE: "validate", PRIORITY_BACKFILL: "backfill"}
+
+
+class QueueStats:
+    """Wachttijd-tellers van één prioriteitsklasse."""
+
+    __slots__ = ("requests", "waited", "wait_total_ms", "wait_max_ms")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.waited = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def record(self, wait_s: float) -> None:
+        self.requests += 1
+        if wait_s > 0:
+            ms = wait_s * 1000
+            self.waited += 1
+            self.wait_total_ms += ms
+            self.wait_max_ms = max(self.wait_max_ms, ms)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "waited": self.waited,
+            "wait_avg_ms": round(self.wait_total_ms / self.waited) if self.waited else 0,
+            "wait_max_ms": round(self.wait_max_ms),
+        }
+
+
+class TokenBucket:
+    """
+    Token bucket met prioriteitswachtrij. ``rate`` tokens per seconde tot maximaal ``burst``; wie geen
+    token krijgt wacht in een heap op (prioriteit, volgorde), zodat live polls voorgaan op validatie en
+    backfill. Na een 429 wordt de bucket leeggemaakt en tot ``Retry-After`` gepauzeerd.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.throttled = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats: Dict[int, QueueStats] = {p: QueueStats() for p in PRIORITY_NAMES}
+
+    def configure(self, rate: float, burst: int) -> None:
+        self._refill(time.monotonic())
+        self.rate = rate
+        self.burst = burst
+        self._tokens = min(self._tokens, float(burst))
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def _try_take(self, now: float) -> bool:
+        if now < self._blocked_until:
+            return False
+        self._refill(now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self, priority: int = PRIORITY_LIVE) -> float:
+        """Wacht op een token; geeft de wachttijd in seconden."""
+        t0 = time.monotonic()
+        stats = self.stats[priority]
+        if not self._waiters and self._try_take(t0):
+            stats.record(0.0)
+            return 0.0
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._grant()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Token was al toegekend: teruggeven aan de volgende in de rij
+                self._tokens = min(float(self.burst), self._tokens + 1)
+                self._grant()
+            raise
+        wait = time.monotonic() - t0
+        stats.record(wait)
+        if wait > 1:
+            _LOGGER.debug("WHES: %.1fs gewacht op rate limit (%s).", wait, PRIORITY_NAMES[priority])
+        return wait
+
+    def penalize(self, seconds: float) -> None:
+        """Server gaf 429: bucket leeg en geen requests tot ``seconds`` verstreken zijn."""
+        self.throttled += 1
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens = 0.0
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        # Tijdens de pauze vult de bucket niet bij; anders volgt na Retry-After meteen een hele burst
+        self._updated = self._blocked_until
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._grant()
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._grant()
+
+    def _grant(self) -> None:
+        now = time.monotonic()
+        while self._waiters:
+            fut = self._waiters[0][2]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._try_take(now):
+                break
+            heapq.heappop(self._waiters)
+            fut.set_result(None)
+        if not self._waiters or self._timer is not None:
+            return
+        delay = max(self._blocked_until - now, (1 - self._tokens) / self.rate if self.rate > 0 else 1.0, 0.0)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def as_dict(self) -> Dict[str, Any]:
+        self._refill(time.monotonic())
+        return {
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "tokens": round(self._tokens, 2),
+            "queued": sum(1 for _p, _s, fut in self._waiters if not fut.done()),
+            "throttled_429": self.throttled,
+            "classes": {PRIORITY_NAMES[p]: st.as_dict() for p, st in self.stats.items()},
+        }
+
+
+# Process-breed: alle entries (en de config flow) met dezelfde key en base URL delen één budget
+_LIMITERS: Dict[Tuple[str, str], TokenBucket] = {}
+
+
+def get_limiter(api_key: str, base_url: str) -> TokenBucket:
+    key = (api_key, base_url.rstrip("/"))
+    limiter = _LIMITERS.get(key)
+    if limiter is None:
+        limiter = _LIMITERS[key] = TokenBucket(DEFAULT_RATE_LIMIT / 60, RATE_LIMIT_BURST)
+    return limiter
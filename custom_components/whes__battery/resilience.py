@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+import aiohttp
+
+_LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class WhesCircuitOpenError(Exception):
+    """Request niet verstuurd: de circuit breaker staat open na herhaalde fouten."""
+
+
+def describe_error(err: BaseException) -> str:
+    """
+    Veilige omschrijving voor logs: klasse en eventueel HTTP-status. Nooit de repr, want die van
+    ClientResponseError bevat alle request-headers, inclusief de signature met de API key.
+    """
+    status = getattr(err, "status", None)
+    return type(err).__name__ if status is None else f"{type(err).__name__} {status}"
+
+
+def is_transient(err: BaseException) -> bool:
+    """Fouten waarbij opnieuw proberen zin heeft: netwerk, timeouts, HTTP 429 en 5xx."""
+    if isinstance(err, aiohttp.ClientResponseError):
+        return err.status == 429 or err.status >= 500
+    return isinstance(err, (aiohttp.ClientError, TimeoutError))
+
+
+async def retry_async(
+        fn: Callable[[], Awaitable[T]],
+        *,
+        attempts: int,
+        base_delay: float,
+        max_delay: float,
+        retry_if: Callable[[BaseException], bool] = is_transient,
+        label: str = "",
+) -> T:
+    """
+    Voert ``fn`` uit met maximaal ``attempts`` pogingen, exponentiële backoff en full jitter. Met
+    ``label`` wordt alleen de definitieve fout gelogd (warning, zonder traceback).
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await fn()
+        except Exception as err:
+            if attempt >= attempts or not retry_if(err):
+                if label:
+                    _LOGGER.warning("WHES: %s mislukt na %d poging(en): %s", label, attempt, describe_error(err))
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+            _LOGGER.debug("WHES: poging %d/%d mislukt (%s); opnieuw over %.2fs.", attempt, attempts,
+                          describe_error(err), delay)
+            await asyncio.sleep(delay)
+    raise RuntimeError("unreachable")  # pragma: no cover
+
+
+class CircuitBreaker:
+    """
+    Klassieke circuit breaker.
+
+    closed: alles gaat door; na ``failure_threshold`` opeenvolgende fouten => open.
+    open: requests falen direct tot ``reset_timeout`` verstreken is => half_open.
+    half_open: precies één probe-request; succes => closed, fout => weer open.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, name: str = "") -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    def before_request(self) -> None:
+        if self.state == self.OPEN:
+            if time.monotonic() - (self.opened_at or 0) < self.reset_timeout:
+                raise WhesCircuitOpenError(f"WHES API circuit open ({self.name})")
+            self.state = self.HALF_OPEN
+            _LOGGER.info("WHES: circuit %s half-open, probe-request wordt toegelaten.", self.name)
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise WhesCircuitOpenError(f"WHES API circuit half-open ({self.name}, probe loopt)")
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            _LOGGER.info("WHES: circuit %s gesloten, API reageert weer.", self.name)
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                _LOGGER.warning("WHES: circuit %s open na %d fouten; requests %ds gepauzeerd.",
+                                self.name, self.failures, int(self.reset_timeout))
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def record_ignored(self) -> None:
+        """Niet-transiënte fout (bijv. 401): telt niet mee, maar geeft een probe-slot wel vrij."""
+        self._probe_in_flight = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures}
+
+
+class SingleFlight:
+    """Coalesceert gelijktijdige calls met dezelfde key tot één lopende taak."""
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            # shield: een geannuleerde meelifter mag de gedeelde taak niet annuleren
+            return await asyncio.shield(fut)
+        fut = asyncio.ensure_future(fn())
+        self._inflight[key] = fut
+
+        def _done(f: asyncio.Future) -> None:
+            if self._inflight.get(key) is f:
+                del self._inflight[key]
+            if not f.cancelled():
+                f.exception()  # markeer als opgehaald, ook als alle wachters weg zijn
+
+        fut.add_done_callback(_done)
+        return await asyncio.shield(fut)
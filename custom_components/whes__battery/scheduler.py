@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import logging
+import random
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+
+from .const import *
+from .resilience import describe_error
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _power_kw(section: str, row: Dict[str, Any]) -> Optional[float]:
+    """Hoofdvermogen van een rij in kW (EMS levert kW, de ammeter W)."""
+    if section == "ems":
+        val = row.get("ems_ac_active_power")
+        return float(val) if isinstance(val, (int, float)) else None
+    val = row.get("ac_active_power")
+    return float(val) / 1000.0 if isinstance(val, (int, float)) else None
+
+
+class AdaptiveInterval:
+    """
+    Bepaalt het volgende poll-interval binnen [min_s, max_s].
+
+    - Veranderd vermogen (> ``ADAPTIVE_POWER_DELTA_KW``) of een andere ``ems_state`` => terug naar min_s.
+    - Rustige installatie => interval groeit met ``ADAPTIVE_GROWTH`` tot max_s; zonder nieuwere
+      sample-timestamp groeit het met ``ADAPTIVE_GROWTH`` in het kwadraat.
+    - HTTP 429/5xx of netwerkfouten => exponentiële backoff met jitter (respecteert Retry-After).
+    """
+
+    def __init__(self, min_s: float, max_s: float, start_s: float) -> None:
+        self.min_s = float(min_s)
+        self.max_s = float(max(max_s, min_s))
+        self.current = min(self.max_s, max(self.min_s, float(start_s)))
+        self._power: Dict[Tuple[str, str], float] = {}
+        self._state: Dict[str, Any] = {}
+        self._newest_sample: Optional[int] = None
+        self._failures = 0
+
+    def on_success(self, data: Dict[str, Any], newest_sample_ms: Optional[int]) -> float:
+        self._failures = 0
+        fresh = newest_sample_ms is not None and (
+                self._newest_sample is None or newest_sample_ms > self._newest_sample)
+        if newest_sample_ms is not None:
+            self._newest_sample = max(newest_sample_ms, self._newest_sample or newest_sample_ms)
+
+        active = False
+        for section in ("ems", "ammeter"):
+            for target_id, row in (data.get(section) or {}).items():
+                power = _power_kw(section, row)
+                prev = self._power.get((section, target_id))
+                if power is not None:
+                    if prev is not None and abs(power - prev) > ADAPTIVE_POWER_DELTA_KW:
+                        active = True
+                    self._power[(section, target_id)] = power
+                if section == "ems":
+                    state = row.get("ems_state")
+                    if target_id in self._state and state != self._state[target_id]:
+                        active = True
+                    self._state[target_id] = state
+
+        if active:
+            self.current = self.min_s
+        elif not fresh:
+            # Nog geen nieuwe sample aan cloud-zijde: sneller pollen heeft geen zin
+            self.current = min(self.max_s, self.current * ADAPTIVE_GROWTH * ADAPTIVE_GROWTH)
+        else:
+            self.current = min(self.max_s, self.current * ADAPTIVE_GROWTH)
+        _LOGGER.debug("WHES: adaptief interval -> %.1fs (active=%s, fresh=%s)", self.current, active, fresh)
+        return self.current
+
+    def on_error(self, err: BaseException) -> float:
+        self._failures += 1
+        retry_after: Optional[float] = None
+        if isinstance(err, aiohttp.ClientResponseError):
+            if err.status != 429 and err.status < 500:
+                # 4xx (auth e.d.) lost zich niet op door sneller/langzamer te pollen
+                return self.current
+            try:
+                retry_after = float((err.headers or {}).get("Retry-After"))
+            except (TypeError, ValueError):
+                retry_after = None
+
+        # ±20% jitter zodat meerdere entries niet tegelijk terugkomen
+        backoff = min(ADAPTIVE_MAX_BACKOFF, self.min_s * (2 ** self._failures)) * random.uniform(0.8, 1.2)
+        if retry_after is not None:
+            backoff = max(backoff, retry_after)
+        self.current = max(self.min_s, backoff)
+        _LOGGER.debug("WHES: backoff na fout %s -> %.1fs (poging %d)", describe_error(err), self.current,
+                      self._failures)
+        return self.current
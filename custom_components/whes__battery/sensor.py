@@ -1,13 +1,22 @@
 from __future__ import annotations
 
-from homeassistant.core import HomeAssistant
+import time
+
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.components.sensor import SensorEntity, SensorDeviceClass, SensorStateClass
-from homeassistant.const import UnitOfPower, UnitOfEnergy, UnitOfFrequency, PERCENTAGE
+from homeassistant.const import (
+    EntityCategory, UnitOfPower, UnitOfEnergy, UnitOfFrequency, UnitOfInformation, UnitOfTime, PERCENTAGE,
+)
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
-from .const import DOMAIN, CONF_NAME_PREFIX
-from .coordinator import WhesCoordinator
+from .const import (
+    DOMAIN, CONF_NAME_PREFIX, AGGREGATE_COLUMNS, CONF_POWER_DEADBAND, CONF_ENERGY_DEADBAND, CONF_MAX_SILENCE,
+    DEFAULT_POWER_DEADBAND, DEFAULT_ENERGY_DEADBAND, DEFAULT_MAX_SILENCE, DERIVED_COLUMNS,
+)
+from .aggregate import AGGREGATE_SUFFIXES
+from .history import peak_demand, quarter_demand, rolling_mean, soc_rate, time_to
+from .coordinator import WhesCoordinator, is_hub_entry, metric_unique_id
 
 SENSOR_MAP = {
     "ems_soc": ("EMS State of Charge", PERCENTAGE, SensorDeviceClass.BATTERY, SensorStateClass.MEASUREMENT),
@@ -30,54 +39,274 @@ SENSOR_MAP = {
     "ac_history_negative_power_in_kwh": ("Grid Import Energy (hist)", UnitOfEnergy.KILO_WATT_HOUR, SensorDeviceClass.ENERGY, SensorStateClass.TOTAL_INCREASING),
 }
 
+
+
+def _aggregate_sensor_map() -> dict:
+    """
+    Window-aggregaten per vermogenskolom: key -> (naam, unit, device class, state class, standaard aan).
+    Alleen piek en energie van het totaalvermogen staan standaard aan.
+    """
+    out = {}
+    for section, columns in AGGREGATE_COLUMNS.items():
+        for col in columns:
+            suffix, unit, _devcls, _statecls = SENSOR_MAP[col]
+            main = col in ("ems_ac_active_power", "ac_active_power")
+            for agg, label in (("mean", "Mean"), ("min", "Min"), ("max", "Peak")):
+                out[f"{col}_{agg}"] = (f"{suffix} {label} (interval)", unit, SensorDeviceClass.POWER,
+                                       SensorStateClass.MEASUREMENT, main and agg == "max")
+            # Energie van één poll-window; geen state class omdat de waarde per window opnieuw begint
+            out[f"{col}_energy"] = (f"{suffix} Energy (interval)", UnitOfEnergy.KILO_WATT_HOUR,
+                                    SensorDeviceClass.ENERGY, None, main)
+    return out
+
+
+AGGREGATE_SENSOR_MAP = _aggregate_sensor_map()
+
+# Afgeleide sensoren uit de ringbuffer: key -> (naam, unit, device class, state class, waarde, standaard aan)
+DERIVED_SENSOR_MAP = {
+    "ems_soc_rate": ("EMS SoC Rate", "%/h", None, SensorStateClass.MEASUREMENT, soc_rate, True),
+    "ems_time_to_full": ("Battery Time to Full", UnitOfTime.MINUTES, SensorDeviceClass.DURATION, None,
+                         lambda h, t: time_to(h, t, full=True), True),
+    "ems_time_to_empty": ("Battery Time to Empty", UnitOfTime.MINUTES, SensorDeviceClass.DURATION, None,
+                          lambda h, t: time_to(h, t, full=False), True),
+    "ems_ac_active_power_avg_15m": ("EMS AC Active Power (15 min avg)", UnitOfPower.KILO_WATT, SensorDeviceClass.POWER,
+                                    SensorStateClass.MEASUREMENT,
+                                    lambda h, t: rolling_mean(h, "ems", t, "ems_ac_active_power"), False),
+    "ac_active_power_avg_15m": ("Grid Active Power (15 min avg)", UnitOfPower.WATT, SensorDeviceClass.POWER,
+                                SensorStateClass.MEASUREMENT,
+                                lambda h, t: rolling_mean(h, "ammeter", t, "ac_active_power"), False),
+    "ac_quarter_demand": ("Grid Demand (current quarter)", UnitOfPower.KILO_WATT, SensorDeviceClass.POWER,
+                          SensorStateClass.MEASUREMENT, quarter_demand, True),
+    "ac_peak_demand": ("Grid Peak Demand (month)", UnitOfPower.KILO_WATT, SensorDeviceClass.POWER,
+                       SensorStateClass.MEASUREMENT, peak_demand, True),
+}
+
+# Diagnostische sensoren per endpoint: key -> (naam, unit, device class, state class, waarde, standaard aan)
+DIAGNOSTIC_MAP = {
+    "latency": ("API Latency", UnitOfTime.MILLISECONDS, SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT,
+                lambda st: None if st.last_latency_ms is None else round(st.last_latency_ms), True),
+    "latency_p95": ("API Latency p95", UnitOfTime.MILLISECONDS, SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT,
+                    lambda st: st.latency_percentile(95), False),
+    "errors": ("API Errors", None, None, SensorStateClass.TOTAL_INCREASING, lambda st: st.error_count, True),
+    "bytes": ("API Bytes Received", UnitOfInformation.BYTES, SensorDeviceClass.DATA_SIZE, SensorStateClass.TOTAL_INCREASING,
+              lambda st: st.bytes_total, False),
+    "rows": ("API Rows Received", None, None, SensorStateClass.TOTAL_INCREASING, lambda st: st.rows_total, False),
+    "sample_age": ("Sample Age", UnitOfTime.SECONDS, SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT,
+                   lambda st: None if st.last_sample_age_ms is None else round(st.last_sample_age_ms / 1000), True),
+}
+
+
+def _entry_device_info(entry: ConfigEntry, name_prefix: str, hub: bool) -> dict:
+    """Device voor entry-brede (diagnostische) entities."""
+    if hub:
+        return {
+            "identifiers": {("whes", f"hub_{entry.entry_id}")},
+            "name": f"{name_prefix} Hub",
+            "manufacturer": "WHES / Weiheng",
+            "model": "Hub",
+        }
+    return {
+        "identifiers": {("whes","battery")},
+        "name": f"{name_prefix} Battery",
+        "manufacturer": "WHES / Weiheng",
+        "model": "Battery + Ammeter",
+    }
+
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback):
     coordinator: WhesCoordinator = hass.data[DOMAIN][entry.entry_id]
     name_prefix = entry.data.get(CONF_NAME_PREFIX, "WHES")
+    hub = is_hub_entry(entry.data)
 
     entities=[]
-    for section, keys in (("ems",[k for k in SENSOR_MAP if k.startswith("ems_")]),
-                          ("ammeter",[k for k in SENSOR_MAP if not k.startswith("ems_")])):
-        for key in keys:
-            suffix, unit, devcls, statecls = SENSOR_MAP[key]
-            entities.append(WhesMetricSensor(coordinator, name_prefix, section, key, suffix, unit, devcls, statecls))
+    for section, targets, keys in (("ems", coordinator.device_ids, [k for k in SENSOR_MAP if k.startswith("ems_")]),
+                                   ("ammeter", coordinator.ammeter_ids, [k for k in SENSOR_MAP if not k.startswith("ems_")])):
+        for target_id in targets:
+            for key in keys:
+                suffix, unit, devcls, statecls = SENSOR_MAP[key]
+                entities.append(WhesMetricSensor(coordinator, name_prefix, section, target_id, key, suffix, unit, devcls, statecls, hub))
+            for col in AGGREGATE_COLUMNS[section]:
+                for agg in AGGREGATE_SUFFIXES:
+                    key = f"{col}_{agg}"
+                    suffix, unit, devcls, statecls, enabled = AGGREGATE_SENSOR_MAP[key]
+                    entities.append(WhesMetricSensor(coordinator, name_prefix, section, target_id, key, suffix, unit,
+                                                     devcls, statecls, hub, enabled=enabled))
+            for key in DERIVED_COLUMNS[section]:
+                entities.append(WhesDerivedSensor(coordinator, name_prefix, section, target_id, key, hub))
+
+    device_info = _entry_device_info(entry, name_prefix, hub)
+    for endpoint, targets in (("ems", coordinator.device_ids), ("ammeter", coordinator.ammeter_ids)):
+        if targets:
+            for key in DIAGNOSTIC_MAP:
+                entities.append(WhesDiagnosticSensor(coordinator, entry, name_prefix, endpoint, key, device_info))
 
     async_add_entities(entities)
 
+def _deadband(data, devcls, unit) -> float:
+    """Deadband in de eenheid van de sensor: vermogen in W (ook voor kW-sensoren), energie in kWh."""
+    if devcls == SensorDeviceClass.POWER:
+        band = float(data.get(CONF_POWER_DEADBAND, DEFAULT_POWER_DEADBAND))
+        return band / 1000.0 if unit == UnitOfPower.KILO_WATT else band
+    if devcls == SensorDeviceClass.ENERGY:
+        return float(data.get(CONF_ENERGY_DEADBAND, DEFAULT_ENERGY_DEADBAND))
+    return 0.0
+
+
 class WhesMetricSensor(SensorEntity):
     _attr_should_poll = False
 
-    def __init__(self, coordinator: WhesCoordinator, name_prefix: str, section: str, key: str, suffix: str, unit, devcls, statecls):
+    def __init__(self, coordinator: WhesCoordinator, name_prefix: str, section: str, target_id: str, key: str, suffix: str, unit, devcls, statecls, hub: bool = False, enabled: bool = True):
         self.coordinator = coordinator
         self._section = section
+        self._target_id = target_id
+        self._target = (section, target_id)
         self._key = key
 
         self._attr_has_entity_name = True
         self._attr_name = f"{name_prefix} {suffix}"
-        self._attr_unique_id = f"whes_{section}_{key}"
         self._attr_native_unit_of_measurement = unit
         self._attr_device_class = devcls
         self._attr_state_class = statecls
-        self._attr_device_info = {
-            "identifiers": {("whes","battery")},
-            "name": f"{name_prefix} Battery",
-            "manufacturer": "WHES / Weiheng",
-            "model": "Battery + Ammeter",
-        }
+        self._attr_entity_registry_enabled_default = enabled
+        # Window-energie is klein per poll; meer decimalen dan de tellers
+        self._precision = 2 if devcls == SensorDeviceClass.FREQUENCY else 3 if key.endswith("_energy") else 1
+        if hub:
+            # Hub: één HA-device per battery/ammeter
+            kind = "Battery" if section == "ems" else "Ammeter"
+            self._attr_unique_id = metric_unique_id(section, target_id, key, True)
+            self._attr_device_info = {
+                "identifiers": {("whes", f"{section}_{target_id}")},
+                "name": f"{name_prefix} {kind} {target_id}",
+                "manufacturer": "WHES / Weiheng",
+                "model": kind,
+            }
+        else:
+            self._attr_unique_id = metric_unique_id(section, target_id, key, False)
+            self._attr_device_info = _entry_device_info(coordinator.entry, name_prefix, False)
+
+        self._deadband = _deadband(coordinator.entry.data, devcls, unit)
+        self._max_silence = float(coordinator.entry.data.get(CONF_MAX_SILENCE, DEFAULT_MAX_SILENCE))
+        self._written = None  # (value, available, attributes) van de laatste write
+        self._written_at = 0.0
+        self._update_success = True  # last_update_success van de coordinator bij de laatste refresh
+        self._attr_available = False
+        self._attr_native_value = None
+        self._attr_extra_state_attributes = None
+
+    async def async_added_to_hass(self):
+        # HA schrijft de initiële state na async_added_to_hass; die telt als eerste write
+        self._refresh_attrs()
+        self._mark_written()
+        self.async_on_remove(self.coordinator.async_add_listener(self._handle_coordinator_update))
+
+    def _refresh_attrs(self) -> None:
+        data = self.coordinator.data if isinstance(self.coordinator.data, dict) else {}
+        rows = data.get(self._section) or {}
+        # Na MAX_STALE_SECONDS faalt de coordinator maar houdt hij data; dan niet meer beschikbaar
+        self._update_success = self.coordinator.last_update_success
+        self._attr_available = self._update_success and self._target_id in rows
+        self._attr_native_value = self._rounded(self._value(rows))
+        stale = (data.get("stale") or {}).get(self._section) or ()
+        attrs = {"stale": True} if self._target_id in stale else {}
+        if data.get("cache_age") is not None:
+            # Waarde komt uit de lokale cache van een vorige sessie
+            attrs["cache_age"] = data["cache_age"]
+        self._attr_extra_state_attributes = attrs or None
+
+    def _value(self, rows: dict):
+        return (rows.get(self._target_id) or {}).get(self._key)
+
+    def _rounded(self, val):
+        if isinstance(val, float):
+            return round(val, self._precision)
+        return val
+
+    def _mark_written(self) -> None:
+        self._written = (self._attr_native_value, self._attr_available, self._attr_extra_state_attributes)
+        self._written_at = time.monotonic()
+
+    def _silence_expired(self) -> bool:
+        return bool(self._max_silence) and time.monotonic() - self._written_at >= self._max_silence
+
+    def _unchanged(self) -> bool:
+        """True als de nieuwe state binnen de deadband van de laatst geschreven state valt."""
+        if self._written is None:
+            return False
+        value, available, attrs = self._written
+        if available != self._attr_available or attrs != self._attr_extra_state_attributes:
+            return False
+        if self._silence_expired():
+            return False
+        new = self._attr_native_value
+        if self._deadband and isinstance(new, (int, float)) and isinstance(value, (int, float)):
+            return abs(new - value) < self._deadband
+        return new == value
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        profiler = self.coordinator.profiler
+        if self._target not in self.coordinator.changed_targets and not self._silence_expired() \
+                and self.coordinator.last_update_success == self._update_success:
+            if profiler is not None:
+                profiler.count("state_skipped")
+            return
+        self._refresh_attrs()
+        if self._unchanged():
+            if profiler is not None:
+                profiler.count("state_unchanged")
+            return
+        self._mark_written()
+        if profiler is None:
+            self.async_write_ha_state()
+            return
+        t0 = time.perf_counter()
+        self.async_write_ha_state()
+        profiler.add("state_write", time.perf_counter() - t0)
+
+
+class WhesDerivedSensor(WhesMetricSensor):
+    """Sensor berekend uit de ringbuffer van de coordinator (rolling gemiddelde, SoC-snelheid, piekvraag)."""
+
+    def __init__(self, coordinator: WhesCoordinator, name_prefix: str, section: str, target_id: str, key: str, hub: bool = False):
+        suffix, unit, devcls, statecls, self._value_fn, enabled = DERIVED_SENSOR_MAP[key]
+        super().__init__(coordinator, name_prefix, section, target_id, key, suffix, unit, devcls, statecls, hub, enabled=enabled)
+        if devcls == SensorDeviceClass.DURATION:
+            self._precision = 0
+        elif unit == UnitOfPower.KILO_WATT or key == "ems_soc_rate":
+            self._precision = 2
+
+    def _value(self, rows: dict):
+        return self._value_fn(self.coordinator.history, self._target_id)
+
+
+class WhesDiagnosticSensor(SensorEntity):
+    """Request-statistieken van één endpoint (latency, fouten, bytes, sample-leeftijd)."""
+
+    _attr_should_poll = False
+    _attr_has_entity_name = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, coordinator: WhesCoordinator, entry: ConfigEntry, name_prefix: str, endpoint: str, key: str, device_info: dict):
+        self.coordinator = coordinator
+        self._endpoint = endpoint
+        name, unit, devcls, statecls, self._value_fn, enabled = DIAGNOSTIC_MAP[key]
+        label = "EMS" if endpoint == "ems" else "Ammeter"
+        self._attr_name = f"{name_prefix} {label} {name}"
+        self._attr_unique_id = f"whes_{entry.entry_id}_diag_{endpoint}_{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = devcls
+        self._attr_state_class = statecls
+        self._attr_entity_registry_enabled_default = enabled
+        self._attr_device_info = device_info
 
     async def async_added_to_hass(self):
         self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
 
     @property
     def available(self) -> bool:
-        return isinstance(self.coordinator.data, dict) and self._section in self.coordinator.data
+        return self._endpoint in self.coordinator.client.stats.endpoints
 
     @property
     def native_value(self):
-        data = (self.coordinator.data or {}).get(self._section) or {}
-        val = data.get(self._key)
-        try:
-            if isinstance(val, float):
-                return round(val, 2 if self._attr_device_class == SensorDeviceClass.FREQUENCY else 1)
-        except Exception:
-            pass
-        return val
+        stats = self.coordinator.client.stats.endpoints.get(self._endpoint)
+        return self._value_fn(stats) if stats is not None else None
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import logging
+import math
+
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import ServiceValidationError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.util import dt as dt_util
+
+from .const import *
+from .api import now_ms, sample_by_ms
+from .archive import downsample
+from .backfill import WhesBackfill
+from .coordinator import WhesCoordinator
+from .profiling import hooks_active
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_BACKFILL = f"{DOMAIN}_backfill"
+
+BACKFILL_SCHEMA = vol.Schema({
+    vol.Required("start"): cv.datetime,
+    vol.Optional("end"): cv.datetime,
+    vol.Optional("entry_id"): cv.string,
+    vol.Optional("resume", default=True): cv.boolean,
+    vol.Optional("chunk_hours", default=DEFAULT_BACKFILL_CHUNK_HOURS): vol.All(int, vol.Range(min=1, max=48)),
+})
+
+REFRESH_SCHEMA = vol.Schema({
+    vol.Optional("entry_id"): cv.string,
+    vol.Optional("columns"): vol.All(cv.ensure_list, [vol.In(EMS_COLUMNS + AMMETER_COLUMNS)]),
+    vol.Optional("full", default=False): cv.boolean,
+})
+
+QUERY_ARCHIVE_SCHEMA = vol.Schema({
+    vol.Optional("entry_id"): cv.string,
+    vol.Required("target_id"): cv.string,
+    vol.Required("start"): cv.datetime,
+    vol.Optional("end"): cv.datetime,
+    vol.Optional("columns"): vol.All(cv.ensure_list, [vol.In(EMS_COLUMNS + AMMETER_COLUMNS)]),
+    vol.Optional("every"): vol.All(int, vol.Range(min=1)),
+})
+
+PROFILE_SCHEMA = vol.Schema({
+    vol.Optional("entry_id"): cv.string,
+    vol.Optional("cycles", default=PROFILE_DEFAULT_CYCLES): vol.All(int, vol.Range(min=1, max=PROFILE_MAX_CYCLES)),
+    vol.Optional("cprofile", default=False): cv.boolean,
+    vol.Optional("tracemalloc", default=False): cv.boolean,
+    vol.Optional("write_file", default=True): cv.boolean,
+})
+
+
+def _coordinators(hass: HomeAssistant, entry_id: str | None) -> list[WhesCoordinator]:
+    coordinators = hass.data.get(DOMAIN) or {}
+    if entry_id:
+        if entry_id not in coordinators:
+            raise ServiceValidationError(f"Onbekende WHES entry: {entry_id}")
+        return [coordinators[entry_id]]
+    return list(coordinators.values())
+
+
+def _to_ms(value) -> int:
+    return int(dt_util.as_utc(dt_util.as_local(value) if value.tzinfo is None else value).timestamp() * 1000)
+
+
+async def _async_handle_backfill(hass: HomeAssistant, call: ServiceCall) -> None:
+    start_ms = _to_ms(call.data["start"])
+    end_ms = _to_ms(call.data["end"]) if "end" in call.data else None
+    backfills = hass.data.setdefault(DATA_BACKFILL, {})
+    for coordinator in _coordinators(hass, call.data.get("entry_id")):
+        entry = coordinator.entry
+        backfill = backfills.get(entry.entry_id)
+        if backfill is None or backfill.coordinator is not coordinator:
+            backfill = backfills[entry.entry_id] = WhesBackfill(hass, coordinator)
+        # Kan lang duren: als achtergrondtaak van de entry, zodat unload hem annuleert
+        entry.async_create_background_task(
+            hass,
+            backfill.async_run(
+                start_ms, end_ms, resume=call.data["resume"], chunk_hours=call.data["chunk_hours"],
+            ),
+            f"{DOMAIN}_backfill_{entry.entry_id}",
+        )
+
+
+async def _async_handle_refresh(hass: HomeAssistant, call: ServiceCall) -> None:
+    for coordinator in _coordinators(hass, call.data.get("entry_id")):
+        if call.data["full"]:
+            # Volledige bundle via de (gedebouncede) refresh van de coordinator zelf
+            await coordinator.async_request_refresh()
+        else:
+            await coordinator.async_request_fast_refresh(call.data.get("columns"))
+
+
+async def _async_handle_query_archive(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    target_id = call.data["target_id"]
+    for coordinator in _coordinators(hass, call.data.get("entry_id")):
+        section = "ems" if target_id in coordinator.device_ids else \
+            "ammeter" if target_id in coordinator.ammeter_ids else None
+        if coordinator.archive is not None and section is not None:
+            break
+    else:
+        raise ServiceValidationError(f"Geen WHES-archief voor {target_id}; zet de optie 'archive' aan.")
+
+    known = EMS_COLUMNS if section == "ems" else AMMETER_COLUMNS
+    # ems_state is VARCHAR en staat niet in het archief
+    columns = [c for c in call.data.get("columns") or known if c in known and c != "ems_state"]
+    start_ms = _to_ms(call.data["start"])
+    end_ms = _to_ms(call.data["end"]) if "end" in call.data else now_ms()
+    if end_ms <= start_ms:
+        raise ServiceValidationError("Einde moet na het begin liggen.")
+    # Nooit fijner dan sample_by en nooit meer dan ARCHIVE_MAX_POINTS punten
+    every_ms = max(call.data.get("every", 0) * 1000, sample_by_ms(coordinator.sample_by),
+                   math.ceil((end_ms - start_ms) / ARCHIVE_MAX_POINTS))
+
+    await coordinator.async_flush_archive()
+    archive = coordinator.archive
+
+    def _query() -> dict:
+        ts, values = archive.read(section, target_id, columns, start_ms, end_ms)
+        return downsample(ts, values, every_ms)
+
+    series = await hass.async_add_executor_job(_query)
+    return {"target_id": target_id, "section": section, "every": every_ms // 1000, "series": series}
+
+
+async def _async_handle_profile(hass: HomeAssistant, call: ServiceCall) -> None:
+    coordinators = _coordinators(hass, call.data.get("entry_id"))
+    if any(c.profiler is not None for c in coordinators):
+        raise ServiceValidationError("Er loopt al een WHES-profiel voor deze entry.")
+    if (call.data["cprofile"] or call.data["tracemalloc"]) and hooks_active():
+        # cProfile en tracemalloc zijn proces-breed; niet twee keer tegelijk
+        raise ServiceValidationError("cProfile/tracemalloc is al in gebruik door een ander WHES-profiel.")
+    for idx, coordinator in enumerate(coordinators):
+        await coordinator.async_start_profile(
+            call.data["cycles"],
+            use_cprofile=call.data["cprofile"] and idx == 0,
+            use_tracemalloc=call.data["tracemalloc"] and idx == 0,
+            to_file=call.data["write_file"],
+        )
+
+
+async def async_setup_services(hass: HomeAssistant) -> None:
+    if hass.services.has_service(DOMAIN, SERVICE_BACKFILL):
+        return
+
+    async def _backfill(call: ServiceCall) -> None:
+        await _async_handle_backfill(hass, call)
+
+    async def _refresh(call: ServiceCall) -> None:
+        await _async_handle_refresh(hass, call)
+
+    hass.services.async_register(DOMAIN, SERVICE_BACKFILL, _backfill, schema=BACKFILL_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_REFRESH, _refresh, schema=REFRESH_SCHEMA)
+
+    async def _query_archive(call: ServiceCall) -> ServiceResponse:
+        return await _async_handle_query_archive(hass, call)
+
+    hass.services.async_register(DOMAIN, SERVICE_QUERY_ARCHIVE, _query_archive, schema=QUERY_ARCHIVE_SCHEMA,
+                                 supports_response=SupportsResponse.ONLY)
+
+    async def _profile(call: ServiceCall) -> None:
+        await _async_handle_profile(hass, call)
+
+    hass.services.async_register(DOMAIN, SERVICE_PROFILE, _profile, schema=PROFILE_SCHEMA)
+
+
+async def async_unload_services(hass: HomeAssistant) -> None:
+    hass.services.async_remove(DOMAIN, SERVICE_BACKFILL)
+    hass.services.async_remove(DOMAIN, SERVICE_REFRESH)
+    hass.services.async_remove(DOMAIN, SERVICE_QUERY_ARCHIVE)
+    hass.services.async_remove(DOMAIN, SERVICE_PROFILE)
+    hass.data.pop(DATA_BACKFILL, None)
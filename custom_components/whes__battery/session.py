@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import SERVER_SOFTWARE
+from homeassistant.util.ssl import get_default_context
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_SESSIONS = f"{DOMAIN}_sessions"
+
+
+class ConnectionStats:
+    """Tellers uit aiohttp TraceConfig: hergebruik van connecties, TLS-handshakes en DNS-cache."""
+
+    __slots__ = ("tls", "requests", "created", "reused", "queued", "dns_hits", "dns_misses")
+
+    def __init__(self, tls: bool) -> None:
+        self.tls = tls
+        self.requests = 0
+        self.created = 0
+        self.reused = 0
+        self.queued = 0
+        self.dns_hits = 0
+        self.dns_misses = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def _request_start(_session, _ctx, _params) -> None:
+            self.requests += 1
+
+        async def _connect_start(_session, ctx, _params) -> None:
+            ctx.connect_t0 = time.perf_counter()
+
+        async def _created(_session, ctx, _params) -> None:
+            self.created += 1
+            # whes.profile geeft een trace_request_ctx mee om de connect-tijd per request te meten
+            request_ctx = ctx.trace_request_ctx
+            if request_ctx is not None and hasattr(request_ctx, "connect_s"):
+                request_ctx.connect_s += time.perf_counter() - ctx.connect_t0
+
+        async def _reused(_session, _ctx, _params) -> None:
+            self.reused += 1
+
+        async def _queued(_session, _ctx, _params) -> None:
+            self.queued += 1
+
+        async def _dns_hit(_session, _ctx, _params) -> None:
+            self.dns_hits += 1
+
+        async def _dns_miss(_session, _ctx, _params) -> None:
+            self.dns_misses += 1
+
+        trace.on_request_start.append(_request_start)
+        trace.on_connection_create_start.append(_connect_start)
+        trace.on_connection_create_end.append(_created)
+        trace.on_connection_reuseconn.append(_reused)
+        trace.on_connection_queued_start.append(_queued)
+        trace.on_dns_cache_hit.append(_dns_hit)
+        trace.on_dns_cache_miss.append(_dns_miss)
+        return trace
+
+    @property
+    def reuse_rate(self) -> Optional[float]:
+        total = self.created + self.reused
+        return self.reused / total if total else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "connections_created": self.created,
+            "connections_reused": self.reused,
+            "reuse_rate": None if self.reuse_rate is None else round(self.reuse_rate, 3),
+            # Elke nieuwe connectie naar een https-host kost één TLS-handshake
+            "tls_handshakes": self.created if self.tls else 0,
+            "queued_for_connection": self.queued,
+            "dns_cache": {"hits": self.dns_hits, "misses": self.dns_misses},
+        }
+
+
+def create_tuned_session(base_url: str) -> tuple[aiohttp.ClientSession, ConnectionStats]:
+    """
+    Losse aiohttp-sessie voor één WHES-host: begrensd aantal connecties, keep-alive langer dan
+    een poll-interval (zodat de volgende poll de connectie hergebruikt), DNS-cache en gzip.
+    """
+    stats = ConnectionStats(base_url.lower().startswith("https"))
+    connector = aiohttp.TCPConnector(
+        limit_per_host=SESSION_LIMIT_PER_HOST,
+        keepalive_timeout=SESSION_KEEPALIVE,
+        ttl_dns_cache=SESSION_DNS_TTL,
+        ssl=get_default_context(),
+    )
+    session = aiohttp.ClientSession(
+        connector=connector,
+        headers={"User-Agent": SERVER_SOFTWARE, "Accept-Encoding": "gzip, deflate"},
+        trace_configs=[stats.trace_config()],
+    )
+    return session, stats
+
+
+class WhesSession:
+    """Gedeelde, getunede sessie per base URL met refcount over de WHES entries."""
+
+    __slots__ = ("session", "stats", "users")
+
+    def __init__(self, base_url: str) -> None:
+        self.session, self.stats = create_tuned_session(base_url)
+        self.users = 0
+
+
+@callback
+def async_acquire_session(hass: HomeAssistant, base_url: str) -> WhesSession:
+    sessions: Dict[str, WhesSession] = hass.data.get(DATA_SESSIONS)
+    if sessions is None:
+        sessions = hass.data[DATA_SESSIONS] = {}
+
+        async def _close_all(_event: Event) -> None:
+            for shared in list(sessions.values()):
+                await shared.session.close()
+            sessions.clear()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, _close_all)
+    key = base_url.rstrip("/")
+    shared = sessions.get(key)
+    if shared is None or shared.session.closed:
+        shared = sessions[key] = WhesSession(key)
+        _LOGGER.debug("WHES: eigen sessie aangemaakt voor %s", key)
+    shared.users += 1
+    return shared
+
+
+@callback
+def async_release_session(hass: HomeAssistant, base_url: str) -> None:
+    sessions: Dict[str, WhesSession] = hass.data.get(DATA_SESSIONS) or {}
+    key = base_url.rstrip("/")
+    shared = sessions.get(key)
+    if shared is None:
+        return
+    shared.users -= 1
+    if shared.users <= 0:
+        del sessions[key]
+        hass.async_create_background_task(shared.session.close(), f"{DOMAIN}_close_session")
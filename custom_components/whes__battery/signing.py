@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import urlparse, parse_qs, quote
+
+# Max. aantal gecachte canonieke paden; ruim genoeg voor een vloot, begrensd bij rare URL's
+_CANONICAL_CACHE_SIZE = 1024
+
+
+def canonical_path_and_query(full_url: str, extra_params: dict | None = None) -> str:
+    """
+    Maakt een canonieke path+query string met alfabetisch geordende keys.
+    Houdt rekening met parse_qs (lijsten) en extra_params.
+    """
+    extra_params = extra_params or {}
+    parsed = urlparse(full_url)
+    path = parsed.path
+
+    qs_from_url = parse_qs(parsed.query)
+    merged = {**qs_from_url, **extra_params} if (qs_from_url and extra_params) else (qs_from_url or extra_params)
+
+    if not merged:
+        return path
+
+    ordered = OrderedDict(sorted(merged.items()))
+    parts = []
+    for k, v in ordered.items():
+        if isinstance(v, list):
+            joined = ",".join(quote(str(x)) for x in v)
+            parts.append(f"{quote(str(k))}={joined}")
+        else:
+            parts.append(f"{quote(str(k))}={quote(str(v))}")
+
+    return f"{path}?" + "&".join(parts)
+
+
+class WhesSigner:
+    """
+    HMAC-SHA1 signer voor de WHES Open API, één keer per client opgebouwd.
+
+    De secret wordt één keer ge-encodeerd in een vooraf gesleutelde HMAC-state die per request
+    met ``.copy()`` wordt hergebruikt, en canonieke paden worden per URL gecachet. De uitvoer is
+    byte-identiek aan de oorspronkelijke ``_signed_headers``.
+    """
+
+    __slots__ = ("_hmac", "_auth_prefix", "_canonical")
+
+    def __init__(self, api_key: str, api_secret: str) -> None:
+        self._hmac = hmac.new(api_secret.encode("utf-8"), digestmod=hashlib.sha1)
+        self._auth_prefix = f"wts {api_key}:"
+        self._canonical: Dict[str, str] = {}
+
+    def canonical(self, full_url: str, params: dict | None = None) -> str:
+        if params:
+            # Query-parameters variëren per call; niet cachen
+            return canonical_path_and_query(full_url, params)
+        path = self._canonical.get(full_url)
+        if path is None:
+            if len(self._canonical) >= _CANONICAL_CACHE_SIZE:
+                self._canonical.clear()
+            path = self._canonical[full_url] = canonical_path_and_query(full_url)
+        return path
+
+    def prime(self, *full_urls: str) -> None:
+        """Berekent de canonieke paden van bekende endpoints alvast."""
+        for url in full_urls:
+            self.canonical(url)
+
+    def sign(
+            self,
+            method: str,
+            full_url: str,
+            params: dict | None = None,
+            *,
+            date_ms: Optional[int] = None,
+            nonce: Optional[int] = None,
+    ) -> Dict[str, str]:
+        date = str(int(time.time() * 1000) if date_ms is None else date_ms)
+        nonce_s = str(random.randint(10_000_000, 99_999_999) if nonce is None else nonce)
+        string_to_sign = (
+            f"{method.upper()}\n"
+            f"x-wts-date:{date}\n"
+            "x-wts-signature-method:HMAC-SHA1\n"
+            f"x-wts-signature-nonce:{nonce_s}\n"
+            "x-wts-signature-version:1.0\n"
+            f"{self.canonical(full_url, params)}"
+        )
+        mac = self._hmac.copy()
+        mac.update(string_to_sign.encode("utf-8"))
+        return {
+            "x-wts-date": date,
+            "x-wts-signature-method": "HMAC-SHA1",
+            "x-wts-signature-nonce": nonce_s,
+            "x-wts-signature-version": "1.0",
+            "Authorization": self._auth_prefix + base64.standard_b64encode(mac.digest()).decode("ascii"),
+        }
@@ -0,0 +1,87 @@
+"""SampleArchive: schrijven en teruglezen over daggrenzen, herstart-overlap, late kolommen en downsample."""
+import math
+from array import array
+
+import pytest
+
+from custom_components.whes__battery.archive import DAY_MS, SampleArchive, downsample
+from custom_components.whes__battery.frame import metrics_to_frame
+
+DAY0 = 19_700 * DAY_MS
+
+
+def _frame(rows, columns=("ts", "ems_active_power")):
+    meta = ["TIMESTAMP"] + ["DOUBLE"] * (len(columns) - 1)
+    return metrics_to_frame({"data": {"columns": list(columns), "metadata": meta, "rows": rows}})
+
+
+def _nan_list(values):
+    return [None if v != v else v for v in values]
+
+
+def test_round_trip_across_days(tmp_path):
+    archive = SampleArchive(str(tmp_path))
+    rows = [[DAY0 + DAY_MS - 20_000, 1.0], [DAY0 + DAY_MS - 10_000, 2.0], [DAY0 + DAY_MS, 3.0], [DAY0 + DAY_MS + 10_000, None]]
+    archive.append("ems", "dev1", _frame(rows))
+    assert archive.flush() == 4
+    assert sorted(p.name for p in (tmp_path / "ems_dev1").iterdir()) == ["2023-12-09", "2023-12-10"]
+
+    ts, cols = archive.read("ems", "dev1", ["ems_active_power"], DAY0, DAY0 + 2 * DAY_MS)
+    assert ts.tolist() == [r[0] for r in rows]
+    assert _nan_list(cols["ems_active_power"]) == [1.0, 2.0, 3.0, None]
+
+    # Halfopen interval [start, end)
+    ts, cols = archive.read("ems", "dev1", ["ems_active_power"], DAY0 + DAY_MS - 10_000, DAY0 + DAY_MS)
+    assert ts.tolist() == [DAY0 + DAY_MS - 10_000]
+    assert cols["ems_active_power"].tolist() == [2.0]
+
+
+def test_watermark_and_restart_overlap(tmp_path):
+    archive = SampleArchive(str(tmp_path))
+    archive.append("ems", "dev1", _frame([[DAY0, 1.0], [DAY0 + 10_000, 2.0]]))
+    # Overlappend window in dezelfde sessie: alleen nieuwe rijen worden gebufferd
+    archive.append("ems", "dev1", _frame([[DAY0 + 10_000, 2.0], [DAY0 + 20_000, 3.0]]))
+    assert archive.flush() == 3
+
+    # Na een herstart is de watermark weg; wat al op disk staat wordt niet opnieuw geschreven
+    restarted = SampleArchive(str(tmp_path))
+    restarted.append("ems", "dev1", _frame([[DAY0 + 20_000, 3.0], [DAY0 + 30_000, 4.0]]))
+    assert restarted.flush() == 1
+    ts, cols = restarted.read("ems", "dev1", ["ems_active_power"], DAY0, DAY0 + DAY_MS)
+    assert ts.tolist() == [DAY0, DAY0 + 10_000, DAY0 + 20_000, DAY0 + 30_000]
+    assert cols["ems_active_power"].tolist() == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_late_column_is_padded_and_invert_applied(tmp_path):
+    archive = SampleArchive(str(tmp_path))
+    archive.append("ems", "dev1", _frame([[DAY0, 1.0], [DAY0 + 10_000, 2.0]]))
+    archive.flush()
+    columns = ("ts", "ems_active_power", "ems_soc")
+    archive.append("ems", "dev1", _frame([[DAY0 + 20_000, 3.0, 50.0]], columns), invert=["ems_active_power"])
+    archive.flush()
+
+    ts, cols = archive.read("ems", "dev1", ["ems_active_power", "ems_soc", "unknown"], DAY0, DAY0 + DAY_MS)
+    assert len(ts) == 3
+    assert cols["ems_active_power"].tolist() == [1.0, 2.0, -3.0]
+    assert _nan_list(cols["ems_soc"]) == [None, None, 50.0]
+    assert all(math.isnan(v) for v in cols["unknown"])
+
+
+def test_read_without_data(tmp_path):
+    ts, cols = SampleArchive(str(tmp_path)).read("ems", "missing", ["ems_soc"], DAY0, DAY0 + DAY_MS)
+    assert len(ts) == 0 and len(cols["ems_soc"]) == 0
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_downsample_buckets(monkeypatch, use_numpy):
+    from custom_components.whes__battery import archive
+
+    if not use_numpy:
+        monkeypatch.setattr(archive, "np", None)
+    elif archive.np is None:
+        pytest.skip("NumPy niet beschikbaar")
+    ts = array("q", [DAY0 + 5_000, DAY0 + 50_000, DAY0 + 65_000, DAY0 + 185_000])
+    values = array("d", [1.0, 3.0, math.nan, 4.0])
+    out = downsample(ts, {"p": values}, 60_000)
+    assert out == {"ts": [DAY0, DAY0 + 60_000, DAY0 + 180_000], "p": [2.0, None, 4.0]}
+    assert downsample(array("q"), {"p": array("d")}, 60_000) == {"ts": [], "p": []}
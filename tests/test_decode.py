@@ -0,0 +1,62 @@
+"""Tail-decode van metrics-responses: gelijk aan volledig parsen en afkappen, ook met lastige VARCHARs."""
+import json
+
+import pytest
+
+from custom_components.whes__battery.decode import decode_payload, decode_tail
+
+TRICKY_STATES = [
+    "normal",
+    "]]",
+    "[[",
+    "a[b]c",
+    'quote " inside',
+    "ends with backslash \\",
+    "double backslash \\\\",
+    '\\"',
+    '\\\\"]]',
+    '"rows": [[1, 2]]',
+    "\\",
+]
+
+
+def _payload(states, *, rows_first=False):
+    rows = [[1_700_000_000_000 + i * 10_000, float(i), state] for i, state in enumerate(states)]
+    data = {"columns": ["ts", "ems_soc", "ems_state"], "metadata": ["TIMESTAMP", "DOUBLE", "VARCHAR"], "rows": rows}
+    if rows_first:
+        data = {"rows": rows, "columns": data["columns"], "metadata": data["metadata"]}
+    body = {"code": 0, "msg": 'ok "rows" \\', "data": data}
+    return body, json.dumps(body).encode()
+
+
+@pytest.mark.parametrize("tail_rows", [1, 2, 3, len(TRICKY_STATES)])
+@pytest.mark.parametrize("rows_first", [False, True])
+def test_decode_tail_matches_full_parse(tail_rows, rows_first):
+    body, raw = _payload(TRICKY_STATES, rows_first=rows_first)
+    decoded = decode_tail(raw, tail_rows)
+    assert decoded is not None
+    assert decoded["data"]["rows"] == body["data"]["rows"][-tail_rows:]
+    assert decoded["data"]["columns"] == body["data"]["columns"]
+    assert decoded["msg"] == body["msg"]
+
+
+@pytest.mark.parametrize("state", TRICKY_STATES)
+def test_decode_tail_single_tricky_value_last(state):
+    body, raw = _payload(["normal", "x", state])
+    for tail_rows in (1, 2):
+        decoded = decode_tail(raw, tail_rows)
+        assert decoded is not None
+        assert decoded["data"]["rows"] == body["data"]["rows"][-tail_rows:]
+
+
+def test_decode_tail_more_rows_than_present():
+    _body, raw = _payload(["a", "b"])
+    assert decode_tail(raw, 5) is None
+
+
+def test_decode_payload_falls_back_to_full_parse():
+    body = {"code": 0, "data": {"columns": ["ts"], "rows": [[1], [2], [3]]}}
+    raw = json.dumps(body, indent=2).encode().replace(b'"rows"', b'"rows" ')
+    assert decode_payload(raw, 2)["data"]["rows"] == [[2], [3]]
+    _body, raw = _payload(["a", "b"])
+    assert decode_payload(raw, 5)["data"]["rows"] == _body["data"]["rows"]
@@ -0,0 +1,71 @@
+"""RingBuffer: samples buiten volgorde, dubbele timestamps en een volle buffer tegen een referentiemodel."""
+import random
+
+import pytest
+
+from custom_components.whes__battery.history import RingBuffer
+
+
+def _reference(samples, capacity):
+    """Laatste waarde per timestamp, gesorteerd; een volle buffer houdt de nieuwste ``capacity``."""
+    kept = {}
+    for ts, value in samples:
+        if ts in kept:
+            kept[ts] = value
+        elif len(kept) < capacity:
+            kept[ts] = value
+        elif ts > min(kept):
+            del kept[min(kept)]
+            kept[ts] = value
+    return sorted(kept.items())
+
+
+def _contents(buf):
+    ts, val = buf.ordered()
+    return list(zip(ts.tolist(), val.tolist()))
+
+
+def test_out_of_order_insert_keeps_order():
+    buf = RingBuffer(8)
+    for ts in (10, 20, 40, 50):
+        buf.append(ts, float(ts))
+    buf.append(30, 3.0)
+    buf.append(5, 0.5)
+    assert _contents(buf) == [(5, 0.5), (10, 10.0), (20, 20.0), (30, 3.0), (40, 40.0), (50, 50.0)]
+    assert buf.last_ts == 50 and buf.last_value == 50.0
+
+
+def test_equal_timestamp_overwrites():
+    buf = RingBuffer(4)
+    for ts in (10, 20, 30):
+        buf.append(ts, 1.0)
+    buf.append(30, 3.0)
+    buf.append(20, 2.0)
+    assert _contents(buf) == [(10, 1.0), (20, 2.0), (30, 3.0)]
+
+
+def test_full_buffer_drops_the_oldest():
+    buf = RingBuffer(3)
+    for ts in (10, 20, 30, 40):
+        buf.append(ts, float(ts))
+    buf.append(25, 2.5)
+    assert _contents(buf) == [(25, 2.5), (30, 30.0), (40, 40.0)]
+    buf.append(5, 0.5)  # ouder dan alles in een volle buffer
+    assert _contents(buf) == [(25, 2.5), (30, 30.0), (40, 40.0)]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_inserts_match_reference(seed):
+    rnd = random.Random(seed)
+    capacity = rnd.randint(1, 12)
+    samples = []
+    t = 0
+    for _ in range(60):
+        t += rnd.randint(1, 5)
+        # Af en toe een sample uit het verleden, zoals een volledige poll na de fast lane
+        ts = t - rnd.randint(0, 20) if rnd.random() < 0.3 else t
+        samples.append((ts, float(rnd.randint(0, 100))))
+    buf = RingBuffer(capacity)
+    for ts, value in samples:
+        buf.append(ts, value)
+    assert _contents(buf) == _reference(samples, capacity)
@@ -0,0 +1,78 @@
+"""Token bucket: burst, prioriteitsvolgorde, 429-pauze en annuleren van wachtenden."""
+import asyncio
+
+from custom_components.whes__battery.const import PRIORITY_BACKFILL, PRIORITY_LIVE, PRIORITY_VALIDATE
+from custom_components.whes__battery.ratelimit import TokenBucket, get_limiter
+
+
+def test_burst_is_granted_immediately():
+    async def run():
+        bucket = TokenBucket(rate=10, burst=3)
+        waits = [await bucket.acquire() for _ in range(3)]
+        fourth = await bucket.acquire()
+        return waits, fourth, bucket
+
+    waits, fourth, bucket = asyncio.run(run())
+    assert waits == [0.0, 0.0, 0.0]
+    assert fourth > 0.05
+    stats = bucket.as_dict()["classes"]["live"]
+    assert stats["requests"] == 4 and stats["waited"] == 1
+
+
+def test_waiters_are_served_by_priority():
+    async def run():
+        bucket = TokenBucket(rate=50, burst=1)
+        await bucket.acquire()
+        order = []
+
+        async def take(name, priority):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        tasks = [
+            asyncio.create_task(take("backfill", PRIORITY_BACKFILL)),
+            asyncio.create_task(take("validate", PRIORITY_VALIDATE)),
+            asyncio.create_task(take("live-1", PRIORITY_LIVE)),
+            asyncio.create_task(take("live-2", PRIORITY_LIVE)),
+        ]
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["live-1", "live-2", "validate", "backfill"]
+
+
+def test_penalize_blocks_until_retry_after():
+    async def run():
+        bucket = TokenBucket(rate=20, burst=5)
+        bucket.penalize(0.1)
+        state = bucket.as_dict()
+        wait = await bucket.acquire()
+        return state, wait, bucket.as_dict()["tokens"]
+
+    state, wait, tokens_after = asyncio.run(run())
+    assert state["tokens"] == 0 and state["throttled_429"] == 1
+    assert wait >= 0.09
+    # Geen opgespaarde burst na de pauze
+    assert tokens_after < 1
+
+
+def test_cancelled_waiter_does_not_block_the_queue():
+    async def run():
+        bucket = TokenBucket(rate=20, burst=1)
+        await bucket.acquire()
+        first = asyncio.create_task(bucket.acquire())
+        second = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0)
+        first.cancel()
+        wait = await asyncio.wait_for(second, 1)
+        return wait, bucket.as_dict()["queued"]
+
+    wait, queued = asyncio.run(run())
+    assert 0 < wait < 0.5
+    assert queued == 0
+
+
+def test_limiter_is_shared_per_key_and_base_url():
+    a = get_limiter("key-a", "https://example.invalid/")
+    assert get_limiter("key-a", "https://example.invalid") is a
+    assert get_limiter("key-b", "https://example.invalid") is not a
@@ -0,0 +1,95 @@
+"""Circuit breaker toestanden en de veilige foutomschrijving voor logs."""
+import pytest
+
+from custom_components.whes__battery import resilience
+from custom_components.whes__battery.resilience import CircuitBreaker, WhesCircuitOpenError, describe_error
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_request()
+        breaker.record_failure()
+
+
+def test_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(WhesCircuitOpenError):
+        breaker.before_request()
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.as_dict() == {"state": CircuitBreaker.CLOSED, "failures": 1}
+
+
+def test_half_open_allows_a_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 29
+    with pytest.raises(WhesCircuitOpenError):
+        breaker.before_request()
+    clock[0] += 1
+    breaker.before_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(WhesCircuitOpenError):
+        breaker.before_request()
+    breaker.record_success()
+    assert breaker.as_dict() == {"state": CircuitBreaker.CLOSED, "failures": 0}
+    breaker.before_request()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 30
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock[0] += 29
+    with pytest.raises(WhesCircuitOpenError):
+        breaker.before_request()
+
+
+def test_ignored_error_frees_the_probe_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 30
+    breaker.before_request()
+    breaker.record_ignored()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_request()
+
+
+class _StatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"status {status}, headers {{'Authorization': 'secret'}}")
+        self.status = status
+
+
+@pytest.mark.parametrize(
+    "err, expected",
+    [
+        (_StatusError(503), "_StatusError 503"),
+        (TimeoutError("Authorization: secret"), "TimeoutError"),
+    ],
+)
+def test_describe_error_hides_the_message(err, expected):
+    assert describe_error(err) == expected